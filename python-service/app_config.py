@@ -10,6 +10,11 @@ load_dotenv()
 # Server Configuration
 PORT = int(os.getenv("PORT", 5000))
 HOST = os.getenv("HOST", "0.0.0.0")
+RELOAD = os.getenv("RELOAD", "false").lower() == "true"  # `python main.py` auto-reload (development only)
+
+# Multi-worker production server (gunicorn.conf.py sets these per worker)
+CV_THREADS = int(os.getenv("CV_THREADS", 0))  # OpenCV threads per process (0 = OpenCV default)
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR", "")  # Set = aggregate /metrics over workers
 
 # CORS Configuration
 ALLOWED_ORIGINS = os.getenv(
@@ -20,6 +25,92 @@ ALLOWED_ORIGINS = os.getenv(
 # UIED Configuration
 UIED_MIN_CONFIDENCE = float(os.getenv("UIED_MIN_CONFIDENCE", 0.7))
 UIED_OUTPUT_DIR = os.getenv("UIED_OUTPUT_DIR", "./output")
+UIED_WORKING_HEIGHT = int(os.getenv("UIED_WORKING_HEIGHT", 0))  # Downsample to this height before detection (0 = full resolution)
+UIED_IN_MEMORY = os.getenv("UIED_IN_MEMORY", "true").lower() == "true"  # false = legacy file-based pipeline
+
+# UIED execution mode: "process" (worker pool) or "thread" (in-process thread)
+UIED_EXECUTION_MODE = os.getenv("UIED_EXECUTION_MODE", "process").lower()
+UIED_POOL_WORKERS = int(os.getenv("UIED_POOL_WORKERS", os.cpu_count() or 1))
+UIED_POOL_MAX_TASKS = int(os.getenv("UIED_POOL_MAX_TASKS", 50))  # Recycle workers to free leaked OpenCV memory
+UIED_POOL_START_METHOD = os.getenv("UIED_POOL_START_METHOD", "spawn")
+UIED_TASK_TIMEOUT = float(os.getenv("UIED_TASK_TIMEOUT", 120))  # Seconds a detection may run on its worker before that worker is killed (0 = no limit)
+
+# Startup warm-up: load UIED/OpenCV and the LLM client and run one tiny detection
+# before /health/ready reports ready (false = warm lazily on the first request)
+STARTUP_WARMUP = os.getenv("STARTUP_WARMUP", "true").lower() == "true"
+
+# Image ingestion (shared pooled HTTP client)
+IMAGE_FETCH_MAX_BYTES = int(os.getenv("IMAGE_FETCH_MAX_BYTES", 20 * 1024 * 1024))
+IMAGE_FETCH_TIMEOUT = float(os.getenv("IMAGE_FETCH_TIMEOUT", 30))
+IMAGE_FETCH_MAX_CONNECTIONS = int(os.getenv("IMAGE_FETCH_MAX_CONNECTIONS", 20))
+IMAGE_VALIDATOR_CACHE_MB = int(os.getenv("IMAGE_VALIDATOR_CACHE_MB", 64))  # Bodies kept for ETag/Last-Modified revalidation
+
+# Batch detection (/detect/batch)
+DETECT_BATCH_CONCURRENCY = int(os.getenv("DETECT_BATCH_CONCURRENCY", 4))
+DETECT_BATCH_MAX_URLS = int(os.getenv("DETECT_BATCH_MAX_URLS", 100))
+
+# Detection result cache (content-addressed: SHA-256 of image bytes + params)
+DETECTION_CACHE_ENABLED = os.getenv("DETECTION_CACHE_ENABLED", "true").lower() == "true"
+DETECTION_CACHE_MAX_ENTRIES = int(os.getenv("DETECTION_CACHE_MAX_ENTRIES", 256))
+DETECTION_CACHE_DIR = os.getenv("DETECTION_CACHE_DIR", "/tmp/uied_cache")
+DETECTION_CACHE_DISK_MB = int(os.getenv("DETECTION_CACHE_DISK_MB", 256))
+
+# Layout generation: concurrent per-block GPT calls
+LAYOUT_BLOCK_CONCURRENCY = int(os.getenv("LAYOUT_BLOCK_CONCURRENCY", 8))
+LAYOUT_BLOCK_TIMEOUT = float(os.getenv("LAYOUT_BLOCK_TIMEOUT", 60))  # Seconds per block
+LAYOUT_MAX_BLOCK_CALLS = int(os.getenv("LAYOUT_MAX_BLOCK_CALLS", 8))  # Parsed components are grouped into at most this many regions (0 = no limit)
+LAYOUT_BAND_GAP = float(os.getenv("LAYOUT_BAND_GAP", 0.01))  # Largest vertical gap inside one region, as a share of page height
+
+# Layout generation jobs (/jobs/generate-layout): SQLite queue shared by all server workers
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", "/tmp/layout_jobs.sqlite3")  # Put on a persistent disk to keep jobs across deploys
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 2))  # Concurrent jobs per server process (0 = don't run jobs here)
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", 60))  # A job whose worker stops renewing this is retried
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 3))
+JOB_TTL_HOURS = float(os.getenv("JOB_TTL_HOURS", 24))  # Finished jobs are purged after this
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", 0.5))  # Seconds between queue and event polls
+
+# Persistent cache for deterministic GPT vision responses
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "/tmp/llm_cache.sqlite3")
+LLM_CACHE_TTL_HOURS = float(os.getenv("LLM_CACHE_TTL_HOURS", 24 * 7))
+LLM_CACHE_MAX_MB = int(os.getenv("LLM_CACHE_MAX_MB", 128))
+
+# LLM call scheduler: every OpenAI call in a server process goes through it
+# (limits are per process and per model; divide the account limits by WEB_CONCURRENCY)
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 16))  # Calls in flight
+LLM_REQUESTS_PER_MINUTE = float(os.getenv("LLM_REQUESTS_PER_MINUTE", 500))  # 0 = unlimited
+LLM_TOKENS_PER_MINUTE = float(os.getenv("LLM_TOKENS_PER_MINUTE", 150000))  # Estimated prompt + max_tokens; 0 = unlimited
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 4))  # For 429, 5xx, timeouts and connection errors
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", 0.5))  # Seconds; doubled per attempt, full jitter
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", 30))
+
+# Vision payload encoding (images sent to OpenAI)
+VISION_IMAGE_FORMAT = os.getenv("VISION_IMAGE_FORMAT", "auto").lower()  # auto, jpeg, png or webp
+VISION_JPEG_QUALITY = int(os.getenv("VISION_JPEG_QUALITY", 85))
+VISION_MAX_LONG_SIDE = int(os.getenv("VISION_MAX_LONG_SIDE", 2048))  # OpenAI high-detail limits
+VISION_MAX_SHORT_SIDE = int(os.getenv("VISION_MAX_SHORT_SIDE", 768))
+VISION_LOW_DETAIL_MAX = int(os.getenv("VISION_LOW_DETAIL_MAX", 512))  # Block crops this small use detail=low
+
+# Box post-processing (filtering, non-max suppression, containment merging)
+BOX_POSTPROCESS_ENABLED = os.getenv("BOX_POSTPROCESS_ENABLED", "true").lower() == "true"
+BOX_MIN_SIDE_PX = float(os.getenv("BOX_MIN_SIDE_PX", 4))
+BOX_MAX_AREA_RATIO = float(os.getenv("BOX_MAX_AREA_RATIO", 0.95))  # Drop full-screen background boxes
+BOX_MAX_ASPECT = float(os.getenv("BOX_MAX_ASPECT", 0))  # Drop dividers and rules (0 = off)
+BOX_NMS_IOU = float(os.getenv("BOX_NMS_IOU", 0.7))
+BOX_CONTAINMENT = float(os.getenv("BOX_CONTAINMENT", 0.9))  # Share of a box that must lie inside another to merge
+BOX_MERGE_AREA_RATIO = float(os.getenv("BOX_MERGE_AREA_RATIO", 0.5))  # Only merge into containers at most 2x larger
+
+# Per-image spatial indexes for hit testing (/elements/{imageHash}/...)
+ELEMENT_INDEX_MAX_IMAGES = int(os.getenv("ELEMENT_INDEX_MAX_IMAGES", 1024))
+
+# Fused UIED + LLM detection (/detect/fused)
+FUSION_MATCH_IOU = float(os.getenv("FUSION_MATCH_IOU", 0.3))  # Minimum IoU to pair a UIED box with a GPT box
+
+# On-demand request profiling (X-Profile: 1 + X-Admin-Token); disabled while the token is empty
+PROFILING_ADMIN_TOKEN = os.getenv("PROFILING_ADMIN_TOKEN", "")
+PROFILE_DIR = os.getenv("PROFILE_DIR", "/tmp/uied_profiles")
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", 50))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", 5))  # Stack sampling interval
 
 # OCR Configuration
 ENABLE_OCR = os.getenv("ENABLE_OCR", "true").lower() == "true"
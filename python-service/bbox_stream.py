@@ -0,0 +1,138 @@
+"""
+Incremental <bbox> Parser
+Turns GPT output into labelled boxes as tokens arrive, so components can be
+streamed to the client before the model has finished generating
+"""
+
+import re
+from typing import List, Optional, Sequence, Tuple
+
+BBox = Tuple[int, int, int, int]
+
+BULLET_LABELS = ['-', '•', '*', '']
+
+
+def parse_bbox_line(
+    line: str,
+    previous_lines: Sequence[str],
+    width: int,
+    height: int
+) -> Optional[Tuple[str, BBox]]:
+    """
+    Parse one `label <bbox>x1 y1 x2 y2</bbox>` line
+
+    Args:
+        line: The line containing the bbox
+        previous_lines: Up to two preceding lines (oldest first), used as the
+            label when GPT puts the name on its own line above a bullet
+        width, height: Image bounds the box is clamped to
+
+    Returns:
+        (label, (x1, y1, x2, y2)) or None if the line holds no usable box
+    """
+    line_original = line.strip()
+    line_lower = line_original.lower()
+
+    if not line_lower or '<bbox>' not in line_lower:
+        return None
+
+    # Extract the label (text before <bbox>)
+    bbox_start_idx = line_lower.find('<bbox>')
+    label = line_lower[:bbox_start_idx].strip()
+
+    # If label is just a dash/bullet (GPT used numbered list format),
+    # look at the previous non-empty line for the actual label
+    if label in BULLET_LABELS:
+        for prev_line in reversed(previous_lines):
+            prev_line = prev_line.strip()
+            if prev_line:
+                # Remove numbering, asterisks, and markdown formatting
+                clean_label = re.sub(r'^\d+\.\s*', '', prev_line)  # Remove "1. "
+                clean_label = re.sub(r'^\*+\s*', '', clean_label)  # Remove "** "
+                clean_label = re.sub(r'\*+$', '', clean_label)  # Remove trailing "**"
+                clean_label = clean_label.strip('*').strip()
+                if clean_label:
+                    label = clean_label
+                    break
+
+    # Skip if still no valid label
+    if not label or label in ['-', '•', '*']:
+        return None
+
+    # Extract bbox coordinates
+    try:
+        start_idx = line_lower.find('<bbox>') + 6
+        end_idx = line_lower.find('</bbox>')
+        coords_str = line_lower[start_idx:end_idx].strip()
+
+        coords = list(map(int, coords_str.split()))
+        if len(coords) != 4:
+            return None
+        x_min, y_min, x_max, y_max = coords
+
+        # Clamp to image bounds
+        x_min = max(0, min(x_min, width))
+        y_min = max(0, min(y_min, height))
+        x_max = max(0, min(x_max, width))
+        y_max = max(0, min(y_max, height))
+
+        if x_max > x_min and y_max > y_min:
+            return label, (x_min, y_min, x_max, y_max)
+    except (ValueError, IndexError) as e:
+        print(f"⚠️  Could not parse line '{line_original}': {e}")
+    return None
+
+
+class BBoxStreamParser:
+    """
+    Feed response text in arbitrary chunks; get boxes back as soon as each
+    `</bbox>` arrives (without waiting for the end of the line)
+    """
+
+    def __init__(self, width: int, height: int):
+        self.width = width
+        self.height = height
+        self._buffer = ""
+        self._history: List[str] = []  # Last two complete lines
+        self._current_done = False  # Current line's box was already emitted
+
+    def feed(self, text: str) -> List[Tuple[str, BBox]]:
+        """Consume a chunk of model output and return any boxes it completed"""
+        self._buffer += text
+        found = []
+
+        while '\n' in self._buffer:
+            line, self._buffer = self._buffer.split('\n', 1)
+            self._finish_line(line, found)
+
+        # Emit a box early once its closing tag is in, before the newline
+        if not self._current_done and '</bbox>' in self._buffer.lower():
+            self._emit(self._buffer, found)
+            self._current_done = True
+
+        return found
+
+    def close(self) -> List[Tuple[str, BBox]]:
+        """Flush the final (unterminated) line"""
+        found = []
+        if self._buffer:
+            self._finish_line(self._buffer, found)
+            self._buffer = ""
+        return found
+
+    def _finish_line(self, line: str, found: List[Tuple[str, BBox]]):
+        if not self._current_done:
+            self._emit(line, found)
+        self._current_done = False
+        self._history = (self._history + [line])[-2:]
+
+    def _emit(self, line: str, found: List[Tuple[str, BBox]]):
+        parsed = parse_bbox_line(line, self._history, self.width, self.height)
+        if parsed is not None:
+            found.append(parsed)
+
+
+def parse_bbox_text(text: str, width: int, height: int) -> List[Tuple[str, BBox]]:
+    """Parse a complete response (same results as streaming it through BBoxStreamParser)"""
+    parser = BBoxStreamParser(width, height)
+    return parser.feed(text.strip()) + parser.close()
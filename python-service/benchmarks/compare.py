@@ -0,0 +1,69 @@
+"""
+Compare two benchmark result files
+
+Matches results by (stage, case) and reports the change in median latency.
+Works with any benchmark output shaped like benchmarks.hot_paths --json.
+
+Usage (from python-service/):
+    python -m benchmarks.compare before.json after.json
+    python -m benchmarks.compare before.json after.json --threshold 0.15 --fail-on-regression
+"""
+
+import argparse
+import json
+import statistics
+import sys
+from pathlib import Path
+from typing import Dict, Tuple
+
+
+def load(path: str) -> Tuple[dict, Dict[Tuple[str, str], dict]]:
+    data = json.loads(Path(path).read_text())
+    return data.get("meta", {}), {(row["stage"], row["case"]): row for row in data["results"]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="Relative change counted as a regression/improvement (0.10 = 10%%)")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Exit with status 1 on any regression")
+    args = parser.parse_args()
+
+    base_meta, baseline = load(args.baseline)
+    cand_meta, candidate = load(args.candidate)
+    print(f"baseline:  {base_meta.get('commit')} {base_meta.get('timestamp', '')}")
+    print(f"candidate: {cand_meta.get('commit')} {cand_meta.get('timestamp', '')}\n")
+
+    print(f"{'stage':<20} {'case':<28} {'before ms':>10} {'after ms':>10} {'change':>8}")
+    regressions, ratios = 0, []
+    for key in sorted(baseline.keys() & candidate.keys()):
+        before, after = baseline[key]["medianMs"], candidate[key]["medianMs"]
+        ratio = after / before if before > 0 else 1.0
+        ratios.append(ratio)
+        mark = ""
+        if ratio > 1 + args.threshold:
+            mark = "  ⚠️ slower"
+            regressions += 1
+        elif ratio < 1 - args.threshold:
+            mark = "  ✅ faster"
+        print(f"{key[0]:<20} {key[1]:<28} {before:>10.3f} {after:>10.3f} {ratio - 1:>+8.1%}{mark}")
+
+    for label, keys in (("only in baseline", baseline.keys() - candidate.keys()),
+                        ("only in candidate", candidate.keys() - baseline.keys())):
+        if keys:
+            names = [f"{stage}/{case}" for stage, case in sorted(keys)]
+            more = f" (+{len(names) - 5} more)" if len(names) > 5 else ""
+            print(f"\n{len(keys)} results {label}: " + ", ".join(names[:5]) + more)
+
+    if ratios:
+        print(f"\nGeometric mean change: {statistics.geometric_mean(ratios) - 1:+.1%} "
+              f"({regressions} regressions over {args.threshold:.0%})")
+
+    if args.fail_on_regression and regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
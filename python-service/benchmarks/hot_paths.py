@@ -0,0 +1,242 @@
+"""
+Microbenchmarks for the detection and parsing hot paths
+
+Times each stage on synthetic screenshots (several sizes and densities) and
+synthetic GPT responses, then writes machine-readable results that
+benchmarks.compare can diff between runs. Needs no network and no API key;
+UIED stages are skipped when UIED is not installed.
+
+Usage (from python-service/):
+    python -m benchmarks.hot_paths --json before.json
+    python -m benchmarks.hot_paths --stages parse_bbox_response,combine_blocks --json after.json
+    python -m benchmarks.compare before.json after.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.synthetic import generate_llm_response, generate_screenshot
+
+STAGES = [
+    "decode",
+    "compo_detection",
+    "map_element_type",
+    "build_elements",
+    "encode_for_vision",
+    "parse_bbox_response",
+    "build_fast_result",
+    "combine_blocks",
+]
+
+# Text that accompanies UIED compos when OCR labels are present
+SAMPLE_TEXTS = ["", "", "Sign in", "Continue", "Search", "Home", "Settings", "Learn more"]
+
+
+def measure(fn: Callable[[], object], repeat: int, min_batch_s: float = 0.005) -> Dict[str, float]:
+    """
+    Time fn like timeit: calls are batched until a batch takes min_batch_s,
+    then `repeat` batches are timed. Reported numbers are per call, in ms.
+    """
+    fn()  # Warm-up (imports, caches, lazy init)
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        if time.perf_counter() - start >= min_batch_s or number >= 1 << 16:
+            break
+        number *= 4
+
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        runs.append((time.perf_counter() - start) * 1000 / number)
+
+    return {
+        "medianMs": round(statistics.median(runs), 4),
+        "minMs": round(min(runs), 4),
+        "meanMs": round(statistics.mean(runs), 4),
+        "stdevMs": round(statistics.stdev(runs), 4) if len(runs) > 1 else 0.0,
+        "runs": repeat,
+        "number": number,
+    }
+
+
+def _quiet(fn: Callable[[], object]) -> Callable[[], object]:
+    """Silence the service's progress prints so they don't dominate the timings"""
+    def wrapped():
+        with contextlib.redirect_stdout(io.StringIO()):
+            return fn()
+    return wrapped
+
+
+def _detector():
+    """A UIEDDetector; without UIED, a bare instance (the benchmarked helpers don't use it)"""
+    from uied_detector import UIEDDetector, UIED_IMPORTED, get_detector
+    if UIED_IMPORTED:
+        with contextlib.redirect_stdout(io.StringIO()):
+            return get_detector(), True
+    return object.__new__(UIEDDetector), False
+
+
+def _generator():
+    """A ScreenCoderGenerator without API clients (parsing and assembly never call the model)"""
+    from screencoder_wrapper import ScreenCoderGenerator
+    generator = object.__new__(ScreenCoderGenerator)
+    generator.fast_model = "gpt-4o-mini"
+    return generator
+
+
+def _compos(boxes) -> List[dict]:
+    """Ground-truth boxes in UIED's compo layout"""
+    return [
+        {
+            'id': index,
+            'class': kind,
+            'column_min': x1, 'row_min': y1, 'column_max': x2, 'row_max': y2,
+            'width': x2 - x1, 'height': y2 - y1,
+            'text_content': SAMPLE_TEXTS[index % len(SAMPLE_TEXTS)],
+        }
+        for index, (x1, y1, x2, y2, kind) in enumerate(boxes)
+    ]
+
+
+def _blocks(rows: int) -> Dict[str, str]:
+    """Block HTML as generate_layout produces it, `rows` elements per block"""
+    row = '<div class="flex items-center gap-2 p-4"><span class="text-sm text-gray-700">Item</span></div>'
+    return {name: f"<div>{row * rows}</div>" for name in ["header", "navigation", "sidebar", "main content"]}
+
+
+def run(args) -> List[dict]:
+    from image_encoding import encode_bytes_for_vision
+
+    detector, uied_available = _detector()
+    generator = _generator()
+    stages = args.stages.split(",") if args.stages else STAGES
+    sizes = [tuple(int(v) for v in size.split("x")) for size in args.sizes.split(",")]
+    densities = [int(d) for d in args.densities.split(",")]
+
+    results = []
+
+    def record(stage: str, case: str, fn: Callable[[], object], **params):
+        timing = measure(fn, args.repeat)
+        results.append({"stage": stage, "case": case, **params, **timing})
+        print(f"{stage:<20} {case:<28} {timing['medianMs']:>10.3f} ms")
+
+    if "compo_detection" in stages and not uied_available:
+        print("ℹ️  UIED not installed: skipping compo_detection")
+
+    for width, height in sizes:
+        for density in densities:
+            case = f"{width}x{height}/d{density}"
+            params = {"width": width, "height": height, "density": density}
+            data, boxes = generate_screenshot(width, height, density, args.seed, args.format)
+            compos = _compos(boxes)
+            params["components"] = len(boxes)
+
+            if "decode" in stages:
+                record("decode", case, lambda: detector.decode_image_scaled(data, None), **params)
+            if "compo_detection" in stages and uied_available:
+                image, size = detector.decode_image_scaled(data, None)
+                record("compo_detection", case, _quiet(lambda: detector.detect_compos(image, size)), **params)
+            if "map_element_type" in stages:
+                pairs = [(c['class'], c['text_content']) for c in compos]
+                record(
+                    "map_element_type", case,
+                    lambda: [detector._map_element_type(kind, text) for kind, text in pairs],
+                    **params
+                )
+            if "build_elements" in stages:
+                record("build_elements", case, lambda: detector._build_elements(compos, width, height), **params)
+
+            encoded = encode_bytes_for_vision(data, "detection")
+            if "encode_for_vision" in stages:
+                record("encode_for_vision", case, lambda: encode_bytes_for_vision(data, "detection"), **params)
+
+            # GPT answers in the pixels of the image it was sent
+            scale_x, scale_y = encoded.width / width, encoded.height / height
+            sent_boxes = [
+                (int(x1 * scale_x), int(y1 * scale_y), int(x2 * scale_x), int(y2 * scale_y), kind)
+                for x1, y1, x2, y2, kind in boxes
+            ]
+            for style in args.styles.split(","):
+                text = generate_llm_response(sent_boxes, args.seed, style)
+                style_params = {**params, "style": style, "responseChars": len(text)}
+                if "parse_bbox_response" in stages:
+                    record(
+                        "parse_bbox_response", f"{case}/{style}",
+                        _quiet(lambda: generator._parse_bbox_response(text, encoded.width, encoded.height)),
+                        **style_params
+                    )
+                if "build_fast_result" in stages:
+                    record(
+                        "build_fast_result", f"{case}/{style}",
+                        _quiet(lambda: generator._build_fast_result(text, encoded)),
+                        **style_params
+                    )
+
+    if "combine_blocks" in stages:
+        width, height = sizes[0]
+        for rows in (10, 100, 1000):
+            blocks = _blocks(rows)
+            record(
+                "combine_blocks", f"4 blocks/{rows} rows",
+                lambda: generator._combine_blocks(blocks, width, height),
+                rows=rows, htmlChars=sum(len(html) for html in blocks.values())
+            )
+
+    return results
+
+
+def metadata(args) -> dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True, cwd=Path(__file__).parent
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "args": vars(args),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="390x844,1290x2796,1920x1080", help="Comma-separated WIDTHxHEIGHT")
+    parser.add_argument("--densities", default="10,40,120", help="Components per synthetic screen")
+    parser.add_argument("--styles", default="plain,markdown,noisy", help="Synthetic GPT response styles")
+    parser.add_argument("--stages", help=f"Comma-separated subset of: {','.join(STAGES)}")
+    parser.add_argument("--format", default="PNG", choices=["PNG", "JPEG", "WEBP"])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=7, help="Timed batches per stage (median is reported)")
+    parser.add_argument("--json", help="Write results to this file")
+    args = parser.parse_args()
+
+    results = run(args)
+    if args.json:
+        Path(args.json).write_text(json.dumps({"meta": metadata(args), "results": results}, indent=2))
+        print(f"\n💾 Wrote {len(results)} results to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
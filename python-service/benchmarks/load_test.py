@@ -0,0 +1,148 @@
+"""
+Concurrent load generator for the FastAPI service
+
+Drives one endpoint at several concurrency levels and reports throughput,
+p50/p95/p99 latency, time to first byte (useful for the /stream endpoints)
+and errors per status code. Pair it with benchmarks.mock_openai to load-test
+the GPT paths without spending API credits.
+
+Usage (from python-service/):
+    python -m benchmarks.mock_openai --latency-ms 800 &
+    OPENAI_BASE_URL=http://localhost:8900/v1 OPENAI_API_KEY=mock uvicorn main:app --port 5000 &
+    python -m benchmarks.load_test --endpoint /detect-components --concurrency 1,4,16 --requests 64
+    python -m benchmarks.load_test --endpoint /generate-layout --duration 30 --json layout.json
+
+Results are written in the same shape as benchmarks.hot_paths, so two runs can
+be diffed with benchmarks.compare.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import statistics
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.hot_paths import metadata
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+async def one_request(client: httpx.AsyncClient, args, index: int) -> Dict[str, object]:
+    body = {"imageUrl": args.image_url.format(i=index % args.images), "bypassCache": not args.cache}
+    start = time.perf_counter()
+    first_byte: Optional[float] = None
+    try:
+        async with client.stream("POST", args.endpoint, json=body) as response:
+            async for _ in response.aiter_bytes():
+                if first_byte is None:
+                    first_byte = time.perf_counter() - start
+            status = response.status_code
+    except httpx.HTTPError as e:
+        status = type(e).__name__
+    elapsed = time.perf_counter() - start
+    return {
+        "status": status,
+        "latencyMs": elapsed * 1000,
+        "ttfbMs": (first_byte if first_byte is not None else elapsed) * 1000,
+    }
+
+
+async def run_level(args, concurrency: int) -> Dict[str, object]:
+    """Keep `concurrency` requests in flight until the request or time budget is used up"""
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    samples: List[Dict[str, object]] = []
+    next_index = 0
+    deadline = time.perf_counter() + args.duration if args.duration else None
+
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=limits) as client:
+        async def worker():
+            nonlocal next_index
+            while True:
+                if deadline is not None:
+                    if time.perf_counter() >= deadline:
+                        return
+                elif next_index >= args.requests:
+                    return
+                index = next_index
+                next_index += 1
+                samples.append(await one_request(client, args, index))
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        wall = time.perf_counter() - start
+
+    ok = [s for s in samples if s["status"] == 200]
+    latencies = [s["latencyMs"] for s in ok]
+    ttfb = [s["ttfbMs"] for s in ok]
+    return {
+        "stage": args.endpoint,
+        "case": f"c{concurrency}",
+        "concurrency": concurrency,
+        "requests": len(samples),
+        "errors": len(samples) - len(ok),
+        "statuses": {str(k): v for k, v in Counter(s["status"] for s in samples).items()},
+        "throughputRps": round(len(ok) / wall, 3) if wall > 0 else 0.0,
+        "wallSeconds": round(wall, 3),
+        "medianMs": round(percentile(latencies, 50), 1),
+        "p95Ms": round(percentile(latencies, 95), 1),
+        "p99Ms": round(percentile(latencies, 99), 1),
+        "meanMs": round(statistics.mean(latencies), 1) if latencies else 0.0,
+        "maxMs": round(max(latencies), 1) if latencies else 0.0,
+        "ttfbP50Ms": round(percentile(ttfb, 50), 1),
+        "ttfbP95Ms": round(percentile(ttfb, 95), 1),
+    }
+
+
+async def run(args) -> List[dict]:
+    results = []
+    print(f"{'conc':>5} {'reqs':>6} {'err':>5} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'ttfb p50':>9}")
+    for concurrency in (int(c) for c in args.concurrency.split(",")):
+        row = await run_level(args, concurrency)
+        results.append(row)
+        print(f"{concurrency:>5} {row['requests']:>6} {row['errors']:>5} {row['throughputRps']:>8.2f} "
+              f"{row['medianMs']:>9.1f} {row['p95Ms']:>9.1f} {row['p99Ms']:>9.1f} {row['ttfbP50Ms']:>9.1f}")
+        if row["errors"]:
+            print(f"      statuses: {row['statuses']}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:5000", help="Service base URL")
+    parser.add_argument("--endpoint", default="/detect-components",
+                        help="POST endpoint taking {imageUrl} (e.g. /detect, /detect/fused, /generate-layout)")
+    parser.add_argument("--image-url", default="http://localhost:8900/images/{i}.png",
+                        help="Screenshot URL template; {i} cycles through --images distinct screens")
+    parser.add_argument("--images", type=int, default=8, help="Distinct screenshots to cycle through")
+    parser.add_argument("--concurrency", default="1,4,16", help="Comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=32, help="Requests per level (ignored with --duration)")
+    parser.add_argument("--duration", type=float, help="Seconds per level instead of a request count")
+    parser.add_argument("--timeout", type=float, default=300, help="Per-request timeout in seconds")
+    parser.add_argument("--cache", action="store_true",
+                        help="Allow cached results (default sends bypassCache so every request does the work)")
+    parser.add_argument("--json", help="Write results to this file")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    if args.json:
+        Path(args.json).write_text(json.dumps({"meta": metadata(args), "results": results}, indent=2))
+        print(f"\n💾 Wrote {len(results)} results to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
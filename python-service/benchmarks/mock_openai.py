@@ -0,0 +1,326 @@
+"""
+Local OpenAI stand-in for load tests
+
+Serves an OpenAI-compatible POST /v1/chat/completions (streamed and not)
+that answers the service's prompts in the formats screencoder_wrapper.py
+parses: <bbox> component listings for detection/block parsing and <div>
+HTML for block generation. Latency, streaming speed and 429/500 errors are
+configurable at startup and at runtime, and responses carry usage fields.
+It also serves synthetic screenshots, so a load test needs no network at all.
+
+Usage (from python-service/):
+    python -m benchmarks.mock_openai --port 8900 --latency-ms 800 --rate-limit-rate 0.05
+
+    # Point the service at it
+    OPENAI_BASE_URL=http://localhost:8900/v1 OPENAI_API_KEY=mock uvicorn main:app --port 5000
+
+    # Screenshots: http://localhost:8900/images/3.png?width=1290&height=2796&density=40
+    # Change behaviour while running:
+    curl -X POST localhost:8900/_mock/config -H 'Content-Type: application/json' -d '{"rate_limit_rate": 0.5}'
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import random
+import re
+import sys
+import time
+import uuid
+from functools import lru_cache
+from io import BytesIO
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.synthetic import generate_llm_response, generate_screenshot
+
+class MockSettings:
+    """Behaviour of the mock; every field can be changed through /_mock/config"""
+
+    def __init__(self, args: Optional[argparse.Namespace] = None):
+        self.latency_ms = 800.0  # Time to first token
+        self.jitter_ms = 200.0
+        self.tokens_per_second = 100.0  # Streaming speed (and added to non-streamed latency)
+        self.rate_limit_rate = 0.0  # Share of calls answered with 429
+        self.retry_after = 1.0  # Retry-After seconds on 429s
+        self.server_error_rate = 0.0  # Share of calls answered with 500
+        self.components = 12  # Components per detection response
+        self.style = "plain"  # plain, markdown or noisy (see benchmarks.synthetic)
+        self.responses_dir: Optional[str] = None  # Recorded detection.txt / block.html
+        if args is not None:
+            self.update({
+                name: value for name, value in vars(args).items()
+                if name in vars(self) and value is not None
+            })
+
+    def update(self, values: Dict[str, Any]):
+        for name, value in values.items():
+            if name not in vars(self):
+                raise KeyError(name)
+            setattr(self, name, value)
+
+
+settings = MockSettings()
+stats = {"requests": 0, "streamed": 0, "rateLimited": 0, "serverErrors": 0, "promptTokens": 0, "completionTokens": 0}
+app = FastAPI(title="Mock OpenAI")
+
+
+def _estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def _image_tokens(url: str, detail: str) -> int:
+    """OpenAI's vision pricing: 85 base tokens + 170 per 512px tile at high detail"""
+    if detail == "low" or not url.startswith("data:"):
+        return 85
+    try:
+        with Image.open(BytesIO(base64.b64decode(url.split(",", 1)[1]))) as image:
+            width, height = image.size
+    except Exception:
+        return 85
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height))
+    tiles = -(-int(width * scale) // 512) * -(-int(height * scale) // 512)
+    return 85 + 170 * tiles
+
+
+def _read_message(messages: List[Dict[str, Any]]) -> Tuple[str, int]:
+    """Prompt text of the last user message and its prompt token estimate"""
+    text, tokens = "", 0
+    for message in messages:
+        content = message.get("content")
+        parts = content if isinstance(content, list) else [{"type": "text", "text": content or ""}]
+        for part in parts:
+            if part.get("type") == "text":
+                text = part.get("text", "")
+                tokens += _estimate_tokens(text)
+            elif part.get("type") == "image_url":
+                image_url = part.get("image_url", {})
+                tokens += _image_tokens(image_url.get("url", ""), image_url.get("detail", "auto"))
+    return text, tokens
+
+
+def _recorded(name: str) -> Optional[str]:
+    if settings.responses_dir:
+        path = Path(settings.responses_dir) / name
+        if path.exists():
+            return path.read_text()
+    return None
+
+
+def detection_response(width: int, height: int, seed: int) -> str:
+    """A <bbox> listing: the layout blocks generate_layout looks for, then components"""
+    recorded = _recorded("detection.txt")
+    if recorded is not None:
+        return recorded
+
+    rng = random.Random(seed)
+    header_h, nav_h, sidebar_w = height // 12, height // 16, width // 4
+    boxes = [
+        (0, 0, width, header_h, "header"),
+        (0, header_h, width, header_h + nav_h, "navigation"),
+        (0, header_h + nav_h, sidebar_w, height, "sidebar"),
+        (sidebar_w, header_h + nav_h, width, height, "main content"),
+    ]
+    lines = [f"{name} <bbox>{x1} {y1} {x2} {y2}</bbox>" for x1, y1, x2, y2, name in boxes]
+
+    component_boxes = []
+    row_h = max(8, (height - header_h - nav_h) // max(1, settings.components + 1))
+    for index in range(settings.components):
+        y1 = header_h + nav_h + index * row_h + row_h // 4
+        x1 = sidebar_w + rng.randint(0, max(1, width // 10))
+        x2 = min(width, x1 + rng.randint(width // 5, max(width // 5 + 1, width - sidebar_w - x1)))
+        kind = rng.choice(["button", "input", "icon", "text", "image"])
+        component_boxes.append((x1, y1, x2, min(height, y1 + row_h // 2), kind))
+    listing = generate_llm_response(component_boxes, seed, settings.style)
+    return "\n".join(lines) + "\n" + listing
+
+
+def block_response(block_name: str, rng: random.Random) -> str:
+    recorded = _recorded("block.html")
+    if recorded is not None:
+        return recorded
+    items = "\n".join(
+        f'    <button class="px-4 py-2 rounded bg-blue-600 text-white">Item {i + 1}</button>'
+        for i in range(rng.randint(2, 6))
+    )
+    return (
+        "```html\n"
+        f'<div class="w-full p-4 flex items-center gap-3" data-block="{block_name}">\n{items}\n</div>\n'
+        "```"
+    )
+
+
+def reply_for(prompt: str, seed: int) -> str:
+    """Pick the response format from the prompt the service sent"""
+    dimensions = re.search(r"Image dimensions: (\d+)x(\d+)", prompt)
+    if dimensions:
+        return detection_response(int(dimensions.group(1)), int(dimensions.group(2)), seed)
+    block = re.search(r"screenshot of a (.+?) container", prompt)
+    return block_response(block.group(1) if block else "block", random.Random(seed))
+
+
+def _error(status: int, kind: str, message: str, headers: Optional[Dict[str, str]] = None) -> JSONResponse:
+    return JSONResponse(
+        {"error": {"message": message, "type": kind, "param": None, "code": kind}},
+        status_code=status,
+        headers=headers,
+    )
+
+
+def _usage(prompt_tokens: int, completion_tokens: int) -> Dict[str, int]:
+    stats["promptTokens"] += prompt_tokens
+    stats["completionTokens"] += completion_tokens
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    stats["requests"] += 1
+    rng = random.Random()
+
+    # Errors are decided up front, as the real API rejects before generating
+    roll = rng.random()
+    if roll < settings.rate_limit_rate:
+        stats["rateLimited"] += 1
+        await asyncio.sleep(0.01)
+        return _error(429, "rate_limit_exceeded", "Rate limit reached (mock)",
+                      {"retry-after": str(settings.retry_after)})
+    if roll < settings.rate_limit_rate + settings.server_error_rate:
+        stats["serverErrors"] += 1
+        await asyncio.sleep(settings.latency_ms / 1000)
+        return _error(500, "server_error", "The server had an error (mock)")
+
+    prompt, prompt_tokens = _read_message(body.get("messages", []))
+    seed = body.get("seed") or hash(prompt) & 0xFFFF
+    text = reply_for(prompt, seed)
+    completion_tokens = _estimate_tokens(text)
+    max_tokens = body.get("max_tokens") or body.get("max_completion_tokens")
+    finish_reason = "stop"
+    if max_tokens and completion_tokens > max_tokens:
+        text, completion_tokens, finish_reason = text[:max_tokens * 4], max_tokens, "length"
+
+    completion_id = f"chatcmpl-mock-{uuid.uuid4().hex[:12]}"
+    created = int(time.time())
+    model = body.get("model", "gpt-4o-mini")
+    first_token = max(0.0, settings.latency_ms + rng.uniform(-settings.jitter_ms, settings.jitter_ms)) / 1000
+    per_token = 1 / settings.tokens_per_second if settings.tokens_per_second > 0 else 0.0
+
+    if not body.get("stream"):
+        await asyncio.sleep(first_token + per_token * completion_tokens)
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": text},
+                "finish_reason": finish_reason,
+            }],
+            "usage": _usage(prompt_tokens, completion_tokens),
+        }
+
+    stats["streamed"] += 1
+    include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+
+    def chunk(delta: Dict[str, Any], finish: Optional[str] = None, usage=None) -> str:
+        payload = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": [] if usage else [{"index": 0, "delta": delta, "finish_reason": finish}],
+        }
+        if usage:
+            payload["usage"] = usage
+        return f"data: {json.dumps(payload)}\n\n"
+
+    async def events():
+        await asyncio.sleep(first_token)
+        yield chunk({"role": "assistant", "content": ""})
+        # ~4 characters per token, a few tokens per chunk
+        step = 16
+        for start in range(0, len(text), step):
+            await asyncio.sleep(per_token * step / 4)
+            yield chunk({"content": text[start:start + step]})
+        yield chunk({}, finish_reason)
+        if include_usage:
+            yield chunk({}, usage=_usage(prompt_tokens, completion_tokens))
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@lru_cache(maxsize=64)
+def _screenshot(seed: int, width: int, height: int, density: int, image_format: str) -> bytes:
+    return generate_screenshot(width, height, density, seed, image_format)[0]
+
+
+@app.get("/images/{name}")
+async def screenshot(name: str, width: int = 1290, height: int = 2796, density: int = 40):
+    """Synthetic screenshot: /images/<seed>.png or .jpg (same seed -> same bytes)"""
+    stem, _, extension = name.partition(".")
+    image_format = "JPEG" if extension.lower() in ("jpg", "jpeg") else "PNG"
+    seed = int(stem) if stem.isdigit() else 0
+    data = await asyncio.to_thread(_screenshot, seed, width, height, density, image_format)
+    return Response(data, media_type=f"image/{image_format.lower()}")
+
+
+@app.get("/_mock/config")
+async def get_config():
+    return vars(settings)
+
+
+@app.post("/_mock/config")
+async def set_config(request: Request):
+    try:
+        settings.update(await request.json())
+    except KeyError as e:
+        return JSONResponse({"detail": f"Unknown setting {e}"}, status_code=400)
+    return vars(settings)
+
+
+@app.get("/_mock/stats")
+async def get_stats():
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency-ms", type=float, help="Time to first token (default 800)")
+    parser.add_argument("--jitter-ms", type=float, help="Uniform +/- latency jitter (default 200)")
+    parser.add_argument("--tokens-per-second", type=float,
+                        help="Generation speed, 0 = instant (default 100)")
+    parser.add_argument("--rate-limit-rate", type=float, help="Share of 429 responses")
+    parser.add_argument("--retry-after", type=float, help="Retry-After seconds on 429s")
+    parser.add_argument("--server-error-rate", type=float, help="Share of 500 responses")
+    parser.add_argument("--components", type=int, help="Components per detection response (default 12)")
+    parser.add_argument("--style", choices=["plain", "markdown", "noisy"], help="Detection response style")
+    parser.add_argument("--responses-dir",
+                        help="Directory with recorded detection.txt and/or block.html to replay")
+    args = parser.parse_args()
+
+    settings.update(vars(MockSettings(args)))
+
+    import uvicorn
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
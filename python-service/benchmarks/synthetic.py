@@ -0,0 +1,196 @@
+"""
+Synthetic UI screenshots for offline benchmarks
+Draws app-like screens with PIL so benchmarks need no network and no real captures
+"""
+
+import random
+from io import BytesIO
+from typing import List, Tuple
+
+from PIL import Image, ImageDraw
+
+Box = Tuple[int, int, int, int, str]  # x1, y1, x2, y2, kind
+
+PALETTE = [(37, 99, 235), (22, 163, 74), (220, 38, 38), (234, 88, 12), (124, 58, 237), (15, 23, 42)]
+
+
+def generate_screenshot(
+    width: int = 1290,
+    height: int = 2796,
+    density: int = 40,
+    seed: int = 0,
+    image_format: str = "PNG"
+) -> Tuple[bytes, List[Box]]:
+    """
+    Render a synthetic mobile/web screen
+
+    Args:
+        width: Image width in pixels
+        height: Image height in pixels
+        density: Approximate number of components on the screen
+        seed: RNG seed (same seed -> same image)
+        image_format: PIL format name (PNG, JPEG, WEBP)
+
+    Returns:
+        (encoded image bytes, ground-truth boxes)
+    """
+    rng = random.Random(seed)
+    img = Image.new("RGB", (width, height), (248, 250, 252))
+    draw = ImageDraw.Draw(img)
+    boxes: List[Box] = []
+
+    unit = max(1, width // 40)  # Scales spacing with resolution
+    margin = 2 * unit
+
+    # Status bar + header
+    header_h = 5 * unit
+    draw.rectangle((0, 0, width, header_h), fill=(255, 255, 255))
+    draw.line((0, header_h, width, header_h), fill=(226, 232, 240), width=max(1, unit // 8))
+    boxes.append((margin, unit, margin + 3 * unit, 4 * unit, "icon"))
+    draw.ellipse(boxes[-1][:4], fill=PALETTE[5])
+    boxes.append((width - margin - 3 * unit, unit, width - margin, 4 * unit, "icon"))
+    draw.ellipse(boxes[-1][:4], fill=PALETTE[0])
+
+    # Bottom tab bar
+    tab_h = 6 * unit
+    draw.rectangle((0, height - tab_h, width, height), fill=(255, 255, 255))
+    tabs = 4
+    for i in range(tabs):
+        cx = int((i + 0.5) * width / tabs)
+        box = (cx - unit, height - tab_h + unit, cx + unit, height - tab_h + 3 * unit, "tab")
+        draw.rectangle(box[:4], fill=PALETTE[i % len(PALETTE)])
+        boxes.append(box)
+
+    # Body: stack rows of components until the density budget or space runs out
+    y = header_h + margin
+    body_bottom = height - tab_h - margin
+    while len(boxes) < density and y < body_bottom:
+        kind = rng.choice(["button", "input", "card", "text", "icons"])
+        if kind == "button":
+            h = 4 * unit
+            x2 = rng.randint(width // 3, width - margin)
+            box = (margin, y, x2, y + h, "button")
+            draw.rounded_rectangle(box[:4], radius=unit, fill=rng.choice(PALETTE))
+            draw.text((margin + unit, y + unit), "Continue", fill=(255, 255, 255))
+        elif kind == "input":
+            h = 4 * unit
+            box = (margin, y, width - margin, y + h, "input")
+            draw.rounded_rectangle(box[:4], radius=unit // 2, outline=(148, 163, 184), width=max(1, unit // 6))
+            draw.text((margin + unit, y + unit), "email@example.com", fill=(100, 116, 139))
+        elif kind == "card":
+            h = rng.randint(8, 14) * unit
+            box = (margin, y, width - margin, y + h, "card")
+            draw.rounded_rectangle(box[:4], radius=unit, fill=(255, 255, 255), outline=(226, 232, 240))
+            thumb = (margin + unit, y + unit, margin + unit + h - 2 * unit, y + h - unit, "image")
+            draw.rectangle(thumb[:4], fill=rng.choice(PALETTE))
+            boxes.append(thumb)
+        elif kind == "text":
+            h = 2 * unit
+            x2 = rng.randint(width // 4, width - margin)
+            box = (margin, y, x2, y + h, "text")
+            draw.rectangle(box[:4], fill=(51, 65, 85))
+        else:
+            h = 3 * unit
+            count = rng.randint(3, 6)
+            step = (width - 2 * margin) // count
+            for i in range(count):
+                x1 = margin + i * step
+                icon = (x1, y, x1 + h, y + h, "icon")
+                draw.ellipse(icon[:4], fill=rng.choice(PALETTE))
+                boxes.append(icon)
+            y += h + margin
+            continue
+
+        boxes.append(box)
+        y += h + margin
+
+    buffer = BytesIO()
+    save_kwargs = {"quality": 90} if image_format.upper() in ("JPEG", "WEBP") else {}
+    img.save(buffer, format=image_format, **save_kwargs)
+    return buffer.getvalue(), boxes
+
+
+def box_iou(a: Tuple[float, float, float, float], b: Tuple[float, float, float, float]) -> float:
+    """IoU of two (x1, y1, x2, y2) boxes"""
+    ix = max(0.0, min(a[2], b[2]) - max(a[0], b[0]))
+    iy = max(0.0, min(a[3], b[3]) - max(a[1], b[1]))
+    inter = ix * iy
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def match_boxes(reference, candidates, threshold: float = 0.5) -> Tuple[float, float]:
+    """
+    Greedily match candidates to reference boxes
+
+    Returns:
+        (recall at IoU >= threshold, mean IoU of matched pairs)
+    """
+    if not reference:
+        return 1.0, 1.0
+
+    remaining = list(candidates)
+    matched_ious = []
+    for ref in reference:
+        best_index, best_iou = -1, 0.0
+        for index, cand in enumerate(remaining):
+            iou = box_iou(ref, cand)
+            if iou > best_iou:
+                best_index, best_iou = index, iou
+        if best_index >= 0 and best_iou >= threshold:
+            matched_ious.append(best_iou)
+            remaining.pop(best_index)
+
+    recall = len(matched_ious) / len(reference)
+    mean_iou = sum(matched_ious) / len(matched_ious) if matched_ious else 0.0
+    return recall, mean_iou
+
+
+KIND_LABELS = {
+    "button": ['"Continue" button', "Sign In button", "Primary CTA button", "Submit btn"],
+    "input": ["Email input field", "Password input", "Search bar", "Name text box"],
+    "card": ["Product card", "Profile card container", "Settings panel"],
+    "image": ["Thumbnail image", "Avatar photo", "Banner illustration"],
+    "text": ["Section heading", "Body paragraph text", "Caption label"],
+    "icon": ["Menu icon", "Search icon", "Logo", "Profile icon"],
+    "tab": ["Home tab", "Explore tab", "Profile tab", "Settings tab"],
+}
+
+
+def generate_llm_response(boxes: List[Box], seed: int = 0, style: str = "plain") -> str:
+    """
+    Render a GPT-style component listing for ground-truth boxes
+
+    Args:
+        boxes: Boxes from generate_screenshot
+        seed: RNG seed for labels and jitter
+        style: "plain" (`label <bbox>..</bbox>` lines), "markdown" (numbered
+            bold names with the box on a bullet line below, which exercises the
+            previous-line label lookup) or "noisy" (prose, duplicates and
+            malformed boxes mixed in)
+
+    Returns:
+        Response text in the format the <bbox> parsers expect
+    """
+    rng = random.Random(seed)
+    lines = ["Here are the UI components I identified:", ""]
+    for index, (x1, y1, x2, y2, kind) in enumerate(boxes):
+        label = f"{rng.choice(KIND_LABELS.get(kind, ['Element']))} {index + 1}"
+        # GPT boxes are a few pixels off
+        jitter = [rng.randint(-3, 3) for _ in range(4)]
+        bbox = f"<bbox>{x1 + jitter[0]} {y1 + jitter[1]} {x2 + jitter[2]} {y2 + jitter[3]}</bbox>"
+
+        if style == "markdown":
+            lines += [f"{index + 1}. **{label}**", f"- {bbox}", ""]
+        else:
+            lines.append(f"{label} {bbox}")
+
+        if style == "noisy" and rng.random() < 0.2:
+            lines.append(rng.choice([
+                "This appears to be part of the main navigation.",
+                f"{label} (duplicate) {bbox}",
+                f"Broken entry <bbox>{x1} {y1} {x2}</bbox>",
+                "",
+            ]))
+    lines.append("All coordinates are in pixels.")
+    return "\n".join(lines)
@@ -0,0 +1,105 @@
+"""
+Working-height benchmark for UIED detection
+
+Measures decode + compo detection latency at several working heights and
+how closely the remapped boxes match the full-resolution result.
+
+Usage (from python-service/, UIED must be installed):
+    python -m benchmarks.working_height
+    python -m benchmarks.working_height --heights 0,1600,1280,800 --format JPEG --json results.json
+"""
+
+import argparse
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.synthetic import generate_screenshot, match_boxes
+
+
+def compo_boxes(compos):
+    return [
+        (c['column_min'], c['row_min'], c['column_max'], c['row_max'])
+        for c in compos
+        if c.get('width', 0) > 0 and c.get('height', 0) > 0
+    ]
+
+
+def run(args) -> list:
+    from uied_detector import get_detector, UIED_IMPORTED
+    if not UIED_IMPORTED:
+        raise SystemExit("UIED is not installed (python-service/UIED); cannot benchmark detection")
+
+    detector = get_detector()
+    heights = [int(h) for h in args.heights.split(",")]
+    results = []
+
+    for seed in range(args.screens):
+        data, _ = generate_screenshot(args.width, args.height, args.density, seed, args.format)
+
+        # Full-resolution baseline
+        img, size = detector.decode_image_scaled(data, None)
+        baseline = compo_boxes(detector.detect_compos(img, size))
+
+        for working_height in heights:
+            timings = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                img, size = detector.decode_image_scaled(data, working_height or None)
+                compos = detector.detect_compos(img, size)
+                timings.append((time.perf_counter() - start) * 1000)
+
+            recall, mean_iou = match_boxes(baseline, compo_boxes(compos))
+            results.append({
+                "screen": seed,
+                "format": args.format,
+                "workingHeight": working_height or args.height,
+                "latencyMs": round(statistics.median(timings), 2),
+                "boxes": len(compos),
+                "baselineBoxes": len(baseline),
+                "recallAtIoU50": round(recall, 4),
+                "meanIoU": round(mean_iou, 4),
+            })
+    return results
+
+
+def summarize(results: list):
+    print(f"\n{'height':>8} {'latency ms':>11} {'boxes':>7} {'recall@.5':>10} {'mean IoU':>9}")
+    by_height = {}
+    for row in results:
+        by_height.setdefault(row["workingHeight"], []).append(row)
+    for height in sorted(by_height, reverse=True):
+        rows = by_height[height]
+        print(f"{height:>8} "
+              f"{statistics.mean(r['latencyMs'] for r in rows):>11.1f} "
+              f"{statistics.mean(r['boxes'] for r in rows):>7.1f} "
+              f"{statistics.mean(r['recallAtIoU50'] for r in rows):>10.3f} "
+              f"{statistics.mean(r['meanIoU'] for r in rows):>9.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--width", type=int, default=1290)
+    parser.add_argument("--height", type=int, default=2796)
+    parser.add_argument("--density", type=int, default=40, help="Components per synthetic screen")
+    parser.add_argument("--screens", type=int, default=3, help="Number of synthetic screens")
+    parser.add_argument("--heights", default="0,2000,1600,1280,1024,800",
+                        help="Comma-separated working heights (0 = full resolution)")
+    parser.add_argument("--format", default="PNG", choices=["PNG", "JPEG", "WEBP"])
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per height (median is reported)")
+    parser.add_argument("--json", help="Write raw results to this file")
+    args = parser.parse_args()
+
+    results = run(args)
+    summarize(results)
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+        print(f"\n💾 Wrote {len(results)} rows to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
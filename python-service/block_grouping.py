@@ -0,0 +1,174 @@
+"""
+Layout Block Grouping
+Clusters the components parsed from a screenshot into a few layout regions,
+so HTML is generated once per region instead of once per component
+"""
+
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from app_config import BOX_CONTAINMENT, LAYOUT_MAX_BLOCK_CALLS, LAYOUT_BAND_GAP
+
+BBox = Tuple[int, int, int, int]
+
+# Containers covering this share of the page are page backgrounds, not regions
+PAGE_CONTAINER_AREA = 0.5
+
+# Boxes at least this tall (share of page height) and at most this wide are columns (sidebars)
+COLUMN_MIN_HEIGHT = 0.5
+COLUMN_MAX_WIDTH = 0.5
+
+# A group is named after its largest member when that member covers this share of it
+NAME_MIN_AREA = 0.5
+
+# Members listed in a region's description for the HTML prompt
+DESCRIBE_MAX_MEMBERS = 8
+
+
+class BlockRegion:
+    """A group of parsed components whose HTML is generated with one model call"""
+
+    def __init__(self, bbox: BBox, members: List[str]):
+        self.name = ""
+        self.bbox = bbox
+        self.members = members
+
+    @property
+    def description(self) -> str:
+        """What the region contains, for the HTML generation prompt"""
+        if len(self.members) == 1:
+            return self.name
+        listed = ", ".join(self.members[:DESCRIBE_MAX_MEMBERS])
+        extra = len(self.members) - DESCRIBE_MAX_MEMBERS
+        if extra > 0:
+            listed += f" and {extra} more"
+        return f"{self.name} ({listed})"
+
+    def to_dict(self) -> dict:
+        return {"name": self.name, "bbox": list(self.bbox), "members": self.members}
+
+
+def _area(box: BBox) -> int:
+    return max(0, box[2] - box[0]) * max(0, box[3] - box[1])
+
+
+def _union(a: BBox, b: BBox) -> BBox:
+    return (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+
+
+def _contained(inner: BBox, outer: BBox, threshold: float) -> bool:
+    """Whether at least `threshold` of inner's area lies inside outer (and outer is the larger box)"""
+    inner_area = _area(inner)
+    if inner_area == 0 or _area(outer) <= inner_area:
+        return False
+    w = min(inner[2], outer[2]) - max(inner[0], outer[0])
+    h = min(inner[3], outer[3]) - max(inner[1], outer[1])
+    return w > 0 and h > 0 and w * h >= threshold * inner_area
+
+
+def _reading_order(region: BlockRegion) -> Tuple[int, int]:
+    return region.bbox[1], region.bbox[0]
+
+
+def group_blocks(
+    bboxes: Dict[str, BBox],
+    width: int,
+    height: int,
+    max_regions: int = LAYOUT_MAX_BLOCK_CALLS,
+    band_gap: float = LAYOUT_BAND_GAP,
+    containment: float = BOX_CONTAINMENT
+) -> List[BlockRegion]:
+    """
+    Group parsed components into layout regions
+
+    1. Containment: a component inside another joins its container. Page-
+       sized containers are dropped so they don't swallow the whole screen.
+    2. Columns: tall, narrow top-level boxes (sidebars) are regions of their own.
+    3. Vertical bands: the remaining top-level boxes are swept top to bottom;
+       boxes whose vertical extents overlap or are closer than band_gap
+       (share of page height) form one row-shaped region.
+    4. Budget: while there are more than max_regions (0 = no limit), the
+       neighbouring pair in reading order with the smallest union is merged.
+
+    Args:
+        bboxes: Component label -> (x1, y1, x2, y2) in page pixels
+        width, height: Page size in pixels
+        max_regions: Most regions (HTML generation calls) to return
+        band_gap: Largest vertical gap within a band, as a share of height
+        containment: Share of a box's area that must lie inside a container
+
+    Returns:
+        Regions in reading order. A region is named after its largest
+        component when that covers most of it ("header"), otherwise
+        "section 1", "section 2", ...
+    """
+    labels = list(bboxes)
+    page_area = max(1, width * height)
+
+    def contains_any(outer: str) -> bool:
+        return any(_contained(bboxes[inner], bboxes[outer], containment) for inner in labels if inner != outer)
+
+    backgrounds = {
+        label for label in labels
+        if _area(bboxes[label]) >= PAGE_CONTAINER_AREA * page_area and contains_any(label)
+    }
+    candidates = [label for label in labels if label not in backgrounds]
+
+    # Each component joins its outermost container
+    members: Dict[str, List[str]] = {}
+    for label in candidates:
+        containers = [
+            outer for outer in candidates
+            if outer != label and _contained(bboxes[label], bboxes[outer], containment)
+        ]
+        top = max(containers, key=lambda outer: _area(bboxes[outer])) if containers else label
+        members.setdefault(top, []).append(label)
+
+    regions: List[BlockRegion] = []
+    banded: List[str] = []
+    for top in members:
+        x1, y1, x2, y2 = bboxes[top]
+        if y2 - y1 >= COLUMN_MIN_HEIGHT * height and x2 - x1 <= COLUMN_MAX_WIDTH * width:
+            regions.append(BlockRegion(bboxes[top], _ordered(members[top], bboxes)))
+        else:
+            banded.append(top)
+
+    band: Optional[BlockRegion] = None
+    gap = band_gap * height
+    for top in sorted(banded, key=lambda label: (bboxes[label][1], bboxes[label][0])):
+        box = bboxes[top]
+        if band is not None and box[1] <= band.bbox[3] + gap:
+            band.bbox = _union(band.bbox, box)
+            band.members.extend(members[top])
+        else:
+            band = BlockRegion(box, list(members[top]))
+            regions.append(band)
+
+    regions.sort(key=_reading_order)
+    while max_regions > 0 and len(regions) > max_regions:
+        i = min(range(len(regions) - 1), key=lambda i: _area(_union(regions[i].bbox, regions[i + 1].bbox)))
+        first, second = regions[i], regions.pop(i + 1)
+        first.bbox = _union(first.bbox, second.bbox)
+        first.members.extend(second.members)
+
+    for region in regions:
+        region.members = _ordered(region.members, bboxes)
+    _name(regions, bboxes)
+    return regions
+
+
+def _ordered(labels: Sequence[str], bboxes: Dict[str, BBox]) -> List[str]:
+    return sorted(labels, key=lambda label: (bboxes[label][1], bboxes[label][0]))
+
+
+def _name(regions: List[BlockRegion], bboxes: Dict[str, BBox]):
+    """Name regions after a dominant member, else "section N" (never clashing with a label)"""
+    number = 0
+    for region in regions:
+        largest = max(region.members, key=lambda label: _area(bboxes[label]))
+        if _area(bboxes[largest]) >= NAME_MIN_AREA * _area(region.bbox):
+            region.name = largest
+            continue
+        number += 1
+        while f"section {number}" in bboxes:
+            number += 1
+        region.name = f"section {number}"
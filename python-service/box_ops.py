@@ -0,0 +1,259 @@
+"""
+Box Operations
+Vectorized post-processing for detected boxes: pixel/percent conversion,
+area and aspect filtering, non-max suppression and containment merging
+"""
+
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app_config import (
+    BOX_POSTPROCESS_ENABLED,
+    BOX_MIN_SIDE_PX,
+    BOX_MAX_AREA_RATIO,
+    BOX_MAX_ASPECT,
+    BOX_NMS_IOU,
+    BOX_CONTAINMENT,
+    BOX_MERGE_AREA_RATIO,
+)
+
+
+def to_array(boxes: Iterable[Sequence[float]]) -> np.ndarray:
+    """(x1, y1, x2, y2) boxes -> float array of shape (N, 4)"""
+    array = np.asarray(list(boxes), dtype=np.float64)
+    return array.reshape(-1, 4)
+
+
+def compos_to_array(compos: List[dict]) -> np.ndarray:
+    """UIED compo dicts -> (N, 4) array of (x1, y1, x2, y2) pixels"""
+    return to_array(
+        (c.get('column_min', 0), c.get('row_min', 0), c.get('column_max', 0), c.get('row_max', 0))
+        for c in compos
+    )
+
+
+def areas(boxes: np.ndarray) -> np.ndarray:
+    return np.clip(boxes[:, 2] - boxes[:, 0], 0, None) * np.clip(boxes[:, 3] - boxes[:, 1], 0, None)
+
+
+def to_percent(boxes: np.ndarray, width: int, height: int, decimals: int = 2) -> np.ndarray:
+    """Pixel boxes -> (N, 4) array of (x%, y%, width%, height%)"""
+    scale = np.array([100.0 / width, 100.0 / height, 100.0 / width, 100.0 / height])
+    xywh = np.column_stack([boxes[:, :2], boxes[:, 2:] - boxes[:, :2]])
+    return np.round(xywh * scale, decimals)
+
+
+def to_pixels(percent: np.ndarray, width: int, height: int) -> np.ndarray:
+    """(x%, y%, width%, height%) -> pixel (x1, y1, x2, y2) boxes"""
+    scale = np.array([width / 100.0, height / 100.0, width / 100.0, height / 100.0])
+    xywh = percent * scale
+    return np.column_stack([xywh[:, :2], xywh[:, :2] + xywh[:, 2:]])
+
+
+def filter_mask(
+    boxes: np.ndarray,
+    width: int,
+    height: int,
+    min_side: float = BOX_MIN_SIDE_PX,
+    max_area_ratio: float = BOX_MAX_AREA_RATIO,
+    max_aspect: float = BOX_MAX_ASPECT
+) -> np.ndarray:
+    """
+    Boolean mask of boxes worth keeping
+
+    Drops degenerate/tiny boxes, boxes covering most of the screen
+    (backgrounds) and, when max_aspect is set, extremely thin boxes
+    (dividers and rules).
+    """
+    w = boxes[:, 2] - boxes[:, 0]
+    h = boxes[:, 3] - boxes[:, 1]
+    keep = (w >= max(min_side, 1e-9)) & (h >= max(min_side, 1e-9))
+    if max_area_ratio > 0:
+        keep &= (w * h) <= max_area_ratio * width * height
+    if max_aspect > 0:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            aspect = np.maximum(w / h, h / w)
+        keep &= aspect <= max_aspect
+    return keep
+
+
+def _intersections(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Pairwise intersection areas, shape (len(a), len(b))"""
+    # In-place ops keep this to two (N, M) temporaries
+    w = np.minimum(a[:, None, 2], b[None, :, 2])
+    w -= np.maximum(a[:, None, 0], b[None, :, 0])
+    np.maximum(w, 0, out=w)
+    h = np.minimum(a[:, None, 3], b[None, :, 3])
+    h -= np.maximum(a[:, None, 1], b[None, :, 1])
+    np.maximum(h, 0, out=h)
+    w *= h
+    return w
+
+
+def iou_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Pairwise IoU, shape (len(a), len(b))"""
+    inter = _intersections(a, b)
+    union = areas(a)[:, None] + areas(b)[None, :]
+    union -= inter
+    with np.errstate(divide='ignore', invalid='ignore'):
+        np.divide(inter, union, out=inter, where=union > 0)
+    inter[union <= 0] = 0.0
+    return inter
+
+
+def nms(
+    boxes: np.ndarray,
+    scores: Optional[np.ndarray] = None,
+    iou_threshold: float = BOX_NMS_IOU
+) -> np.ndarray:
+    """
+    Greedy non-max suppression
+
+    Args:
+        boxes: (N, 4) pixel boxes
+        scores: Higher wins; defaults to box area (keep the outer of two near-duplicates)
+        iou_threshold: Boxes overlapping a kept box above this IoU are dropped
+
+    Returns:
+        Indices of kept boxes, in their original order
+    """
+    count = len(boxes)
+    if count == 0:
+        return np.empty(0, dtype=np.int64)
+
+    if scores is None:
+        scores = areas(boxes)
+    order = np.argsort(-scores, kind='stable')
+    overlaps = iou_matrix(boxes, boxes) > iou_threshold
+
+    suppressed = np.zeros(count, dtype=bool)
+    keep = []
+    for index in order:
+        if suppressed[index]:
+            continue
+        keep.append(index)
+        suppressed |= overlaps[index]
+
+    return np.sort(np.asarray(keep, dtype=np.int64))
+
+
+def merge_contained(
+    boxes: np.ndarray,
+    containment: float = BOX_CONTAINMENT,
+    min_area_ratio: float = BOX_MERGE_AREA_RATIO
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Fold boxes that sit almost entirely inside a similar-sized box into it
+
+    A box is merged when at least `containment` of its area lies inside
+    another box whose area is at most 1 / min_area_ratio times its own
+    (e.g. a button's label inside the button). Genuinely nested elements,
+    like a button inside a card, are much smaller than their container and
+    are left alone. The container grows to the union of what it absorbs.
+
+    Returns:
+        (indices of kept boxes, (len(kept), 4) merged boxes)
+    """
+    count = len(boxes)
+    if count == 0:
+        return np.empty(0, dtype=np.int64), boxes
+
+    box_areas = areas(boxes)
+    inter = _intersections(boxes, boxes)
+    np.fill_diagonal(inter, 0)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # inside[i, j]: box i lies (mostly) inside box j
+        inside = inter >= containment * box_areas[:, None]
+        similar = box_areas[:, None] >= min_area_ratio * box_areas[None, :]
+        # Only merge into a box at least as large (ties broken by index) so pairs don't absorb each other
+        larger = (box_areas[None, :] > box_areas[:, None]) | (
+            (box_areas[None, :] == box_areas[:, None]) & (np.arange(count)[None, :] < np.arange(count)[:, None])
+        )
+    absorb = inside & similar & larger & (box_areas[:, None] > 0)
+
+    merged = boxes.copy()
+    absorbed = absorb.any(axis=1)
+    for child in np.flatnonzero(absorbed):
+        # Fold into the smallest qualifying container
+        candidates = np.flatnonzero(absorb[child])
+        parent = candidates[np.argmin(box_areas[candidates])]
+        merged[parent, :2] = np.minimum(merged[parent, :2], boxes[child, :2])
+        merged[parent, 2:] = np.maximum(merged[parent, 2:], boxes[child, 2:])
+
+    keep = np.flatnonzero(~absorbed)
+    return keep, merged[keep]
+
+
+class StreamingSuppressor:
+    """
+    Incremental filter + suppression for boxes that arrive one at a time
+
+    Streamed boxes can't wait for a global NMS pass, so each new box is
+    filtered and dropped if it overlaps an already-accepted box above the
+    NMS threshold (first come wins). The final postprocess() result stays
+    authoritative.
+    """
+
+    def __init__(self, width: int, height: int, iou_threshold: float = BOX_NMS_IOU):
+        self.width = width
+        self.height = height
+        self.iou_threshold = iou_threshold
+        self.accepted = np.empty((0, 4), dtype=np.float64)
+
+    def accept(self, box: Sequence[float]) -> bool:
+        candidate = to_array([box])
+        if BOX_POSTPROCESS_ENABLED:
+            if not filter_mask(candidate, self.width, self.height)[0]:
+                return False
+            if len(self.accepted) and iou_matrix(candidate, self.accepted).max() > self.iou_threshold:
+                return False
+        self.accepted = np.vstack([self.accepted, candidate])
+        return True
+
+
+def postprocess(
+    boxes: np.ndarray,
+    width: int,
+    height: int,
+    scores: Optional[np.ndarray] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Filter, suppress and merge detected boxes
+
+    Args:
+        boxes: (N, 4) pixel boxes
+        width, height: Image size in pixels
+        scores: Optional per-box scores for NMS
+
+    Returns:
+        (indices into the input of kept boxes, (len(kept), 4) final boxes)
+    """
+    indices = np.arange(len(boxes))
+    if not BOX_POSTPROCESS_ENABLED or len(boxes) == 0:
+        return indices, boxes
+
+    mask = filter_mask(boxes, width, height)
+    indices, boxes = indices[mask], boxes[mask]
+    if scores is not None:
+        scores = scores[mask]
+
+    kept = nms(boxes, scores)
+    indices, boxes = indices[kept], boxes[kept]
+
+    kept, boxes = merge_contained(boxes)
+    return indices[kept], boxes
+
+
+def settings() -> dict:
+    """Active post-processing settings (part of detection cache keys)"""
+    return {
+        'enabled': BOX_POSTPROCESS_ENABLED,
+        'min_side': BOX_MIN_SIDE_PX,
+        'max_area_ratio': BOX_MAX_AREA_RATIO,
+        'max_aspect': BOX_MAX_ASPECT,
+        'nms_iou': BOX_NMS_IOU,
+        'containment': BOX_CONTAINMENT,
+        'merge_area_ratio': BOX_MERGE_AREA_RATIO,
+    }
@@ -0,0 +1,185 @@
+"""
+Detection Result Cache
+Content-addressed cache for UIED results: in-process LRU tier + size-capped disk tier
+"""
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from app_config import (
+    DETECTION_CACHE_ENABLED,
+    DETECTION_CACHE_MAX_ENTRIES,
+    DETECTION_CACHE_DIR,
+    DETECTION_CACHE_DISK_MB,
+)
+
+
+def content_hash(image_bytes: bytes) -> str:
+    """SHA-256 of the image bytes; identifies a screenshot regardless of its URL"""
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+class DetectionCache:
+    """
+    Two-tier cache for detection results
+
+    Keys are the SHA-256 of the image bytes plus the detection parameters,
+    so the same screenshot under a different URL still hits.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = DETECTION_CACHE_MAX_ENTRIES,
+        disk_dir: Optional[str] = DETECTION_CACHE_DIR,
+        disk_max_bytes: int = DETECTION_CACHE_DISK_MB * 1024 * 1024
+    ):
+        self.max_entries = max_entries
+        self.disk_dir = Path(disk_dir) if disk_dir and disk_max_bytes > 0 else None
+        self.disk_max_bytes = disk_max_bytes
+        self._memory: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_bytes = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if self.disk_dir is not None:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+            self._disk_bytes = sum(p.stat().st_size for p in self.disk_dir.glob("*/*.json"))
+
+    @staticmethod
+    def make_key(image_hash: str, params: Dict[str, Any]) -> str:
+        """Build the cache key from the image's content_hash and detection parameters"""
+        digest = hashlib.sha256(image_hash.encode("utf-8"))
+        digest.update(json.dumps(params, sort_keys=True).encode("utf-8"))
+        return digest.hexdigest()
+
+    def _disk_path(self, key: str) -> Path:
+        return self.disk_dir / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Look up a result, promoting disk hits into the memory tier"""
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return self._memory[key]
+
+        if self.disk_dir is not None:
+            path = self._disk_path(key)
+            try:
+                with open(path, "r") as f:
+                    value = json.load(f)
+                os.utime(path)  # Refresh mtime so eviction stays least-recently-used
+            except (OSError, ValueError):
+                value = None
+
+            if value is not None:
+                with self._lock:
+                    self.disk_hits += 1
+                    self._remember(key, value)
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, value: Dict[str, Any]):
+        """Store a result in both tiers"""
+        with self._lock:
+            self._remember(key, value)
+
+        if self.disk_dir is not None:
+            self._write_disk(key, value)
+
+    def _remember(self, key: str, value: Dict[str, Any]):
+        """Insert into the memory LRU (caller holds the lock)"""
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _write_disk(self, key: str, value: Dict[str, Any]):
+        path = self._disk_path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        data = json.dumps(value).encode("utf-8")
+
+        # Write atomically so concurrent readers never see partial files
+        tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            previous = path.stat().st_size if path.exists() else 0
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"⚠️  Could not write detection cache entry: {e}")
+            tmp_path.unlink(missing_ok=True)
+            return
+
+        with self._lock:
+            self._disk_bytes += len(data) - previous
+            over_budget = self._disk_bytes > self.disk_max_bytes
+
+        if over_budget:
+            self._evict_disk()
+
+    def _evict_disk(self):
+        """Delete least-recently-used files until the disk tier is back under its cap"""
+        entries = []
+        for path in self.disk_dir.glob("*/*.json"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+
+        total = sum(size for _, size, _ in entries)
+        # Evict down to 90% so we don't rescan on every write
+        target = int(self.disk_max_bytes * 0.9)
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            total -= size
+            with self._lock:
+                self.evictions += 1
+
+        with self._lock:
+            self._disk_bytes = total
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and tier sizes"""
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memoryHits": self.memory_hits,
+                "diskHits": self.disk_hits,
+                "misses": self.misses,
+                "hitRate": round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+                "memoryEntries": len(self._memory),
+                "memoryMaxEntries": self.max_entries,
+                "diskBytes": self._disk_bytes,
+                "diskMaxBytes": self.disk_max_bytes if self.disk_dir is not None else 0,
+                "diskEvictions": self.evictions,
+            }
+
+
+_cache_instance: Optional[DetectionCache] = None
+
+
+def get_cache() -> Optional[DetectionCache]:
+    """Get or create the singleton DetectionCache (None when disabled)"""
+    global _cache_instance
+    if _cache_instance is None and DETECTION_CACHE_ENABLED:
+        _cache_instance = DetectionCache()
+    return _cache_instance
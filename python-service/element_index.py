@@ -0,0 +1,132 @@
+"""
+Element Index
+Per-image spatial indexes over detected elements for hit testing
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import box_ops
+from app_config import ELEMENT_INDEX_MAX_IMAGES
+from spatial_index import GridIndex
+
+
+class ElementIndex:
+    """
+    Grid index over one image's elements
+
+    Elements keep their API form (percentage boxes); the grid is built in
+    pixels so its cells are square whatever the screen's aspect ratio.
+    """
+
+    def __init__(self, elements: List[Dict[str, Any]], width: int, height: int):
+        self.elements = elements
+        self.width = width
+        self.height = height
+        boxes = box_ops.to_pixels(
+            box_ops.to_array(
+                (e['boundingBox']['x'], e['boundingBox']['y'], e['boundingBox']['width'], e['boundingBox']['height'])
+                for e in elements
+            ),
+            width,
+            height
+        )
+        self.grid = GridIndex.build(boxes.tolist(), width, height)
+
+    def to_pixels(self, x: float, y: float) -> Tuple[float, float]:
+        """Percentage point -> pixel point"""
+        return x * self.width / 100.0, y * self.height / 100.0
+
+    def _results(self, ids: Sequence[int], min_confidence: float) -> List[Dict[str, Any]]:
+        return [
+            {**self.elements[i], 'elementIndex': i}
+            for i in ids
+            if self.elements[i].get('confidence', 1.0) >= min_confidence
+        ]
+
+    def at_point(self, x: float, y: float, min_confidence: float = 0.0) -> List[Dict[str, Any]]:
+        """Elements under a pixel point, innermost (smallest) first"""
+        return self._results(self.grid.query_point(x, y), min_confidence)
+
+    def in_rect(
+        self,
+        box: Tuple[float, float, float, float],
+        mode: str = "intersects",
+        min_confidence: float = 0.0
+    ) -> List[Dict[str, Any]]:
+        """
+        Elements relative to a pixel rectangle
+
+        Args:
+            box: (x1, y1, x2, y2) in pixels
+            mode: "intersects" (any overlap) or "contains" (element fully inside box)
+            min_confidence: Skip elements below this confidence
+        """
+        ids = self.grid.query_rect(box)
+        if mode == "contains":
+            x1, y1, x2, y2 = box
+            ids = [
+                i for i in ids
+                if self.grid.boxes[i][0] >= x1 and self.grid.boxes[i][1] >= y1
+                and self.grid.boxes[i][2] <= x2 and self.grid.boxes[i][3] <= y2
+            ]
+        return self._results(ids, min_confidence)
+
+
+class ElementIndexStore:
+    """LRU of ElementIndex objects keyed by (image hash, detector source)"""
+
+    def __init__(self, max_images: int = ELEMENT_INDEX_MAX_IMAGES):
+        self.max_images = max_images
+        self._indexes: "OrderedDict[Tuple[str, str], ElementIndex]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.builds = 0
+
+    def put(
+        self,
+        image_hash: str,
+        source: str,
+        elements: List[Dict[str, Any]],
+        width: int,
+        height: int
+    ) -> ElementIndex:
+        """Build and store the index for an image's elements"""
+        index = ElementIndex(elements, width, height)
+        with self._lock:
+            self._indexes[(image_hash, source)] = index
+            self._indexes.move_to_end((image_hash, source))
+            while len(self._indexes) > self.max_images:
+                self._indexes.popitem(last=False)
+            self.builds += 1
+        return index
+
+    def get(self, image_hash: str, source: str) -> Optional[ElementIndex]:
+        with self._lock:
+            index = self._indexes.get((image_hash, source))
+            if index is not None:
+                self._indexes.move_to_end((image_hash, source))
+            return index
+
+    def __contains__(self, key: Tuple[str, str]) -> bool:
+        with self._lock:
+            return key in self._indexes
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "images": len(self._indexes),
+                "maxImages": self.max_images,
+                "builds": self.builds,
+            }
+
+
+_store_instance: Optional[ElementIndexStore] = None
+
+
+def get_element_index() -> ElementIndexStore:
+    """Get or create the singleton ElementIndexStore instance"""
+    global _store_instance
+    if _store_instance is None:
+        _store_instance = ElementIndexStore()
+    return _store_instance
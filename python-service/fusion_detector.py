@@ -0,0 +1,259 @@
+"""
+Fusion Detector
+Combines UIED's pixel-accurate geometry with GPT-4o-mini's labels
+"""
+
+import asyncio
+import re
+import time
+from typing import Any, Awaitable, Dict, List, Optional, Sequence, Tuple
+
+import box_ops
+from app_config import FUSION_MATCH_IOU
+from metrics import stage
+from spatial_index import GridIndex, center, iou
+
+Box = Tuple[float, float, float, float]
+
+# Matched elements score FUSED_BASE_CONFIDENCE plus up to 0.2 for IoU (0.8-1.0).
+# GPT-only elements pass the default minConfidence (0.7): GPT saw and named
+# them, UIED just missed the box. UIED-only elements do not.
+FUSED_BASE_CONFIDENCE = 0.8
+LLM_ONLY_CONFIDENCE = 0.7
+UIED_ONLY_CONFIDENCE = 0.5
+
+# First matching rule wins, so "search icon button" is a button and "email input" an input
+LABEL_TYPES = [
+    ('input', r'inputs?|fields?|search bar|text ?box|textarea|dropdown|select'),
+    ('button', r'buttons?|btn|cta'),
+    ('tab', r'tabs?|tab bar'),
+    ('link', r'links?'),
+    ('icon', r'icons?|logo'),
+    ('image', r'images?|photos?|avatar|picture|thumbnail|banner|illustration'),
+    ('card', r'cards?|containers?|panel'),
+    ('text', r'heading|title|text|label|caption|paragraph'),
+]
+LABEL_PATTERNS = [(element_type, re.compile(rf'\b(?:{pattern})\b')) for element_type, pattern in LABEL_TYPES]
+
+
+def type_from_label(label: str) -> str:
+    """Infer an element type from a GPT component label"""
+    label = label.lower()
+    for element_type, pattern in LABEL_PATTERNS:
+        if pattern.search(label):
+            return element_type
+    return 'other'
+
+
+def _center_inside(box: Box, container: Box) -> bool:
+    x, y = center(box)
+    return container[0] <= x <= container[2] and container[1] <= y <= container[3]
+
+
+def match_boxes(
+    uied_boxes: Sequence[Box],
+    llm_boxes: Sequence[Box],
+    width: int,
+    height: int,
+    iou_threshold: float = FUSION_MATCH_IOU
+) -> List[Tuple[int, int, float]]:
+    """
+    One-to-one matching of LLM boxes to UIED boxes
+
+    A pair qualifies when its IoU reaches iou_threshold, or when each box's
+    center lies inside the other (GPT boxes are often loose but centered).
+    Pairs are assigned greedily by IoU. Only UIED boxes sharing a grid cell
+    with an LLM box are compared.
+
+    Returns:
+        list of (uied_index, llm_index, iou)
+    """
+    index = GridIndex.build(uied_boxes, width, height)
+
+    pairs = []
+    for llm_index, llm_box in enumerate(llm_boxes):
+        for uied_index in index.query_rect(llm_box):
+            uied_box = uied_boxes[uied_index]
+            score = iou(uied_box, llm_box)
+            if score >= iou_threshold or (
+                _center_inside(llm_box, uied_box) and _center_inside(uied_box, llm_box)
+            ):
+                pairs.append((score, uied_index, llm_index))
+
+    pairs.sort(key=lambda pair: (-pair[0], pair[1], pair[2]))
+    used_uied, used_llm, matches = set(), set(), []
+    for score, uied_index, llm_index in pairs:
+        if uied_index in used_uied or llm_index in used_llm:
+            continue
+        used_uied.add(uied_index)
+        used_llm.add(llm_index)
+        matches.append((uied_index, llm_index, score))
+    return matches
+
+
+def fuse(
+    uied_result: Dict[str, Any],
+    llm_result: Dict[str, Any],
+    min_confidence: float = 0.7
+) -> Dict[str, Any]:
+    """
+    Merge a /detect result with a /detect-components result for the same image
+
+    GPT boxes are matched against UIED's full geometry, including the
+    untyped boxes /detect drops because it cannot name them. Matched pairs
+    keep the UIED box and take the GPT label and type. With the default
+    min_confidence of 0.7 the result is every matched element (0.8-1.0) plus
+    what only GPT found (0.7). UIED-only elements score 0.5, and untyped ones
+    nobody labelled are left out.
+
+    Args:
+        uied_result: dict with elements and geometry (percent boxes; see
+            UIEDDetector.detect_image), imageWidth, imageHeight
+        llm_result: dict with bboxes ({label: [x1, y1, x2, y2]} in pixels)
+        min_confidence: Drop fused elements below this confidence
+
+    Returns:
+        dict with elements, imageWidth, imageHeight, metadata
+    """
+    width, height = uied_result['imageWidth'], uied_result['imageHeight']
+
+    uied_elements = uied_result.get('geometry', uied_result['elements'])
+    uied_boxes = [
+        tuple(box) for box in box_ops.to_pixels(
+            box_ops.to_array(
+                (e['boundingBox']['x'], e['boundingBox']['y'], e['boundingBox']['width'], e['boundingBox']['height'])
+                for e in uied_elements
+            ),
+            width,
+            height
+        ).tolist()
+    ]
+    llm_labels = list(llm_result.get('bboxes', {}))
+    llm_boxes = [tuple(float(v) for v in llm_result['bboxes'][label]) for label in llm_labels]
+
+    matches = match_boxes(uied_boxes, llm_boxes, width, height)
+
+    fused = []  # (box, element)
+    matched_uied, matched_llm = set(), set()
+    for uied_index, llm_index, score in matches:
+        matched_uied.add(uied_index)
+        matched_llm.add(llm_index)
+        label = llm_labels[llm_index]
+        element_type = type_from_label(label)
+        if element_type == 'other':
+            element_type = uied_elements[uied_index]['type']
+        fused.append((uied_boxes[uied_index], {
+            'type': element_type,
+            'label': label,
+            'description': f"Detected {element_type}",
+            'confidence': round(FUSED_BASE_CONFIDENCE + (1 - FUSED_BASE_CONFIDENCE) * score, 2),
+            'source': 'fused',
+        }))
+
+    for llm_index, label in enumerate(llm_labels):
+        if llm_index not in matched_llm:
+            element_type = type_from_label(label)
+            fused.append((llm_boxes[llm_index], {
+                'type': element_type,
+                'label': label,
+                'description': f"Detected {element_type}",
+                'confidence': LLM_ONLY_CONFIDENCE,
+                'source': 'llm',
+            }))
+
+    for uied_index, element in enumerate(uied_elements):
+        if uied_index not in matched_uied and (element['type'] != 'other' or element.get('label')):
+            fused.append((uied_boxes[uied_index], {
+                'type': element['type'],
+                'label': element.get('label') or None,
+                'description': element.get('description'),
+                'confidence': UIED_ONLY_CONFIDENCE,
+                'source': 'uied',
+            }))
+
+    fused = [item for item in fused if item[1]['confidence'] >= min_confidence]
+
+    # Reading order: top to bottom, then left to right
+    fused.sort(key=lambda item: (round(item[0][1]), round(item[0][0])))
+    percents = box_ops.to_percent(box_ops.to_array(box for box, _ in fused), width, height).tolist()
+
+    elements = []
+    for (_, element), (x, y, w, h) in zip(fused, percents):
+        element['boundingBox'] = {'x': x, 'y': y, 'width': w, 'height': h}
+        elements.append(element)
+
+    return {
+        'elements': elements,
+        'imageWidth': width,
+        'imageHeight': height,
+        'metadata': {
+            'uiedElements': len(uied_result['elements']),
+            'uiedGeometry': len(uied_elements),
+            'llmElements': len(llm_labels),
+            'matched': len(matches),
+        }
+    }
+
+
+async def _timed(awaitable: Awaitable[Dict[str, Any]]) -> Tuple[Dict[str, Any], float]:
+    start = time.perf_counter()
+    result = await awaitable
+    return result, round((time.perf_counter() - start) * 1000, 1)
+
+
+async def detect_fused(
+    uied: Awaitable[Dict[str, Any]],
+    llm: Awaitable[Dict[str, Any]],
+    min_confidence: float = 0.7
+) -> Dict[str, Any]:
+    """
+    Run both detectors concurrently and fuse their results
+
+    Latency is max(UIED, LLM) rather than the sum. If one detector fails
+    the other's elements are returned on their own (with the error in
+    metadata); if both fail the UIED error is raised.
+
+    Args:
+        uied: Awaitable producing a /detect result dict
+        llm: Awaitable producing a /detect-components result dict
+        min_confidence: Passed to fuse()
+    """
+    start = time.perf_counter()
+    uied_outcome, llm_outcome = await asyncio.gather(
+        _timed(uied), _timed(llm), return_exceptions=True
+    )
+
+    errors: Dict[str, str] = {}
+    if isinstance(uied_outcome, BaseException):
+        errors['uied'] = str(uied_outcome)
+    if isinstance(llm_outcome, BaseException):
+        errors['llm'] = str(llm_outcome)
+    if len(errors) == 2:
+        raise uied_outcome
+
+    if 'uied' in errors:
+        print(f"⚠️  Fusion: UIED failed ({errors['uied']}), returning LLM elements only")
+        llm_result, llm_ms = llm_outcome
+        metadata = llm_result['metadata']
+        uied_result, uied_ms = {
+            'elements': [], 'imageWidth': metadata['imageWidth'], 'imageHeight': metadata['imageHeight']
+        }, None
+    else:
+        uied_result, uied_ms = uied_outcome
+
+    if 'llm' in errors:
+        print(f"⚠️  Fusion: LLM failed ({errors['llm']}), returning UIED elements only")
+        llm_result, llm_ms = {'bboxes': {}}, None
+    elif 'uied' not in errors:
+        llm_result, llm_ms = llm_outcome
+
+    # Single-detector fallback keeps that detector's elements regardless of agreement
+    with stage("fuse"):
+        result = fuse(uied_result, llm_result, min_confidence if not errors else 0.0)
+    result['metadata'].update({
+        'uiedMs': uied_ms,
+        'llmMs': llm_ms,
+        'totalMs': round((time.perf_counter() - start) * 1000, 1),
+        'errors': errors,
+    })
+    return result
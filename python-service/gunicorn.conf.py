@@ -0,0 +1,98 @@
+"""
+Production server configuration (gunicorn + uvicorn workers)
+
+    gunicorn main:app -c gunicorn.conf.py
+
+- WEB_CONCURRENCY worker processes (default: the CPUs this container may
+  use, at most MAX_DEFAULT_WORKERS), each running the asyncio app, so
+  GPT-bound requests and UIED work are spread over the cores
+- The app and its heavy modules (OpenCV, UIED, numpy, the OpenAI SDK) are
+  imported once in the master before forking; workers share those pages
+  copy-on-write and start in milliseconds
+- CPU threads are split between workers: each worker's UIED pool and
+  OpenCV/BLAS thread counts get cores / workers unless set explicitly
+- Prometheus metrics are aggregated across workers (multiprocess mode)
+- SIGTERM drains in-flight requests for GRACEFUL_TIMEOUT seconds, then
+  the shutdown handlers stop UIED pools and close HTTP clients
+"""
+
+import math
+import os
+import shutil
+import tempfile
+
+# Every worker holds its own copy of the app's mutable state, caches and
+# UIED pool, so memory, not cores, is what runs out first on big hosts
+MAX_DEFAULT_WORKERS = 4
+
+
+def available_cpus() -> int:
+    """CPUs this process may use: its affinity mask, capped by a cgroup CPU quota"""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:  # Not available on macOS
+        cpus = os.cpu_count() or 1
+    quota = None
+    try:
+        # cgroup v2: "<quota> <period>", or "max <period>" without a limit
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            limit, period = f.read().split()[:2]
+        if limit != "max":
+            quota = int(limit) / int(period)
+    except (OSError, ValueError):
+        try:
+            # cgroup v1: a quota of -1 means no limit
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+                limit = int(f.read())
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+                period = int(f.read())
+            if limit > 0 and period > 0:
+                quota = limit / period
+        except (OSError, ValueError):
+            pass
+    if quota is not None:
+        cpus = min(cpus, math.ceil(quota))
+    return max(1, cpus)
+
+
+cpus = available_cpus()
+workers = max(1, int(os.getenv("WEB_CONCURRENCY", min(cpus, MAX_DEFAULT_WORKERS))))
+cores_per_worker = str(max(1, cpus // workers))
+
+# Thread-count defaults must be in the environment before numpy/OpenCV are
+# imported (below, by preload) and before UIED pool workers are spawned
+for name in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS", "CV_THREADS", "UIED_POOL_WORKERS"):
+    os.environ.setdefault(name, cores_per_worker)
+
+# Every worker writes its metrics here; /metrics merges them. The directory
+# must exist before preload, since some metrics open their files at import.
+# Start empty (files of dead workers would be summed forever), but only once:
+# this file is re-read on SIGHUP while workers keep writing there.
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "uied_prometheus"))
+if not os.environ.get("UIED_METRICS_DIR_READY"):
+    shutil.rmtree(os.environ["PROMETHEUS_MULTIPROC_DIR"], ignore_errors=True)
+    os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+    os.environ["UIED_METRICS_DIR_READY"] = "1"
+
+bind = f"{os.getenv('HOST', '0.0.0.0')}:{os.getenv('PORT', '5000')}"
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", 30))
+timeout = int(os.getenv("WORKER_TIMEOUT", 120))  # Unresponsive worker (blocked event loop) is restarted
+keepalive = 5
+accesslog = "-"
+
+
+def on_starting(server):
+    """Import the heavy modules once, before fork"""
+    # Singletons holding threads, sockets or SQLite connections are still created per worker
+    import uied_detector  # noqa: F401  OpenCV, UIED, scikit-learn, pandas
+    import screencoder_wrapper  # noqa: F401
+    import openai  # noqa: F401
+    server.log.info(f"Preloaded heavy modules; {workers} workers, {cores_per_worker} cores each")
+
+
+def child_exit(server, worker):
+    """Drop live gauges of a worker that exited"""
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
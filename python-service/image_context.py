@@ -0,0 +1,69 @@
+"""
+Image Context
+Decode a screenshot once and share it across every step of a request
+"""
+
+from io import BytesIO
+from typing import Tuple
+
+import numpy as np
+from PIL import Image
+
+from image_encoding import EncodedImage, encode_for_vision, passthrough
+
+
+class ImageContext:
+    """
+    A decoded screenshot for one request
+
+    The source bytes are decoded exactly once into a read-only pixel array.
+    Crops are numpy views into that array (no copy, no disk I/O) and are
+    encoded straight into in-memory buffers. Each request owns its context,
+    so concurrent requests never share crop buffers.
+    """
+
+    def __init__(self, data: bytes):
+        self.data = data
+
+        with Image.open(BytesIO(data)) as image:
+            self.format = image.format
+            image.load()
+            if image.mode not in ("RGB", "RGBA"):
+                has_alpha = "A" in image.mode or "transparency" in image.info
+                image = image.convert("RGBA" if has_alpha else "RGB")
+            self.pixels = np.asarray(image)
+
+        self.pixels.flags.writeable = False
+        self.height, self.width = self.pixels.shape[:2]
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        return self.width, self.height
+
+    def clamp(self, bbox: Tuple[int, int, int, int]) -> Tuple[int, int, int, int]:
+        """Clamp an (x1, y1, x2, y2) box to the image bounds"""
+        x1, y1, x2, y2 = (int(v) for v in bbox)
+        x1 = max(0, min(x1, self.width))
+        x2 = max(x1, min(x2, self.width))
+        y1 = max(0, min(y1, self.height))
+        y2 = max(y1, min(y2, self.height))
+        return x1, y1, x2, y2
+
+    def crop(self, bbox: Tuple[int, int, int, int]) -> np.ndarray:
+        """Zero-copy view of a region (read-only)"""
+        x1, y1, x2, y2 = self.clamp(bbox)
+        return self.pixels[y1:y2, x1:x2]
+
+    def encode(self, task: str = "detection") -> EncodedImage:
+        """Encode the full screenshot for a vision call (source bytes are reused when possible)"""
+        encoded = passthrough(self.data, self.format, self.size, task)
+        if encoded is not None:
+            return encoded
+        return encode_for_vision(Image.fromarray(self.pixels), task)
+
+    def encode_crop(self, bbox: Tuple[int, int, int, int], task: str = "block") -> EncodedImage:
+        """Encode a region into an in-memory buffer for a vision call"""
+        region = self.crop(bbox)
+        if region.size == 0:
+            raise ValueError(f"Empty crop {bbox} for {self.width}x{self.height} image")
+        return encode_for_vision(Image.fromarray(np.ascontiguousarray(region)), task)
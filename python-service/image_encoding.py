@@ -0,0 +1,227 @@
+"""
+Vision Payload Encoding
+Chooses the size, format and `detail` level of images sent to OpenAI vision models
+"""
+
+import base64
+import math
+from io import BytesIO
+from typing import Optional, Tuple
+
+from PIL import Image
+
+from app_config import (
+    VISION_IMAGE_FORMAT,
+    VISION_JPEG_QUALITY,
+    VISION_MAX_LONG_SIDE,
+    VISION_MAX_SHORT_SIDE,
+    VISION_LOW_DETAIL_MAX,
+)
+
+# Tasks that need the model to read pixel positions (never sent as low detail)
+DETECTION_TASKS = ("detection", "layout")
+
+# Below this many pixels both PNG and JPEG are tried and the smaller one is sent
+SMALL_IMAGE_PIXELS = 512 * 512
+
+# Larger images with at most this many distinct colours (sampled) are flat UI and go out as PNG
+FLAT_IMAGE_MAX_COLORS = 1024
+
+PIL_FORMATS = {"jpeg": "JPEG", "png": "PNG", "webp": "WEBP"}
+
+# Source formats that can be uploaded as-is when no resize is needed
+PASSTHROUGH_FORMATS = ("JPEG", "PNG", "WEBP")
+
+
+class EncodedImage:
+    """
+    An image ready to be sent to a vision model
+
+    width/height are the dimensions the model sees; original_width/
+    original_height are the source dimensions. Coordinates the model
+    returns are in the sent space and must go through to_original().
+    """
+
+    def __init__(
+        self,
+        data: bytes,
+        mime_type: str,
+        detail: str,
+        size: Tuple[int, int],
+        original_size: Tuple[int, int]
+    ):
+        self.data = data
+        self.mime_type = mime_type
+        self.detail = detail
+        self.width, self.height = size
+        self.original_width, self.original_height = original_size
+        self.base64 = base64.b64encode(data).decode("utf-8")
+
+    @property
+    def data_url(self) -> str:
+        return f"data:{self.mime_type};base64,{self.base64}"
+
+    @property
+    def scaled(self) -> bool:
+        return (self.width, self.height) != (self.original_width, self.original_height)
+
+    def image_url(self) -> dict:
+        """`image_url` content part for the chat completions API"""
+        return {"url": self.data_url, "detail": self.detail}
+
+    def to_original(self, bbox: Tuple[int, int, int, int]) -> Tuple[int, int, int, int]:
+        """Map an (x1, y1, x2, y2) box from sent pixels back to original pixels"""
+        if not self.scaled:
+            return tuple(bbox)
+
+        sx = self.original_width / self.width
+        sy = self.original_height / self.height
+        x1, y1, x2, y2 = bbox
+        return (
+            max(0, min(round(x1 * sx), self.original_width)),
+            max(0, min(round(y1 * sy), self.original_height)),
+            max(0, min(round(x2 * sx), self.original_width)),
+            max(0, min(round(y2 * sy), self.original_height)),
+        )
+
+    def vision_tokens(self) -> int:
+        """Prompt tokens OpenAI bills for this image (85 base + 170 per 512px tile at high detail)"""
+        if self.detail == "low":
+            return 85
+        return 85 + 170 * math.ceil(self.width / 512) * math.ceil(self.height / 512)
+
+    def describe(self) -> dict:
+        """Payload summary for response metadata"""
+        return {
+            "width": self.width,
+            "height": self.height,
+            "mimeType": self.mime_type,
+            "detail": self.detail,
+            "bytes": len(self.data),
+        }
+
+
+def target_size(width: int, height: int, task: str) -> Tuple[Tuple[int, int], str]:
+    """
+    Pick the sent dimensions and detail level for an image
+
+    OpenAI fits high-detail images into VISION_MAX_LONG_SIDE and then scales
+    the short side down to VISION_MAX_SHORT_SIDE, so pixels beyond that are
+    uploaded and then thrown away. Small block crops fit into a single
+    low-detail tile and are sent with detail=low.
+
+    Returns:
+        ((width, height), detail)
+    """
+    if task not in DETECTION_TASKS and max(width, height) <= VISION_LOW_DETAIL_MAX:
+        return (width, height), "low"
+
+    scale = 1.0
+    if VISION_MAX_LONG_SIDE > 0:
+        scale = min(scale, VISION_MAX_LONG_SIDE / max(width, height))
+    if VISION_MAX_SHORT_SIDE > 0:
+        scale = min(scale, VISION_MAX_SHORT_SIDE / min(width, height))
+
+    if scale >= 1.0:
+        return (width, height), "high"
+    return (max(1, round(width * scale)), max(1, round(height * scale))), "high"
+
+
+def _save(image: Image.Image, fmt: str) -> bytes:
+    buffer = BytesIO()
+    if fmt == "JPEG":
+        image.save(buffer, format="JPEG", quality=VISION_JPEG_QUALITY, optimize=True)
+    elif fmt == "WEBP":
+        image.save(buffer, format="WEBP", quality=VISION_JPEG_QUALITY, method=4)
+    else:
+        image.save(buffer, format="PNG", optimize=False)
+    return buffer.getvalue()
+
+
+def _is_flat(image: Image.Image) -> bool:
+    """Whether an image has a small palette (flat UI) rather than photographic content"""
+    sample = image.convert("RGB").reduce(4) if min(image.size) >= 64 else image.convert("RGB")
+    return sample.getcolors(FLAT_IMAGE_MAX_COLORS) is not None
+
+
+def _encode_pixels(image: Image.Image) -> Tuple[bytes, str]:
+    """Encode with the configured format; 'auto' picks by transparency, size and palette"""
+    has_alpha = image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+    fmt = PIL_FORMATS.get(VISION_IMAGE_FORMAT)
+
+    if fmt is None:  # auto
+        if has_alpha:
+            fmt = "PNG"
+        elif image.width * image.height <= SMALL_IMAGE_PIXELS:
+            # Flat UI crops are often smaller as PNG; trying both is cheap at this size
+            rgb = image.convert("RGB")
+            png, jpeg = _save(rgb, "PNG"), _save(rgb, "JPEG")
+            return (png, "PNG") if len(png) <= len(jpeg) else (jpeg, "JPEG")
+        else:
+            fmt = "PNG" if _is_flat(image) else "JPEG"
+
+    if fmt == "JPEG" or (fmt == "WEBP" and not has_alpha):
+        image = image.convert("RGB")
+    elif image.mode not in ("RGB", "RGBA", "L", "LA"):
+        image = image.convert("RGBA" if has_alpha else "RGB")
+    return _save(image, fmt), fmt
+
+
+def encode_for_vision(image: Image.Image, task: str = "detection") -> EncodedImage:
+    """
+    Encode a decoded image for a vision model call
+
+    Args:
+        image: PIL image (full screenshot or block crop)
+        task: "detection" / "layout" (coordinates matter) or "block" (HTML for a crop)
+
+    Returns:
+        EncodedImage
+    """
+    original_size = image.size
+    size, detail = target_size(image.width, image.height, task)
+    if size != original_size:
+        image = image.resize(size, Image.LANCZOS)
+
+    data, fmt = _encode_pixels(image)
+    return EncodedImage(data, Image.MIME[fmt], detail, size, original_size)
+
+
+def passthrough(
+    data: bytes,
+    image_format: Optional[str],
+    size: Tuple[int, int],
+    task: str = "detection"
+) -> Optional[EncodedImage]:
+    """
+    Send already-encoded bytes unchanged when the policy would not resize them
+
+    Avoids a second encode (and a second JPEG generation loss). Returns None
+    when the image has to be re-encoded.
+    """
+    target, detail = target_size(size[0], size[1], task)
+    if target != tuple(size) or VISION_IMAGE_FORMAT != "auto" or image_format not in PASSTHROUGH_FORMATS:
+        return None
+    return EncodedImage(data, Image.MIME[image_format], detail, target, target)
+
+
+def encode_bytes_for_vision(data: bytes, task: str = "detection") -> EncodedImage:
+    """Encode downloaded image bytes for a vision model call"""
+    image = Image.open(BytesIO(data))
+    encoded = passthrough(data, image.format, image.size, task)
+    if encoded is not None:
+        return encoded
+    return encode_for_vision(image, task)
+
+
+def rescale_bboxes(bboxes: dict, encoded: Optional[EncodedImage]) -> dict:
+    """Map {label: bbox} from sent pixels back to original pixels, dropping boxes that collapse"""
+    if encoded is None or not encoded.scaled:
+        return bboxes
+
+    rescaled = {}
+    for label, bbox in bboxes.items():
+        x1, y1, x2, y2 = encoded.to_original(bbox)
+        if x2 > x1 and y2 > y1:
+            rescaled[label] = (x1, y1, x2, y2)
+    return rescaled
@@ -0,0 +1,227 @@
+"""
+Image Fetcher
+Shared image ingestion for all services: pooled keep-alive HTTP clients,
+in-memory streaming downloads with a size cap, and ETag/Last-Modified revalidation
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import httpx
+
+from app_config import (
+    IMAGE_FETCH_MAX_BYTES,
+    IMAGE_FETCH_TIMEOUT,
+    IMAGE_FETCH_MAX_CONNECTIONS,
+    IMAGE_VALIDATOR_CACHE_MB,
+)
+from metrics import stage
+
+
+class ImageTooLargeError(ValueError):
+    """Raised when an image exceeds IMAGE_FETCH_MAX_BYTES"""
+
+
+class ImageFetcher:
+    """
+    Downloads screenshots into memory
+
+    One async and one sync client are shared by every caller, so requests
+    to the storage host reuse pooled connections instead of paying a TLS
+    handshake each time. Responses that carry an ETag or Last-Modified
+    header are kept in a small store and revalidated with a conditional GET;
+    a 304 returns the stored bytes without re-downloading them.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = IMAGE_FETCH_MAX_BYTES,
+        timeout: float = IMAGE_FETCH_TIMEOUT,
+        max_connections: int = IMAGE_FETCH_MAX_CONNECTIONS,
+        validator_cache_bytes: int = IMAGE_VALIDATOR_CACHE_MB * 1024 * 1024
+    ):
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections
+        )
+        self.validator_cache_bytes = validator_cache_bytes
+        self._validated: "OrderedDict[str, Tuple[Dict[str, str], bytes]]" = OrderedDict()
+        self._validated_bytes = 0
+        self._lock = threading.Lock()
+        self._async_client: Optional[httpx.AsyncClient] = None
+        self._sync_client: Optional[httpx.Client] = None
+        self.revalidated = 0
+        self.downloaded = 0
+
+    # ------------------------------------------------------------------
+    # Clients
+    # ------------------------------------------------------------------
+
+    def _get_async_client(self) -> httpx.AsyncClient:
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=self.limits,
+                follow_redirects=True
+            )
+        return self._async_client
+
+    def _get_sync_client(self) -> httpx.Client:
+        with self._lock:
+            if self._sync_client is None:
+                self._sync_client = httpx.Client(
+                    timeout=self.timeout,
+                    limits=self.limits,
+                    follow_redirects=True
+                )
+            return self._sync_client
+
+    # ------------------------------------------------------------------
+    # Revalidation store
+    # ------------------------------------------------------------------
+
+    def _conditional_headers(self, url: str) -> Dict[str, str]:
+        """If-None-Match / If-Modified-Since headers for a previously seen URL"""
+        with self._lock:
+            entry = self._validated.get(url)
+            if entry is None:
+                return {}
+            self._validated.move_to_end(url)
+            validators = entry[0]
+
+        headers = {}
+        if "etag" in validators:
+            headers["If-None-Match"] = validators["etag"]
+        if "last-modified" in validators:
+            headers["If-Modified-Since"] = validators["last-modified"]
+        return headers
+
+    def _stored_content(self, url: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._validated.get(url)
+            if entry is not None:
+                self.revalidated += 1
+                return entry[1]
+        return None
+
+    def _remember(self, url: str, response: httpx.Response, content: bytes):
+        """Keep the body of responses that can be revalidated later"""
+        validators = {
+            name: response.headers[name]
+            for name in ("etag", "last-modified")
+            if name in response.headers
+        }
+        if not validators or len(content) > self.validator_cache_bytes:
+            return
+
+        with self._lock:
+            previous = self._validated.pop(url, None)
+            if previous is not None:
+                self._validated_bytes -= len(previous[1])
+            self._validated[url] = (validators, content)
+            self._validated_bytes += len(content)
+            while self._validated_bytes > self.validator_cache_bytes:
+                _, (_, evicted) = self._validated.popitem(last=False)
+                self._validated_bytes -= len(evicted)
+
+    def _check_declared_size(self, url: str, response: httpx.Response):
+        declared = response.headers.get("content-length")
+        if declared is not None and declared.isdigit() and int(declared) > self.max_bytes:
+            raise ImageTooLargeError(
+                f"Image at {url} is {declared} bytes (limit {self.max_bytes})"
+            )
+
+    def _append_chunk(self, url: str, buffer: bytearray, chunk: bytes):
+        buffer.extend(chunk)
+        if len(buffer) > self.max_bytes:
+            raise ImageTooLargeError(f"Image at {url} exceeds {self.max_bytes} bytes")
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+
+    async def fetch(self, url: str) -> bytes:
+        """Download an image into memory without blocking the event loop"""
+        with stage("download"):
+            client = self._get_async_client()
+            headers = self._conditional_headers(url)
+            while True:
+                async with client.stream("GET", url, headers=headers) as response:
+                    if response.status_code == 304 and headers:
+                        content = self._stored_content(url)
+                        if content is not None:
+                            return content
+                        # Stored body was evicted since the request went out: fetch it in full
+                        headers = {}
+                        continue
+                    response.raise_for_status()
+                    self._check_declared_size(url, response)
+
+                    buffer = bytearray()
+                    async for chunk in response.aiter_bytes():
+                        self._append_chunk(url, buffer, chunk)
+                break
+
+            content = bytes(buffer)
+            self._remember(url, response, content)
+            self.downloaded += 1
+            return content
+
+    def fetch_sync(self, url: str) -> bytes:
+        """Download an image into memory (for synchronous callers and worker threads)"""
+        with stage("download"):
+            client = self._get_sync_client()
+            headers = self._conditional_headers(url)
+            while True:
+                with client.stream("GET", url, headers=headers) as response:
+                    if response.status_code == 304 and headers:
+                        content = self._stored_content(url)
+                        if content is not None:
+                            return content
+                        # Stored body was evicted since the request went out: fetch it in full
+                        headers = {}
+                        continue
+                    response.raise_for_status()
+                    self._check_declared_size(url, response)
+
+                    buffer = bytearray()
+                    for chunk in response.iter_bytes():
+                        self._append_chunk(url, buffer, chunk)
+                break
+
+            content = bytes(buffer)
+            self._remember(url, response, content)
+            self.downloaded += 1
+            return content
+
+    async def aclose(self):
+        """Close pooled connections"""
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+        if self._sync_client is not None:
+            self._sync_client.close()
+            self._sync_client = None
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "downloaded": self.downloaded,
+                "revalidated": self.revalidated,
+                "storedUrls": len(self._validated),
+                "storedBytes": self._validated_bytes,
+            }
+
+
+_fetcher_instance: Optional[ImageFetcher] = None
+
+
+def get_fetcher() -> ImageFetcher:
+    """Get or create the singleton ImageFetcher instance"""
+    global _fetcher_instance
+    if _fetcher_instance is None:
+        _fetcher_instance = ImageFetcher()
+    return _fetcher_instance
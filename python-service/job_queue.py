@@ -0,0 +1,437 @@
+"""
+Layout Job Queue
+Persistent SQLite job queue and background workers for long-running layout
+generation, so clients submit, disconnect and poll (or subscribe) instead of
+holding a connection for minutes
+"""
+
+import asyncio
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from app_config import (
+    JOB_DB_PATH,
+    JOB_WORKERS,
+    JOB_LEASE_SECONDS,
+    JOB_MAX_ATTEMPTS,
+    JOB_TTL_HOURS,
+    JOB_POLL_INTERVAL,
+    LAYOUT_MAX_BLOCK_CALLS,
+)
+from metrics import current_endpoint
+
+TERMINAL_STATES = ("succeeded", "failed")
+
+
+class JobStore:
+    """
+    Jobs and their progress events in SQLite (WAL, shared by every server worker)
+
+    A job is claimed with a lease that its worker keeps extending. When a
+    process dies, the lease runs out and another worker (or the restarted
+    process) picks the job up again, up to max_attempts.
+    """
+
+    def __init__(
+        self,
+        path: str = JOB_DB_PATH,
+        lease_seconds: float = JOB_LEASE_SECONDS,
+        max_attempts: int = JOB_MAX_ATTEMPTS,
+        ttl_seconds: float = JOB_TTL_HOURS * 3600
+    ):
+        self.path = Path(path)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max(1, max_attempts)
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Autocommit; claims use explicit BEGIN IMMEDIATE so they are atomic across processes
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=10, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                params TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                worker TEXT,
+                lease_until REAL,
+                result TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at)")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS job_events (
+                job_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                event TEXT NOT NULL,
+                data TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (job_id, seq)
+            )
+            """
+        )
+
+    def submit(self, kind: str, params: Dict[str, Any]) -> str:
+        """Queue a job and return its id"""
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, kind, params, status, created_at) VALUES (?, ?, ?, 'queued', ?)",
+                (job_id, kind, json.dumps(params), time.time())
+            )
+        return job_id
+
+    def claim(self, worker: str) -> Optional[Dict[str, Any]]:
+        """
+        Lease the oldest runnable job: queued, or running with an expired lease
+
+        Returns the job (with its decoded params) or None when the queue is empty.
+        Jobs whose lease expired max_attempts times are marked failed instead.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'failed', error = 'Worker lost too many times', finished_at = ? "
+                    "WHERE status = 'running' AND lease_until < ? AND attempts >= ?",
+                    (now, now, self.max_attempts)
+                )
+                row = self._conn.execute(
+                    "SELECT * FROM jobs WHERE status = 'queued' OR (status = 'running' AND lease_until < ?) "
+                    "ORDER BY created_at LIMIT 1",
+                    (now,)
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = 'running', worker = ?, lease_until = ?, "
+                        "attempts = attempts + 1, started_at = COALESCE(started_at, ?) WHERE id = ?",
+                        (worker, now + self.lease_seconds, now, row["id"])
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+        if row is None:
+            return None
+        job = dict(row)
+        job["params"] = json.loads(job["params"])
+        job["attempts"] += 1
+        return job
+
+    def heartbeat(self, job_id: str, worker: str) -> bool:
+        """Extend a lease; False means the job was taken over by another worker"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET lease_until = ? WHERE id = ? AND worker = ? AND status = 'running'",
+                (time.time() + self.lease_seconds, job_id, worker)
+            )
+        return cursor.rowcount == 1
+
+    def add_event(self, job_id: str, event: str, data: Dict[str, Any]) -> int:
+        """Append a progress event; returns its sequence number"""
+        with self._lock:
+            seq = self._conn.execute(
+                "SELECT COALESCE(MAX(seq), 0) + 1 FROM job_events WHERE job_id = ?", (job_id,)
+            ).fetchone()[0]
+            self._conn.execute(
+                "INSERT INTO job_events (job_id, seq, event, data, created_at) VALUES (?, ?, ?, ?, ?)",
+                (job_id, seq, event, json.dumps(data), time.time())
+            )
+        return seq
+
+    def events(self, job_id: str, after: int = 0) -> List[Tuple[int, str, Dict[str, Any]]]:
+        """Events with a sequence number above `after`, oldest first"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT seq, event, data FROM job_events WHERE job_id = ? AND seq > ? ORDER BY seq",
+                (job_id, after)
+            ).fetchall()
+        return [(row["seq"], row["event"], json.loads(row["data"])) for row in rows]
+
+    def finish(self, job_id: str, worker: str, result: Dict[str, Any]):
+        self._complete(job_id, worker, "succeeded", result=json.dumps(result))
+
+    def fail(self, job_id: str, worker: str, error: str):
+        self._complete(job_id, worker, "failed", error=error)
+
+    def _complete(self, job_id: str, worker: str, status: str, result: Optional[str] = None, error: Optional[str] = None):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?, lease_until = NULL "
+                "WHERE id = ? AND worker = ?",
+                (status, result, error, time.time(), job_id, worker)
+            )
+
+    def release(self, job_id: str, worker: str):
+        """Put a job back in the queue without counting the attempt (graceful shutdown)"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'queued', worker = NULL, lease_until = NULL, attempts = attempts - 1 "
+                "WHERE id = ? AND worker = ? AND status = 'running'",
+                (job_id, worker)
+            )
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """A job's status, with partial block results assembled from its events"""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+
+        blocks: Dict[str, Dict[str, Any]] = {}
+        for _, event, data in self.events(job_id):
+            if event == "block":
+                blocks.setdefault(data["name"], {}).update(bbox=data["bbox"], members=data.get("members", []))
+            elif event == "html":
+                blocks.setdefault(data["name"], {})["html"] = data["html"]
+
+        return {
+            "jobId": row["id"],
+            "kind": row["kind"],
+            "status": row["status"],
+            "attempts": row["attempts"],
+            "createdAt": row["created_at"],
+            "startedAt": row["started_at"],
+            "finishedAt": row["finished_at"],
+            "blocks": blocks,
+            "result": json.loads(row["result"]) if row["result"] else None,
+            "error": row["error"],
+        }
+
+    def status(self, job_id: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return row["status"] if row is not None else None
+
+    def purge(self) -> int:
+        """Delete finished jobs (and their events) older than the TTL"""
+        cutoff = time.time() - self.ttl_seconds
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "DELETE FROM job_events WHERE job_id IN "
+                    "(SELECT id FROM jobs WHERE status IN ('succeeded', 'failed') AND finished_at < ?)",
+                    (cutoff,)
+                )
+                cursor = self._conn.execute(
+                    "DELETE FROM jobs WHERE status IN ('succeeded', 'failed') AND finished_at < ?", (cutoff,)
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return cursor.rowcount
+
+    def stats(self) -> Dict[str, int]:
+        """Job counts by status"""
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+
+_store_instance: Optional[JobStore] = None
+
+
+def get_job_store() -> JobStore:
+    """Get or create the singleton JobStore instance"""
+    global _store_instance
+    if _store_instance is None:
+        _store_instance = JobStore()
+    return _store_instance
+
+
+JobHandler = Callable[[Dict[str, Any]], AsyncIterator[Tuple[str, Dict[str, Any]]]]
+
+
+async def _generate_layout(params: Dict[str, Any]) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    """Layout generation as a job: the /generate-layout/stream events"""
+    from screencoder_wrapper import get_generator
+    async for event, data in get_generator().generate_layout_stream(
+        params["imageUrl"],
+        concurrency=params["blockConcurrency"],
+        block_timeout=params["blockTimeout"],
+        max_block_calls=params.get("maxBlockCalls", LAYOUT_MAX_BLOCK_CALLS),  # Jobs queued before the option existed
+        use_cache=not params["bypassCache"]
+    ):
+        yield event, data
+
+
+JOB_HANDLERS: Dict[str, JobHandler] = {
+    "generate-layout": _generate_layout,
+}
+
+
+class JobRunner:
+    """
+    Background workers of one process, pulling jobs from the shared store
+
+    Each worker runs one job at a time. Progress events are persisted as
+    they happen; the last (`done`) event becomes the job result.
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS, poll_interval: float = JOB_POLL_INTERVAL):
+        self.workers = max(0, workers)
+        self.poll_interval = poll_interval
+        self.name = f"{socket.gethostname()}:{os.getpid()}"
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def start(self):
+        """Start the workers on the running event loop"""
+        if self._tasks or not self.workers:
+            return
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._work(f"{self.name}:{i}")) for i in range(self.workers)]
+        print(f"✅ Job workers started ({self.workers} in {self.name})")
+
+    async def run(self):
+        """Start the workers and run until cancelled"""
+        self.start()
+        try:
+            await asyncio.gather(*self._tasks)
+        finally:
+            await self.stop()
+
+    def notify(self):
+        """Wake idle workers of this process (a job was just submitted)"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def stop(self):
+        """Cancel the workers; running jobs go back to the queue"""
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _work(self, worker: str):
+        store = get_job_store()
+        purged_at = 0.0
+        while True:
+            if time.time() - purged_at > 3600:
+                purged_at = time.time()
+                await asyncio.to_thread(store.purge)
+
+            job = await asyncio.to_thread(store.claim, worker)
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._run(store, job, worker)
+
+    async def _run(self, store: JobStore, job: Dict[str, Any], worker: str):
+        job_id = job["id"]
+        handler = JOB_HANDLERS.get(job["kind"])
+        if handler is None:
+            await asyncio.to_thread(store.fail, job_id, worker, f"Unknown job kind: {job['kind']}")
+            return
+
+        print(f"🧵 Job {job_id} ({job['kind']}) started on {worker}, attempt {job['attempts']}")
+        token = current_endpoint.set(f"job:{job['kind']}")
+        runner = asyncio.create_task(self._consume(store, job, handler))
+        try:
+            # Keep the lease alive; stop if another worker took the job over
+            while not runner.done():
+                await asyncio.wait({runner}, timeout=store.lease_seconds / 3)
+                if not runner.done() and not await asyncio.to_thread(store.heartbeat, job_id, worker):
+                    print(f"⚠️  Job {job_id} lease lost, abandoning it")
+                    runner.cancel()
+                    return
+            result = runner.result()
+            await asyncio.to_thread(store.finish, job_id, worker, result)
+            print(f"✅ Job {job_id} finished")
+        except asyncio.CancelledError:
+            runner.cancel()
+            await asyncio.to_thread(store.release, job_id, worker)
+            raise
+        except Exception as e:
+            print(f"❌ Job {job_id} failed: {e}")
+            await asyncio.to_thread(store.add_event, job_id, "error", {"detail": str(e)})
+            await asyncio.to_thread(store.fail, job_id, worker, str(e))
+        finally:
+            current_endpoint.reset(token)
+
+    async def _consume(self, store: JobStore, job: Dict[str, Any], handler: JobHandler) -> Dict[str, Any]:
+        """Run the handler, persisting each event; returns the `done` event's data"""
+        # Retried jobs replay their events; clients key blocks by name, so duplicates just overwrite
+        await asyncio.to_thread(store.add_event, job["id"], "attempt", {"attempt": job["attempts"]})
+        result = None
+        async for event, data in handler(job["params"]):
+            if event == "done":
+                result = data
+            else:
+                await asyncio.to_thread(store.add_event, job["id"], event, data)
+        if result is None:
+            raise RuntimeError("Job finished without a result")
+        return result
+
+
+_runner_instance: Optional[JobRunner] = None
+
+
+def get_job_runner() -> JobRunner:
+    """Get or create the singleton JobRunner instance"""
+    global _runner_instance
+    if _runner_instance is None:
+        _runner_instance = JobRunner()
+    return _runner_instance
+
+
+async def job_events(job_id: str, after: int = 0) -> AsyncIterator[Tuple[int, str, Dict[str, Any]]]:
+    """
+    Follow a job: stored events after `after`, then new ones as they are
+    written (by any process), ending with `done` or `error` (also when the
+    job does not exist or is purged meanwhile)
+    """
+    store = get_job_store()
+    last_event = None
+    while True:
+        # Read the status first so events written just before completion are not missed
+        status = await asyncio.to_thread(store.status, job_id)
+        for seq, event, data in await asyncio.to_thread(store.events, job_id, after):
+            after, last_event = seq, event
+            yield seq, event, data
+        if status is None:
+            # Unknown job, or purged while being followed
+            yield after + 1, "error", {"detail": f"Job {job_id} not found"}
+            return
+        if status in TERMINAL_STATES:
+            job = await asyncio.to_thread(store.get, job_id)
+            if job is None:
+                yield after + 1, "error", {"detail": f"Job {job_id} not found"}
+                return
+            if job["status"] == "succeeded":
+                yield after + 1, "done", job["result"]
+            elif last_event != "error":
+                yield after + 1, "error", {"detail": job["error"]}
+            return
+        await asyncio.sleep(JOB_POLL_INTERVAL)
+
+
+if __name__ == "__main__":
+    # Dedicated worker process (set JOB_WORKERS=0 on the web servers to keep jobs off them)
+    asyncio.run(JobRunner(workers=max(1, int(os.getenv("JOB_PROCESS_WORKERS", 2)))).run())
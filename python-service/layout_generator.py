@@ -6,10 +6,8 @@ Converts UI screenshots into HTML/CSS layout code
 import os
 import sys
 import json
-import tempfile
 from pathlib import Path
 from typing import Optional, Dict, Any
-import requests
 from PIL import Image
 from io import BytesIO
 
@@ -23,6 +21,10 @@ UIED_PATH = Path(__file__).parent / "UIED"
 if UIED_PATH.exists() and str(UIED_PATH) not in sys.path:
     sys.path.insert(0, str(UIED_PATH))
 
+from image_fetcher import get_fetcher
+from image_encoding import encode_bytes_for_vision
+from llm_scheduler import estimate_tokens, get_llm_scheduler
+
 
 class LayoutGenerator:
     """Generate HTML/CSS layout from screenshots using ScreenCoder"""
@@ -40,17 +42,9 @@ class LayoutGenerator:
         if not self.openai_api_key:
             print("⚠️  Warning: OPENAI_API_KEY not set. Layout generation will be limited.")
     
-    def _download_image(self, image_url: str, save_path: Path) -> Path:
-        """Download image from URL and save to disk"""
-        response = requests.get(image_url, stream=True, timeout=30)
-        response.raise_for_status()
-        
-        # Save image
-        with open(save_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                f.write(chunk)
-        
-        return save_path
+    def _download_image(self, image_url: str) -> bytes:
+        """Download image from URL into memory (shared pooled fetcher)"""
+        return get_fetcher().fetch_sync(image_url)
     
     def generate_layout(
         self,
@@ -77,49 +71,40 @@ class LayoutGenerator:
         if not self.openai_api_key:
             raise RuntimeError("OPENAI_API_KEY is required for layout generation")
         
-        # Create temporary directory for processing
-        with tempfile.TemporaryDirectory() as temp_dir:
-            temp_path = Path(temp_dir)
+        # Download image
+        image_bytes = self._download_image(image_url)
+        
+        # Read dimensions from the image header
+        img = Image.open(BytesIO(image_bytes))
+        width, height = img.size
+        
+        try:
+            # TODO: Integrate ScreenCoder's block_parser and html_generator
+            # For now, use a simplified approach with GPT-4 Vision
+            layout_code = self._generate_with_gpt_vision(
+                image_bytes,
+                model,
+                include_css,
+                output_format
+            )
             
-            # Download image
-            image_name = "screenshot.png"
-            input_path = temp_path / image_name
-            self._download_image(image_url, input_path)
-            
-            # Load image to get dimensions
-            img = Image.open(input_path)
-            width, height = img.size
-            
-            try:
-                # Import ScreenCoder modules
-                sys.path.insert(0, str(SCREENCODER_PATH))
-                
-                # TODO: Integrate ScreenCoder's block_parser and html_generator
-                # For now, use a simplified approach with GPT-4 Vision
-                layout_code = self._generate_with_gpt_vision(
-                    str(input_path),
-                    model,
-                    include_css,
-                    output_format
-                )
-                
-                return {
-                    "html": layout_code.get("html", ""),
-                    "css": layout_code.get("css", "") if include_css else "",
-                    "metadata": {
-                        "imageWidth": width,
-                        "imageHeight": height,
-                        "model": model,
-                        "format": output_format
-                    }
+            return {
+                "html": layout_code.get("html", ""),
+                "css": layout_code.get("css", "") if include_css else "",
+                "metadata": {
+                    "imageWidth": width,
+                    "imageHeight": height,
+                    "model": model,
+                    "format": output_format
                 }
-                
-            except Exception as e:
-                raise RuntimeError(f"Layout generation failed: {str(e)}")
+            }
+            
+        except Exception as e:
+            raise RuntimeError(f"Layout generation failed: {str(e)}")
     
     def _generate_with_gpt_vision(
         self,
-        image_path: str,
+        image_bytes: bytes,
         model: str,
         include_css: bool,
         output_format: str
@@ -128,7 +113,7 @@ class LayoutGenerator:
         Generate layout using GPT-4 Vision API
         
         Args:
-            image_path: Path to the screenshot
+            image_bytes: Encoded screenshot
             model: GPT model to use
             include_css: Whether to include CSS
             output_format: Output format
@@ -136,15 +121,13 @@ class LayoutGenerator:
         Returns:
             dict with html and css keys
         """
-        import base64
         from openai import OpenAI
         
-        # Initialize OpenAI client
-        client = OpenAI(api_key=self.openai_api_key)
+        # Initialize OpenAI client (the LLM scheduler retries)
+        client = OpenAI(api_key=self.openai_api_key, max_retries=0)
         
-        # Encode image as base64
-        with open(image_path, "rb") as image_file:
-            image_data = base64.b64encode(image_file.read()).decode('utf-8')
+        # Resize/re-encode to what the model actually uses
+        encoded = encode_bytes_for_vision(image_bytes, "layout")
         
         # Create prompt based on output format
         if output_format == "react":
@@ -186,7 +169,7 @@ Also provide custom CSS if needed:
             prompt = f"Generate {output_format} code from this UI screenshot. Use semantic HTML and modern CSS practices."
         
         # Call GPT-4 Vision API
-        response = client.chat.completions.create(
+        response = get_llm_scheduler().call_sync(lambda: client.chat.completions.create(
             model=model,
             messages=[
                 {
@@ -198,17 +181,14 @@ Also provide custom CSS if needed:
                         },
                         {
                             "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/png;base64,{image_data}",
-                                "detail": "high"
-                            }
+                            "image_url": encoded.image_url()
                         }
                     ]
                 }
             ],
             max_tokens=4000,
             temperature=0.1
-        )
+        ), "bulk", model, estimate_tokens(prompt, 4000, encoded.vision_tokens()))
         
         # Parse response
         content = response.choices[0].message.content
@@ -0,0 +1,419 @@
+"""
+LLM Call Scheduler
+Every model call goes through one scheduler per process: a concurrency cap,
+per-model request/token buckets, priority classes and 429-aware retries
+"""
+
+import asyncio
+import email.utils
+import heapq
+import itertools
+import random
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set, TypeVar
+
+from app_config import (
+    LLM_MAX_CONCURRENCY,
+    LLM_REQUESTS_PER_MINUTE,
+    LLM_TOKENS_PER_MINUTE,
+    LLM_MAX_RETRIES,
+    LLM_BACKOFF_BASE,
+    LLM_BACKOFF_MAX,
+)
+from metrics import LLM_IN_FLIGHT, LLM_QUEUE_DEPTH, LLM_QUEUE_WAIT, LLM_RETRIES
+
+T = TypeVar("T")
+
+# Lower runs first: hotspot detection is interactive, layout generation is bulk
+PRIORITIES = {"interactive": 0, "bulk": 1}
+
+
+class TokenBucket:
+    """Refills `per_minute` units per minute up to a one-minute burst (0 = unlimited)"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until `amount` is available (0 = now)"""
+        if not self.capacity:
+            return 0.0
+        self._refill(now)
+        amount = min(amount, self.capacity)  # A call larger than the burst still runs once the bucket is full
+        return max(0.0, (amount - self.level) / self.rate)
+
+    def take(self, amount: float):
+        if self.capacity:
+            self.level -= min(amount, self.capacity)
+
+    def refund(self, amount: float):
+        """Give back an over-estimate once the real usage is known"""
+        if self.capacity:
+            self.level = min(self.capacity, self.level + amount)
+
+
+class _Ticket:
+    """One scheduled call: waits in the queue, then holds a concurrency slot"""
+
+    def __init__(self, priority: str, model: str, tokens: int, future: asyncio.Future):
+        self.priority = priority
+        self.model = model
+        self.tokens = tokens
+        self.future = future
+        self.enqueued = time.perf_counter()
+
+
+def estimate_tokens(prompt: str, max_tokens: int, image_tokens: int = 0) -> int:
+    """
+    Tokens a call counts against the rate limit before it runs
+
+    OpenAI reserves max_tokens up front; prompt text is estimated at four
+    characters per token.
+    """
+    return len(prompt) // 4 + image_tokens + max_tokens
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    """Server-requested delay from retry-after-ms / Retry-After (seconds or HTTP date)"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if headers is None:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if value is None:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            when = email.utils.parsedate_to_datetime(value)
+            return max(0.0, when.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def retry_reason(error: Exception) -> Optional[str]:
+    """Why a failed call may be retried, or None if it must not be"""
+    import openai
+
+    if isinstance(error, openai.RateLimitError):
+        # An exhausted quota does not recover by waiting
+        return None if getattr(error, "code", None) == "insufficient_quota" else "rate_limit"
+    if isinstance(error, openai.APITimeoutError):
+        return "timeout"
+    if isinstance(error, openai.APIConnectionError):
+        return "connection"
+    if isinstance(error, openai.APIStatusError) and error.status_code >= 500:
+        return "server_error"
+    return None
+
+
+class LLMScheduler:
+    """
+    Admission control for model calls
+
+    - At most max_concurrency calls in flight
+    - Per-model token buckets for requests and (estimated) tokens per minute
+    - Waiting calls are served by priority class, then arrival order; a
+      call blocked by its model's bucket does not hold back other models
+    - Retryable failures (429, 5xx, timeouts, connection errors) are retried
+      with full-jitter exponential backoff, or after Retry-After when the
+      server sends one. A 429 also pauses every call for that long, since
+      the limit is shared.
+
+    Queue state lives on one event loop; calls from other loops or from
+    plain threads (call_sync) are handed over to it.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        requests_per_minute: float = LLM_REQUESTS_PER_MINUTE,
+        tokens_per_minute: float = LLM_TOKENS_PER_MINUTE,
+        max_retries: int = LLM_MAX_RETRIES,
+        backoff_base: float = LLM_BACKOFF_BASE,
+        backoff_max: float = LLM_BACKOFF_MAX
+    ):
+        self.max_concurrency = max(1, max_concurrency)
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_retries = max(0, max_retries)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self._queue: List[tuple] = []  # (priority rank, seq, ticket)
+        self._seq = itertools.count()
+        self._buckets: Dict[str, tuple] = {}  # model -> (requests, tokens)
+        self._in_flight = 0
+        self._paused_until = 0.0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_lock = threading.Lock()
+
+    # -- queue (runs on self._loop) -------------------------------------
+
+    def _model_buckets(self, model: str) -> tuple:
+        if model not in self._buckets:
+            self._buckets[model] = (TokenBucket(self.requests_per_minute), TokenBucket(self.tokens_per_minute))
+        return self._buckets[model]
+
+    async def _acquire(self, priority: str, model: str, tokens: int) -> _Ticket:
+        ticket = _Ticket(priority, model, tokens, self._loop.create_future())
+        heapq.heappush(self._queue, (PRIORITIES.get(priority, len(PRIORITIES)), next(self._seq), ticket))
+        LLM_QUEUE_DEPTH.labels(priority).inc()
+        self._dispatch()
+        try:
+            await ticket.future
+        except asyncio.CancelledError:
+            if ticket.future.done() and not ticket.future.cancelled():
+                self._release(ticket)  # Granted just as the caller gave up
+            else:
+                self._queue = [entry for entry in self._queue if entry[2] is not ticket]
+                heapq.heapify(self._queue)
+                LLM_QUEUE_DEPTH.labels(priority).dec()
+            raise
+        return ticket
+
+    def _release(self, ticket: _Ticket, tokens_used: Optional[int] = None):
+        self._in_flight -= 1
+        LLM_IN_FLIGHT.dec()
+        if tokens_used is not None and tokens_used < ticket.tokens:
+            self._model_buckets(ticket.model)[1].refund(ticket.tokens - tokens_used)
+        self._dispatch()
+
+    def _pause(self, seconds: float):
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._dispatch()
+
+    def _dispatch(self):
+        """Grant waiting calls in priority order while slots and buckets allow"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        now = time.monotonic()
+        retry_in = self._paused_until - now
+        if retry_in > 0:
+            if self._queue:
+                self._timer = self._loop.call_later(retry_in, self._dispatch)
+            return
+
+        retry_in = None
+        blocked: Set[str] = set()
+        waiting = []
+        while self._queue and self._in_flight < self.max_concurrency:
+            entry = heapq.heappop(self._queue)
+            ticket = entry[2]
+            if ticket.future.done():  # Cancelled while queued
+                continue
+            requests, tokens = self._model_buckets(ticket.model)
+            wait = 0.0 if ticket.model in blocked else max(requests.wait_time(1, now), tokens.wait_time(ticket.tokens, now))
+            if ticket.model in blocked or wait > 0:
+                # Keep later calls for this model behind it, but let other models through
+                blocked.add(ticket.model)
+                waiting.append(entry)
+                if wait > 0:
+                    retry_in = wait if retry_in is None else min(retry_in, wait)
+                continue
+
+            requests.take(1)
+            tokens.take(ticket.tokens)
+            self._in_flight += 1
+            LLM_IN_FLIGHT.inc()
+            LLM_QUEUE_DEPTH.labels(ticket.priority).dec()
+            LLM_QUEUE_WAIT.labels(ticket.priority).observe(time.perf_counter() - ticket.enqueued)
+            ticket.future.set_result(None)
+
+        for entry in waiting:
+            heapq.heappush(self._queue, entry)
+        if retry_in is not None:
+            self._timer = self._loop.call_later(retry_in, self._dispatch)
+
+    # -- loop hand-over -------------------------------------------------
+
+    def _bind(self) -> asyncio.AbstractEventLoop:
+        """The scheduler's loop: the first loop that used it, or a private one for thread-only use"""
+        with self._loop_lock:
+            if self._loop is None or self._loop.is_closed():
+                try:
+                    self._loop = asyncio.get_running_loop()
+                except RuntimeError:
+                    self._loop = asyncio.new_event_loop()
+                    threading.Thread(target=self._loop.run_forever, name="llm-scheduler", daemon=True).start()
+            return self._loop
+
+    async def _on_loop(self, coro: Awaitable[T]) -> T:
+        """Await a queue operation on the scheduler's loop from any loop"""
+        loop = self._bind()
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            return await coro
+        future = asyncio.run_coroutine_threadsafe(coro, loop)
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            # Granted just as the caller gave up: hand the slot back
+            future.add_done_callback(
+                lambda done: None if done.cancelled() or done.exception() else
+                loop.call_soon_threadsafe(self._release, done.result())
+            )
+            raise
+
+    def _release_threadsafe(self, ticket: _Ticket, tokens_used: Optional[int] = None):
+        self._loop.call_soon_threadsafe(self._release, ticket, tokens_used)
+
+    def _pause_threadsafe(self, seconds: float):
+        self._loop.call_soon_threadsafe(self._pause, seconds)
+
+    # -- calls ------------------------------------------------------------
+
+    def _backoff(self, error: Exception, attempt: int) -> float:
+        delay = retry_after(error)
+        if delay is None:
+            delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        return min(delay, self.backoff_max)
+
+    def _retry_delay(self, error: Exception, attempt: int, model: str) -> Optional[float]:
+        """Seconds to wait before retrying a failed call, or None to give up"""
+        reason = retry_reason(error)
+        if reason is None or attempt == self.max_retries:
+            return None
+        delay = self._backoff(error, attempt)
+        LLM_RETRIES.labels(model, reason).inc()
+        print(f"⏳ {model} call failed ({reason}), retry {attempt + 1}/{self.max_retries} in {delay:.1f}s")
+        if reason == "rate_limit":
+            self._pause_threadsafe(delay)
+        return delay
+
+    async def _start(self, fn: Callable[[], Awaitable[T]], priority: str, model: str, tokens: int):
+        """Run fn under a slot, retrying; returns (result, ticket) with the slot still held"""
+        for attempt in range(self.max_retries + 1):
+            ticket = await self._on_loop(self._acquire(priority, model, tokens))
+            try:
+                return await fn(), ticket
+            except Exception as e:
+                self._release_threadsafe(ticket)
+                delay = self._retry_delay(e, attempt, model)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+            except BaseException:
+                self._release_threadsafe(ticket)
+                raise
+
+    async def call(
+        self,
+        fn: Callable[[], Awaitable[Any]],
+        priority: str,
+        model: str,
+        tokens: int
+    ) -> Any:
+        """
+        Run one model call (fn creates the request) under the scheduler
+
+        Args:
+            fn: Zero-argument coroutine function making the API call
+            priority: "interactive" or "bulk"
+            model: Model name (rate limits are per model)
+            tokens: Estimated tokens (see estimate_tokens); refunded down to
+                the real usage when the response reports it
+
+        Returns:
+            fn's result
+        """
+        result, ticket = await self._start(fn, priority, model, tokens)
+        usage = getattr(result, "usage", None)
+        self._release_threadsafe(ticket, getattr(usage, "total_tokens", None))
+        return result
+
+    @asynccontextmanager
+    async def stream(
+        self,
+        fn: Callable[[], Awaitable[Any]],
+        priority: str,
+        model: str,
+        tokens: int
+    ) -> AsyncIterator[Any]:
+        """Like call() for stream=True requests; the slot is held until the stream is consumed"""
+        stream, ticket = await self._start(fn, priority, model, tokens)
+        try:
+            yield stream
+        finally:
+            self._release_threadsafe(ticket)
+
+    def call_sync(self, fn: Callable[[], Any], priority: str, model: str, tokens: int) -> Any:
+        """
+        call() for blocking clients used from plain threads
+
+        Only admission runs on the scheduler's loop; fn runs in the calling
+        thread. Callers are often asyncio.to_thread workers, so handing fn
+        to the loop's executor could wait on a thread that never frees up.
+        """
+        loop = self._bind_for_thread()
+        for attempt in range(self.max_retries + 1):
+            ticket = asyncio.run_coroutine_threadsafe(self._acquire(priority, model, tokens), loop).result()
+            try:
+                result = fn()
+            except Exception as e:
+                self._release_threadsafe(ticket)
+                delay = self._retry_delay(e, attempt, model)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                continue
+            except BaseException:
+                self._release_threadsafe(ticket)
+                raise
+            usage = getattr(result, "usage", None)
+            self._release_threadsafe(ticket, getattr(usage, "total_tokens", None))
+            return result
+
+    def _bind_for_thread(self) -> asyncio.AbstractEventLoop:
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return self._bind()
+        raise RuntimeError("call_sync() would block the event loop; use await call()")
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue and bucket state"""
+        now = time.monotonic()
+        queued: Dict[str, int] = {}
+        for _, _, ticket in list(self._queue):
+            if not ticket.future.done():
+                queued[ticket.priority] = queued.get(ticket.priority, 0) + 1
+        return {
+            "inFlight": self._in_flight,
+            "maxConcurrency": self.max_concurrency,
+            "queued": queued,
+            "pausedFor": round(max(0.0, self._paused_until - now), 3),
+            "buckets": {
+                model: {"requests": round(requests.level, 1), "tokens": round(tokens.level)}
+                for model, (requests, tokens) in self._buckets.items()
+            },
+        }
+
+
+_scheduler_instance: Optional[LLMScheduler] = None
+
+
+def get_llm_scheduler() -> LLMScheduler:
+    """Get or create the singleton LLMScheduler instance"""
+    global _scheduler_instance
+    if _scheduler_instance is None:
+        _scheduler_instance = LLMScheduler()
+    return _scheduler_instance
@@ -3,13 +3,38 @@ UIED Detection Service
 FastAPI service for UI element detection using UIED
 """
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel, HttpUrl
-from typing import List, Optional
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+import asyncio
+import json
+import math
 import os
 from dotenv import load_dotenv
 
+from app_config import (
+    UIED_EXECUTION_MODE,
+    UIED_WORKING_HEIGHT,
+    LAYOUT_BLOCK_CONCURRENCY,
+    LAYOUT_BLOCK_TIMEOUT,
+    LAYOUT_MAX_BLOCK_CALLS,
+    DETECT_BATCH_CONCURRENCY,
+    DETECT_BATCH_MAX_URLS,
+    STARTUP_WARMUP,
+)
+from detection_cache import get_cache, content_hash
+from element_index import get_element_index
+from image_fetcher import get_fetcher, ImageTooLargeError
+from metrics import CONTENT_TYPE_LATEST, MetricsMiddleware, render_metrics, stage
+from profiling import ProfilingMiddleware, get_profile_store, is_admin, profiling_enabled
+from readiness import get_readiness
+from job_queue import get_job_runner, get_job_store, job_events
+from singleflight import flight_key, get_flight, normalize_url
+import box_ops
+
 load_dotenv()
 
 app = FastAPI(
@@ -27,12 +52,35 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Opt-in per-request profiles, listed on /debug/profiles
+app.add_middleware(ProfilingMiddleware)
+
+# Request latency and per-stage timings, exposed on /metrics
+app.add_middleware(MetricsMiddleware)
+
 
 # Request/Response models
 class DetectionRequest(BaseModel):
     imageUrl: HttpUrl
     includeLabels: bool = True  # OCR text extraction
     minConfidence: float = 0.7
+    bypassCache: bool = False  # Skip cached results (fresh result still refreshes the cache)
+    workingHeight: Optional[int] = None  # UIED working height in px (default UIED_WORKING_HEIGHT, 0 = full resolution)
+
+
+class LayoutRequest(DetectionRequest):
+    blockConcurrency: int = LAYOUT_BLOCK_CONCURRENCY  # Parallel per-block GPT calls
+    blockTimeout: float = LAYOUT_BLOCK_TIMEOUT  # Seconds per block
+    maxBlockCalls: int = LAYOUT_MAX_BLOCK_CALLS  # Components are grouped into at most this many HTML calls (0 = no limit)
+
+
+class BatchDetectionRequest(BaseModel):
+    imageUrls: List[HttpUrl]
+    includeLabels: bool = True
+    minConfidence: float = 0.7
+    bypassCache: bool = False
+    workingHeight: Optional[int] = None
+    concurrency: int = DETECT_BATCH_CONCURRENCY  # Screens processed in parallel
 
 
 class BoundingBox(BaseModel):
@@ -54,6 +102,58 @@ class DetectionResponse(BaseModel):
     elements: List[DetectedElement]
     imageWidth: int
     imageHeight: int
+    imageHash: Optional[str] = None  # Key for the /elements/{imageHash} hit-test endpoints
+
+
+class FusedElement(DetectedElement):
+    source: str  # fused (both detectors), uied or llm
+
+
+class FusedDetectionResponse(BaseModel):
+    elements: List[FusedElement]
+    imageWidth: int
+    imageHeight: int
+    imageHash: Optional[str] = None
+    metadata: Dict[str, Any]
+
+
+_warmup_task: Optional[asyncio.Task] = None
+
+
+@app.on_event("startup")
+async def start_warmup():
+    """Warm up in the background so the port opens immediately; /health/ready waits for it"""
+    global _warmup_task
+    readiness = get_readiness()
+    if STARTUP_WARMUP:
+        _warmup_task = asyncio.create_task(readiness.warm_up())
+    else:
+        readiness.state = "ready"
+
+
+@app.on_event("startup")
+async def start_job_workers():
+    """Run queued layout jobs (including ones left over from a previous process)"""
+    get_job_runner().start()
+
+
+@app.on_event("shutdown")
+async def stop_job_workers():
+    """Stop job workers; their running jobs go back to the queue"""
+    await get_job_runner().stop()
+
+
+@app.on_event("shutdown")
+async def shutdown_uied_pool():
+    """Stop UIED worker processes on shutdown"""
+    from uied_pool import shutdown_pool
+    await asyncio.to_thread(shutdown_pool)
+
+
+@app.on_event("shutdown")
+async def close_image_fetcher():
+    """Close pooled HTTP connections on shutdown"""
+    await get_fetcher().aclose()
 
 
 @app.get("/")
@@ -66,6 +166,163 @@ async def root():
     }
 
 
+async def run_detection(
+    image_url: str,
+    include_labels: bool = True,
+    min_confidence: float = 0.7,
+    bypass_cache: bool = False,
+    working_height: Optional[int] = None,
+    image_bytes: Optional[bytes] = None,
+    image_hash: Optional[str] = None
+) -> DetectionResponse:
+    """Download (unless image_bytes is given), detect (or hit the cache) and filter one screenshot"""
+    if working_height is None:
+        working_height = UIED_WORKING_HEIGHT
+
+    if image_bytes is None:
+        # Concurrent requests for the same URL and options share one download and detection
+        result, image_hash = await get_flight("detect_url").do(
+            flight_key(normalize_url(image_url), include_labels, bypass_cache, working_height),
+            lambda: _detect(image_url, include_labels, bypass_cache, working_height)
+        )
+    else:
+        result, image_hash = await _detect(
+            image_url, include_labels, bypass_cache, working_height, image_bytes, image_hash
+        )
+
+    # Filter by confidence
+    filtered_elements = [
+        DetectedElement(**elem)
+        for elem in result['elements']
+        if elem['confidence'] >= min_confidence
+    ]
+
+    return DetectionResponse(
+        elements=filtered_elements,
+        imageWidth=result['imageWidth'],
+        imageHeight=result['imageHeight'],
+        imageHash=image_hash
+    )
+
+
+async def _detect(
+    image_url: str,
+    include_labels: bool,
+    bypass_cache: bool,
+    working_height: int,
+    image_bytes: Optional[bytes] = None,
+    image_hash: Optional[str] = None
+) -> Tuple[dict, str]:
+    """Unfiltered detection result and image hash for one screenshot"""
+    from uied_detector import get_detector
+
+    # Get detector instance
+    detector = get_detector()
+
+    # Download into memory over the shared connection pool
+    if image_bytes is None:
+        image_bytes = await get_fetcher().fetch(image_url)
+    if image_hash is None:
+        with stage("hash"):
+            image_hash = await asyncio.to_thread(content_hash, image_bytes)
+
+    detection_params = {
+        **detector.key_params,
+        "resultVersion": 2,  # 2: results carry geometry; older cached results are not reused
+        "boxOps": box_ops.settings(),
+        "includeLabels": include_labels,
+        "workingHeight": working_height
+    }
+
+    # Repeat detections of the same image are served from the cache
+    cache = get_cache()
+    cache_key = None
+    result = None
+    if cache is not None:
+        cache_key = cache.make_key(image_hash, detection_params)
+        if not bypass_cache:
+            with stage("cache_lookup"):
+                result = await asyncio.to_thread(cache.get, cache_key)
+
+    element_index = get_element_index()
+
+    async def detect_fresh() -> dict:
+        # Decode (downsampled to the working height when configured)
+        with stage("decode"):
+            image, original_size = await asyncio.to_thread(
+                detector.decode_image_scaled, image_bytes, working_height
+            )
+
+        # Run CPU-bound detection on the process pool (or a thread).
+        # "uied" covers queueing for a worker; its inner stages are
+        # compo_detection and postprocess.
+        with stage("uied"):
+            if UIED_EXECUTION_MODE == "process":
+                from uied_pool import get_pool
+                fresh = await get_pool().detect(
+                    image,
+                    include_labels=include_labels,
+                    original_size=original_size
+                )
+            else:
+                fresh = await asyncio.to_thread(
+                    detector.detect_image,
+                    image,
+                    include_labels=include_labels,
+                    original_size=original_size
+                )
+
+        if cache is not None:
+            await asyncio.to_thread(cache.put, cache_key, fresh)
+
+        # Index all elements (before confidence filtering) for hit-test queries
+        with stage("index"):
+            element_index.put(image_hash, "uied", fresh['elements'], fresh['imageWidth'], fresh['imageHeight'])
+        return fresh
+
+    if result is None:
+        # The same image under different URLs (or from /detect/fused) is detected once
+        result = await get_flight("detect_image").do(flight_key(image_hash, detection_params), detect_fresh)
+    elif (image_hash, "uied") not in element_index:
+        with stage("index"):
+            element_index.put(image_hash, "uied", result['elements'], result['imageWidth'], result['imageHeight'])
+
+    return result, image_hash
+
+
+def sse_event(event: str, data: Any) -> str:
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(jsonable_encoder(data))}\n\n"
+
+
+async def sse_response(events: AsyncIterator[Tuple[str, Dict[str, Any]]]) -> StreamingResponse:
+    """
+    Stream (event, data) pairs as text/event-stream
+
+    The first event is awaited before the response starts, so download and
+    setup errors still surface as regular HTTP errors. Failures after that
+    are sent as an `error` event.
+    """
+    first = await events.__anext__()
+
+    async def stream():
+        yield sse_event(*first)
+        try:
+            async for event, data in events:
+                yield sse_event(event, data)
+        except Exception as e:
+            print(f"⚠️  Stream failed: {e}")
+            yield sse_event("error", {"detail": str(e)})
+        finally:
+            await events.aclose()
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @app.post("/detect", response_model=DetectionResponse)
 async def detect_ui_elements(request: DetectionRequest):
     """
@@ -73,58 +330,387 @@ async def detect_ui_elements(request: DetectionRequest):
 
     This endpoint:
     1. Downloads the image from URL
-    2. Runs UIED component detection
+    2. Runs UIED component detection on the worker pool (or serves a cached result)
     3. Optionally extracts text labels with OCR
     4. Converts pixel coordinates to percentages
     5. Returns formatted results
     """
     try:
-        from uied_detector import get_detector
+        return await run_detection(
+            str(request.imageUrl),
+            include_labels=request.includeLabels,
+            min_confidence=request.minConfidence,
+            bypass_cache=request.bypassCache,
+            working_height=request.workingHeight
+        )
 
-        # Get detector instance
-        detector = get_detector()
+    except ImageTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ImportError as e:
+        raise HTTPException(
+            status_code=503,
+            detail=f"UIED not properly installed: {str(e)}"
+        )
+    except Exception as e:
+        import traceback
+        error_detail = f"Detection failed: {str(e)}\n{traceback.format_exc()}"
+        print(error_detail)
+        raise HTTPException(status_code=500, detail=str(e))
 
-        # Run detection with OCR option
-        result = detector.detect(
-            str(request.imageUrl),
-            include_labels=request.includeLabels
+
+@app.post("/detect/batch")
+async def detect_ui_elements_batch(request: BatchDetectionRequest):
+    """
+    Detect UI elements for many screenshots in one request
+
+    Screens are fetched and detected concurrently (bounded by
+    request.concurrency) and each result is streamed as one NDJSON line
+    as soon as it is ready, so lines arrive in completion order:
+
+        {"index": 3, "imageUrl": "...", "result": {...DetectionResponse...}}
+        {"index": 0, "imageUrl": "...", "error": "..."}
+    """
+    if not request.imageUrls:
+        raise HTTPException(status_code=400, detail="imageUrls must not be empty")
+    if len(request.imageUrls) > DETECT_BATCH_MAX_URLS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {DETECT_BATCH_MAX_URLS} imageUrls per batch"
         )
 
-        # Filter by confidence
-        filtered_elements = [
-            DetectedElement(**elem)
-            for elem in result['elements']
-            if elem['confidence'] >= request.minConfidence
+    semaphore = asyncio.Semaphore(max(1, request.concurrency))
+
+    async def detect_one(index: int, image_url: str) -> dict:
+        async with semaphore:
+            line = {"index": index, "imageUrl": image_url}
+            try:
+                result = await run_detection(
+                    image_url,
+                    include_labels=request.includeLabels,
+                    min_confidence=request.minConfidence,
+                    bypass_cache=request.bypassCache,
+                    working_height=request.workingHeight
+                )
+                line["result"] = jsonable_encoder(result)
+            except Exception as e:
+                print(f"⚠️  Batch detection failed for {image_url}: {e}")
+                line["error"] = str(e)
+            return line
+
+    async def stream_results():
+        tasks = [
+            asyncio.create_task(detect_one(index, str(url)))
+            for index, url in enumerate(request.imageUrls)
         ]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield json.dumps(await next_done) + "\n"
+        finally:
+            # Client went away: stop the remaining detections
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+
+@app.post("/detect/fused", response_model=FusedDetectionResponse)
+async def detect_ui_elements_fused(request: DetectionRequest):
+    """
+    Hybrid detection: UIED geometry + GPT-4o-mini labels
+
+    This endpoint:
+    1. Downloads the image once
+    2. Runs UIED (/detect) and the GPT-4o-mini component pass (/detect-components) concurrently
+    3. Matches their boxes through a spatial grid index (IoU / mutual center containment)
+    4. Returns UIED boxes carrying GPT labels and types
+
+    GPT boxes are matched against all UIED geometry, including the untyped
+    boxes /detect leaves out. Confidence: matched 0.8-1.0 (by IoU), GPT only
+    0.7, UIED only 0.5. The default minConfidence (0.7) therefore returns
+    matched and GPT-only elements; lower it to also get UIED-only ones.
+    """
+    try:
+        from screencoder_wrapper import get_generator
+        from fusion_detector import detect_fused
+
+        openai_api_key = os.getenv('OPENAI_API_KEY')
+        if not openai_api_key:
+            raise HTTPException(
+                status_code=503,
+                detail="OPENAI_API_KEY not configured. Fused detection requires OpenAI API access."
+            )
+
+        generator = get_generator(openai_api_key)
+        image_url = str(request.imageUrl)
+
+        async def fused() -> dict:
+            image_bytes = await get_fetcher().fetch(image_url)
+            with stage("hash"):
+                image_hash = await asyncio.to_thread(content_hash, image_bytes)
+
+            async def uied() -> dict:
+                # Unfiltered result: fusion needs the untyped geometry too
+                result, _ = await _detect(
+                    image_url,
+                    request.includeLabels,
+                    request.bypassCache,
+                    UIED_WORKING_HEIGHT if request.workingHeight is None else request.workingHeight,
+                    image_bytes,
+                    image_hash
+                )
+                return result
+
+            result = await detect_fused(
+                uied(),
+                generator.detect_components_fast_async(
+                    image_url,
+                    use_cache=not request.bypassCache,
+                    image_bytes=image_bytes
+                ),
+                min_confidence=request.minConfidence
+            )
+
+            get_element_index().put(
+                image_hash, "fused", result['elements'], result['imageWidth'], result['imageHeight']
+            )
+            result['imageHash'] = image_hash
+            return result
 
-        return DetectionResponse(
-            elements=filtered_elements,
-            imageWidth=result['imageWidth'],
-            imageHeight=result['imageHeight']
+        return await get_flight("detect_fused").do(
+            flight_key(
+                normalize_url(image_url), request.includeLabels, request.minConfidence,
+                request.bypassCache, request.workingHeight
+            ),
+            fused
         )
 
+    except HTTPException:
+        raise
+    except ImageTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except ImportError as e:
         raise HTTPException(
             status_code=503,
-            detail=f"UIED not properly installed: {str(e)}"
+            detail=f"Detector not properly installed: {str(e)}"
         )
     except Exception as e:
         import traceback
-        error_detail = f"Detection failed: {str(e)}\n{traceback.format_exc()}"
+        error_detail = f"Fused detection failed: {str(e)}\n{traceback.format_exc()}"
+        print(error_detail)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def _element_index_or_404(image_hash: str, source: str):
+    index = get_element_index().get(image_hash, source)
+    if index is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"No {source} elements indexed for image {image_hash}; run detection first"
+        )
+    return index
+
+
+def _require_finite(**values: float):
+    """Reject NaN/infinite query coordinates, which no box can match"""
+    for name, value in values.items():
+        if not math.isfinite(value):
+            raise HTTPException(status_code=400, detail=f"{name} must be a finite number")
+
+
+@app.get("/elements/{image_hash}/point")
+async def query_elements_at_point(
+    image_hash: str,
+    x: float,
+    y: float,
+    units: str = "percent",
+    source: str = "uied",
+    minConfidence: float = 0.0
+):
+    """
+    Hit test: elements under a point, innermost first
+
+    image_hash is the imageHash returned by /detect (source=uied) or
+    /detect/fused (source=fused). Coordinates are percentages by default,
+    or pixels with units=px.
+    """
+    _require_finite(x=x, y=y)
+    index = _element_index_or_404(image_hash, source)
+    if units == "percent":
+        x, y = index.to_pixels(x, y)
+    return {"imageHash": image_hash, "source": source, "elements": index.at_point(x, y, minConfidence)}
+
+
+@app.get("/elements/{image_hash}/rect")
+async def query_elements_in_rect(
+    image_hash: str,
+    x: float,
+    y: float,
+    width: float,
+    height: float,
+    mode: str = "intersects",
+    units: str = "percent",
+    source: str = "uied",
+    minConfidence: float = 0.0
+):
+    """
+    Elements intersecting (mode=intersects) or fully inside (mode=contains) a rectangle
+
+    The rectangle is x, y, width, height in percentages by default, or pixels with units=px.
+    """
+    if mode not in ("intersects", "contains"):
+        raise HTTPException(status_code=400, detail="mode must be 'intersects' or 'contains'")
+    _require_finite(x=x, y=y, width=width, height=height)
+    if width < 0 or height < 0:
+        raise HTTPException(status_code=400, detail="width and height must not be negative")
+
+    index = _element_index_or_404(image_hash, source)
+    x1, y1, x2, y2 = x, y, x + width, y + height
+    if units == "percent":
+        x1, y1 = index.to_pixels(x1, y1)
+        x2, y2 = index.to_pixels(x2, y2)
+    return {
+        "imageHash": image_hash,
+        "source": source,
+        "elements": index.in_rect((x1, y1, x2, y2), mode, minConfidence)
+    }
+
+
+@app.get("/elements/index")
+async def element_index_stats():
+    """Number of images with a hit-test index"""
+    return get_element_index().stats()
+
+
+@app.get("/detect/cache")
+async def detection_cache_stats():
+    """Hit/miss counters and tier sizes for the detection result cache"""
+    cache = get_cache()
+    if cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **cache.stats()}
+
+
+@app.get("/llm/cache")
+async def llm_cache_stats():
+    """Hit/miss counters and size of the persistent GPT response cache"""
+    from llm_cache import get_llm_cache
+    cache = get_llm_cache()
+    if cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **await asyncio.to_thread(cache.stats)}
+
+
+@app.get("/llm/scheduler")
+async def llm_scheduler_stats():
+    """Calls in flight, queued calls per priority and rate-limit bucket levels of this process"""
+    from llm_scheduler import get_llm_scheduler
+    return get_llm_scheduler().stats()
+
+
+@app.post("/detect-components")
+async def detect_components(request: DetectionRequest):
+    """
+    Fast component detection for hotspots using ScreenCoder + GPT-4o-mini
+
+    This endpoint:
+    1. Fetches the image into memory (non-blocking)
+    2. Runs a single GPT-4o-mini vision call (non-blocking)
+    3. Parses <bbox> lines into labelled components
+    4. Returns elements with percentage coordinates
+    """
+    try:
+        from screencoder_wrapper import get_generator
+
+        openai_api_key = os.getenv('OPENAI_API_KEY')
+        if not openai_api_key:
+            raise HTTPException(
+                status_code=503,
+                detail="OPENAI_API_KEY not configured. Component detection requires OpenAI API access."
+            )
+
+        generator = get_generator(openai_api_key)
+        image_url = str(request.imageUrl)
+
+        # Concurrent duplicates (retries, several viewers) share one GPT call
+        return await get_flight("detect_components").do(
+            flight_key(normalize_url(image_url), request.bypassCache),
+            lambda: generator.detect_components_fast_async(image_url, use_cache=not request.bypassCache)
+        )
+
+    except HTTPException:
+        raise
+    except ImageTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ImportError as e:
+        raise HTTPException(
+            status_code=503,
+            detail=f"ScreenCoder not properly installed: {str(e)}"
+        )
+    except Exception as e:
+        import traceback
+        error_detail = f"Component detection failed: {str(e)}\n{traceback.format_exc()}"
+        print(error_detail)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/detect-components/stream")
+async def detect_components_stream(request: DetectionRequest):
+    """
+    Streaming component detection (Server-Sent Events)
+
+    Same detection as /detect-components, but GPT-4o-mini output is parsed
+    while it is generated and each component is pushed as soon as its
+    <bbox> line arrives:
+
+        event: start    {imageWidth, imageHeight, model, payload}
+        event: element  {label, x, y, width, height, bbox}   (repeated)
+        event: done     {elements, bboxes, metadata}         (final, de-duplicated)
+        event: error    {detail}
+    """
+    try:
+        from screencoder_wrapper import get_generator
+
+        openai_api_key = os.getenv('OPENAI_API_KEY')
+        if not openai_api_key:
+            raise HTTPException(
+                status_code=503,
+                detail="OPENAI_API_KEY not configured. Component detection requires OpenAI API access."
+            )
+
+        generator = get_generator(openai_api_key)
+
+        return await sse_response(generator.detect_components_stream(
+            str(request.imageUrl),
+            use_cache=not request.bypassCache
+        ))
+
+    except HTTPException:
+        raise
+    except ImageTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ImportError as e:
+        raise HTTPException(
+            status_code=503,
+            detail=f"ScreenCoder not properly installed: {str(e)}"
+        )
+    except Exception as e:
+        import traceback
+        error_detail = f"Component detection failed: {str(e)}\n{traceback.format_exc()}"
         print(error_detail)
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.post("/generate-layout")
-async def generate_layout(request: DetectionRequest):
+async def generate_layout(request: LayoutRequest):
     """
     Generate HTML/CSS layout from a screenshot using ScreenCoder's methodology
     
     This endpoint uses ScreenCoder's actual implementation:
     1. Block Parsing: Identify major layout blocks (header, sidebar, navigation, main content)
-    2. HTML Generation: Generate HTML/CSS for each block using GPT-4 Vision
-    3. Layout Assembly: Combine blocks into complete page structure
-    4. Returns production-ready HTML with Tailwind CSS
+    2. Grouping: Cluster the parsed components into at most maxBlockCalls regions
+    3. HTML Generation: Generate HTML/CSS for each region using GPT-4 Vision (concurrently)
+    4. Layout Assembly: Combine blocks into complete page structure
+    5. Returns production-ready HTML with Tailwind CSS
     """
     try:
         from screencoder_wrapper import get_generator
@@ -140,14 +726,28 @@ async def generate_layout(request: DetectionRequest):
         # Get ScreenCoder generator instance
         generator = get_generator(openai_api_key)
         
-        # Generate layout using ScreenCoder's approach
-        result = generator.generate_layout(
-            str(request.imageUrl),
-            include_full_page=True
+        # Generate layout using ScreenCoder's approach (blocks in parallel);
+        # identical concurrent requests share one generation
+        image_url = str(request.imageUrl)
+        result = await get_flight("generate_layout").do(
+            flight_key(
+                normalize_url(image_url), request.blockConcurrency, request.blockTimeout,
+                request.maxBlockCalls, request.bypassCache
+            ),
+            lambda: generator.generate_layout_async(
+                image_url,
+                include_full_page=True,
+                concurrency=request.blockConcurrency,
+                block_timeout=request.blockTimeout,
+                max_block_calls=request.maxBlockCalls,
+                use_cache=not request.bypassCache
+            )
         )
         
         return result
         
+    except ImageTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except ImportError as e:
         raise HTTPException(
             status_code=503,
@@ -159,47 +759,205 @@ async def generate_layout(request: DetectionRequest):
         print(error_detail)
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/health")
-async def health_check():
-    """Detailed health check with UIED and ScreenCoder availability"""
-    uied_available = False
-    screencoder_available = False
-    openai_configured = bool(os.getenv('OPENAI_API_KEY'))
-    error_message = None
-    
+@app.post("/generate-layout/stream")
+async def generate_layout_stream(request: LayoutRequest):
+    """
+    Streaming layout generation (Server-Sent Events)
+
+    Components are announced while the block-parsing response is still
+    being generated; once it is complete they are grouped into blocks
+    (layout regions) whose HTML is generated concurrently:
+
+        event: start      {imageWidth, imageHeight}
+        event: component  {name, bbox}             (per parsed component)
+        event: block      {name, bbox, members}    (per layout region)
+        event: html       {name, html}             (per finished block)
+        event: done       {html, blocks, bboxes, regions, components, metadata}
+        event: error      {detail}
+    """
     try:
-        # Check if UIED modules can be imported
-        import sys
-        from pathlib import Path
-        UIED_PATH = Path(__file__).parent / "UIED"
-        SCREENCODER_PATH = Path(__file__).parent / "ScreenCoder"
-        
-        if UIED_PATH.exists():
-            sys.path.insert(0, str(UIED_PATH))
-            from detect_compo.ip_region_proposal import compo_detection
-            uied_available = True
-        
-        # Check ScreenCoder
-        if SCREENCODER_PATH.exists():
-            screencoder_available = True
-            
+        from screencoder_wrapper import get_generator
+
+        openai_api_key = os.getenv('OPENAI_API_KEY')
+        if not openai_api_key:
+            raise HTTPException(
+                status_code=503,
+                detail="OPENAI_API_KEY not configured. Layout generation requires OpenAI API access."
+            )
+
+        generator = get_generator(openai_api_key)
+
+        return await sse_response(generator.generate_layout_stream(
+            str(request.imageUrl),
+            concurrency=request.blockConcurrency,
+            block_timeout=request.blockTimeout,
+            max_block_calls=request.maxBlockCalls,
+            use_cache=not request.bypassCache
+        ))
+
+    except HTTPException:
+        raise
+    except ImageTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ImportError as e:
+        raise HTTPException(
+            status_code=503,
+            detail=f"ScreenCoder not properly installed: {str(e)}"
+        )
     except Exception as e:
-        error_message = str(e)
+        import traceback
+        error_detail = f"Layout generation failed: {str(e)}\n{traceback.format_exc()}"
+        print(error_detail)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/jobs/generate-layout", status_code=202)
+async def submit_layout_job(request: LayoutRequest):
+    """
+    Queue layout generation and return immediately
+
+    Poll GET /jobs/{jobId} or follow GET /jobs/{jobId}/events. Jobs are
+    persisted, so they survive restarts and run on whichever server worker
+    picks them up.
+    """
+    if not os.getenv('OPENAI_API_KEY'):
+        raise HTTPException(
+            status_code=503,
+            detail="OPENAI_API_KEY not configured. Layout generation requires OpenAI API access."
+        )
+
+    job_id = await asyncio.to_thread(get_job_store().submit, "generate-layout", {
+        "imageUrl": str(request.imageUrl),
+        "blockConcurrency": request.blockConcurrency,
+        "blockTimeout": request.blockTimeout,
+        "maxBlockCalls": request.maxBlockCalls,
+        "bypassCache": request.bypassCache,
+    })
+    get_job_runner().notify()
+    return {
+        "jobId": job_id,
+        "status": "queued",
+        "statusUrl": f"/jobs/{job_id}",
+        "eventsUrl": f"/jobs/{job_id}/events",
+    }
+
+
+@app.get("/jobs")
+async def job_stats():
+    """Job counts by status"""
+    return {"jobs": await asyncio.to_thread(get_job_store().stats)}
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Job status, blocks finished so far, and the final result once it has succeeded"""
+    job = await asyncio.to_thread(get_job_store().get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job
+
+
+@app.get("/jobs/{job_id}/events")
+async def follow_job(job_id: str, after: int = 0, last_event_id: Optional[int] = Header(None)):
+    """
+    Job progress as Server-Sent Events, replayed from the start (or after `after`)
+
+        event: attempt {attempt}        (a worker started the job; retries replay blocks)
+        event: start   {imageWidth, imageHeight}
+        event: block   {name, bbox}
+        event: html    {name, html}
+        event: done    {html, blocks, bboxes, metadata}
+        event: error   {detail}
+
+    Every event has an `id`, so reconnecting clients (Last-Event-ID) resume
+    where they stopped.
+    """
+    if await asyncio.to_thread(get_job_store().status, job_id) is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+
+    async def stream():
+        async for seq, event, data in job_events(job_id, max(after, last_event_id or 0)):
+            yield f"id: {seq}\n" + sse_event(event, data)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Prometheus scrape endpoint: request/stage latency histograms and in-flight gauges"""
+    return Response(content=render_metrics(), headers={"Content-Type": CONTENT_TYPE_LATEST})
+
+
+def _require_admin(token: Optional[str]):
+    if not profiling_enabled():
+        raise HTTPException(status_code=404, detail="Profiling is disabled (set PROFILING_ADMIN_TOKEN)")
+    if not is_admin(token):
+        raise HTTPException(status_code=403, detail="Invalid X-Admin-Token")
+
+
+@app.get("/debug/profiles")
+async def list_profiles(x_admin_token: Optional[str] = Header(None)):
+    """
+    Saved request profiles, newest first
+
+    Profiles are process-wide: they sample every thread of the server
+    worker while the profiled request runs, so requests served
+    concurrently by that worker show up in them too.
+    """
+    _require_admin(x_admin_token)
+    return {"profiles": await asyncio.to_thread(get_profile_store().list)}
+
+
+@app.get("/debug/profiles/{profile_id}")
+async def get_profile(profile_id: str, x_admin_token: Optional[str] = Header(None)):
+    """
+    One profile as collapsed stacks ("frame;frame;... count" per line)
+
+    The stacks are process-wide (see /debug/profiles). Render with
+    flamegraph.pl, inferno-flamegraph or speedscope.app.
+    """
+    _require_admin(x_admin_token)
+    content = await asyncio.to_thread(get_profile_store().read, profile_id)
+    if content is None:
+        raise HTTPException(status_code=404, detail=f"Profile {profile_id} not found")
+    return Response(content=content, media_type="text/plain")
+
+
+@app.get("/health/live")
+async def liveness():
+    """Liveness probe: the process is up and serving HTTP"""
+    return {"status": "ok"}
+
+
+@app.get("/health/ready")
+async def readiness_check():
+    """Readiness probe: 503 until startup warm-up has finished"""
+    readiness = get_readiness()
+    return JSONResponse(readiness.status(), status_code=200 if readiness.ready else 503)
+
+
+@app.get("/health")
+async def health_check():
+    """Detailed health check with UIED and ScreenCoder availability (probed once per process)"""
+    readiness = get_readiness()
+    capabilities = await readiness.get_capabilities()
     
     return {
-        "status": "healthy" if (uied_available and screencoder_available) else "degraded",
-        "uied_available": uied_available,
-        "screencoder_available": screencoder_available,
-        "openai_configured": openai_configured,
-        "layout_generation_available": screencoder_available and openai_configured,
-        "error": error_message,
+        "status": "healthy" if (capabilities["uied_available"] and capabilities["screencoder_available"]) else "degraded",
+        **capabilities,
+        "ready": readiness.ready,
         "note": "OCR removed - use /generate-layout for text recognition"
     }
 
 
 if __name__ == "__main__":
+    # Development server; production runs `gunicorn main:app -c gunicorn.conf.py`
     import uvicorn
-    port = int(os.getenv("PORT", 5000))
-    uvicorn.run("main:app", host="0.0.0.0", port=port, reload=True)
+    from app_config import HOST, PORT, RELOAD
+    uvicorn.run("main:app", host=HOST, port=PORT, reload=RELOAD)
 
 
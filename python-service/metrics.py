@@ -0,0 +1,178 @@
+"""
+Metrics
+Prometheus instrumentation: per-request and per-stage latency histograms
+and in-flight gauges, labeled by endpoint
+"""
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, Optional
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+from starlette.routing import Match
+
+from app_config import PROMETHEUS_MULTIPROC_DIR
+
+# LLM calls routinely take tens of seconds, so the buckets go well past the defaults
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+REQUEST_SECONDS = Histogram(
+    "uied_request_duration_seconds",
+    "End-to-end request latency (streamed responses until the last byte)",
+    ["endpoint", "method", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "uied_requests_in_flight",
+    "Requests currently being handled",
+    ["endpoint"],
+    multiprocess_mode="livesum",  # Summed over live server workers (see gunicorn.conf.py)
+)
+STAGE_SECONDS = Histogram(
+    "uied_stage_duration_seconds",
+    "Latency of one pipeline stage (download, decode, compo_detection, llm, ...)",
+    ["endpoint", "stage"],
+    buckets=LATENCY_BUCKETS,
+)
+STAGES_IN_FLIGHT = Gauge(
+    "uied_stages_in_flight",
+    "Pipeline stages currently running",
+    ["endpoint", "stage"],
+    multiprocess_mode="livesum",
+)
+SINGLEFLIGHT_CALLS = Counter(
+    "uied_singleflight_calls_total",
+    "Calls to coalesced operations; role=follower calls shared another call's in-flight work",
+    ["flight", "role"],
+)
+LLM_QUEUE_DEPTH = Gauge(
+    "uied_llm_queue_depth",
+    "Model calls waiting in the LLM scheduler",
+    ["priority"],
+    multiprocess_mode="livesum",
+)
+LLM_IN_FLIGHT = Gauge(
+    "uied_llm_in_flight",
+    "Model calls holding an LLM scheduler slot",
+    multiprocess_mode="livesum",
+)
+LLM_QUEUE_WAIT = Histogram(
+    "uied_llm_queue_wait_seconds",
+    "Time a model call waited for a slot and rate-limit budget",
+    ["priority"],
+    buckets=LATENCY_BUCKETS,
+)
+LLM_RETRIES = Counter(
+    "uied_llm_retries_total",
+    "Model calls retried by the LLM scheduler (rate_limit, server_error, timeout, connection)",
+    ["model", "reason"],
+)
+
+# Route template of the request being served ("/detect", "/elements/{image_hash}/point");
+# asyncio tasks and asyncio.to_thread calls inherit it
+current_endpoint: ContextVar[str] = ContextVar("current_endpoint", default="internal")
+
+# Set inside UIED worker processes, whose metrics would otherwise be lost:
+# stage timings are collected here and shipped back with the result
+_collected: ContextVar[Optional[Dict[str, float]]] = ContextVar("collected_stages", default=None)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """
+    Time a block of work as a pipeline stage
+
+    Works in sync code, worker threads and around awaits in coroutines:
+
+        with stage("decode"):
+            image = decode(data)
+    """
+    collected = _collected.get()
+    if collected is not None:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            collected[name] = collected.get(name, 0.0) + time.perf_counter() - start
+        return
+
+    endpoint = current_endpoint.get()
+    in_flight = STAGES_IN_FLIGHT.labels(endpoint, name)
+    in_flight.inc()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.labels(endpoint, name).observe(time.perf_counter() - start)
+        in_flight.dec()
+
+
+@contextmanager
+def collect_stages() -> Iterator[Dict[str, float]]:
+    """Collect stage timings into a dict instead of observing them (for worker processes)"""
+    collected: Dict[str, float] = {}
+    token = _collected.set(collected)
+    try:
+        yield collected
+    finally:
+        _collected.reset(token)
+
+
+def record_stages(timings: Dict[str, float]):
+    """Observe stage timings collected elsewhere (see collect_stages)"""
+    endpoint = current_endpoint.get()
+    for name, seconds in timings.items():
+        STAGE_SECONDS.labels(endpoint, name).observe(seconds)
+
+
+def route_path(scope) -> str:
+    """Route template for a request, keeping label cardinality bounded"""
+    app = scope.get("app")
+    for route in getattr(getattr(app, "router", None), "routes", ()):
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording request latency and tagging stages with their endpoint"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        endpoint = route_path(scope)
+        token = current_endpoint.set(endpoint)
+        status = "500"
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+            await send(message)
+
+        in_flight = REQUESTS_IN_FLIGHT.labels(endpoint)
+        in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            REQUEST_SECONDS.labels(endpoint, scope["method"], status).observe(time.perf_counter() - start)
+            in_flight.dec()
+            current_endpoint.reset(token)
+
+
+def render_metrics() -> bytes:
+    """Current metrics in the Prometheus text exposition format, merged over all server workers"""
+    if PROMETHEUS_MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest()
+
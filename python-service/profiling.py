@@ -0,0 +1,257 @@
+"""
+Request Profiling
+Opt-in sampling profiler for single requests, saved as collapsed stacks
+(flamegraph.pl / speedscope / inferno input)
+"""
+
+import asyncio
+import hmac
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+from starlette.datastructures import Headers, QueryParams
+from starlette.responses import JSONResponse
+
+from app_config import (
+    PROFILING_ADMIN_TOKEN,
+    PROFILE_DIR,
+    PROFILE_MAX_FILES,
+    PROFILE_INTERVAL_MS,
+)
+from metrics import route_path
+
+PROFILE_HEADER = "x-profile"
+TOKEN_HEADER = "x-admin-token"
+
+# Leaf frames of threads that are just waiting for work; sampling them only adds noise
+IDLE_LEAVES = {
+    ("selectors.py", "select"),
+    ("threading.py", "wait"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+    ("connection.py", "_recv"),
+    ("pool.py", "_handle_tasks"),
+}
+
+
+def _frame_label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """
+    Samples the Python stacks of running threads at a fixed interval
+
+    A background thread reads sys._current_frames(), so the profiled code
+    runs unmodified and the overhead is one stack walk per thread per tick.
+    Stacks are counted in collapsed form: "thread;outer;...;leaf".
+    """
+
+    def __init__(self, interval: float = PROFILE_INTERVAL_MS / 1000, thread_ids: Optional[Set[int]] = None):
+        self.interval = max(0.001, interval)
+        self.thread_ids = thread_ids  # None = every thread except the sampler
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> Counter:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self.stacks
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def _sample(self):
+        own = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own or (self.thread_ids is not None and thread_id not in self.thread_ids):
+                continue
+            if (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name) in IDLE_LEAVES:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame.f_code))
+                frame = frame.f_back
+            stack.append(names.get(thread_id, f"thread-{thread_id}"))
+            self.stacks[";".join(reversed(stack))] += 1
+        self.samples += 1
+
+
+class RequestProfile:
+    """Profile of one request: sampled stacks plus stacks reported by UIED workers"""
+
+    def __init__(self, endpoint: str, interval: float = PROFILE_INTERVAL_MS / 1000):
+        self.id = time.strftime("%Y%m%d-%H%M%S") + "-" + uuid.uuid4().hex[:8]
+        self.endpoint = endpoint
+        self.interval = interval
+        self.sampler = SamplingProfiler(interval)
+        self.stacks: Counter = Counter()
+
+    def start(self):
+        self.sampler.start()
+
+    def stop(self) -> Counter:
+        self.stacks.update(self.sampler.stop())
+        return self.stacks
+
+    def add_stacks(self, stacks: Dict[str, int], root: str):
+        """Merge stacks sampled elsewhere (e.g. in a pool worker) under a root frame"""
+        for stack, count in stacks.items():
+            self.stacks[f"{root};{stack}"] += count
+
+
+_active: ContextVar[Optional[RequestProfile]] = ContextVar("active_profile", default=None)
+
+
+def active_profile() -> Optional[RequestProfile]:
+    """The profile of the current request, if it is being profiled"""
+    return _active.get()
+
+
+class ProfileStore:
+    """Collapsed-stack files on disk, newest PROFILE_MAX_FILES kept"""
+
+    def __init__(self, directory: str = PROFILE_DIR, max_files: int = PROFILE_MAX_FILES):
+        self.directory = Path(directory)
+        self.max_files = max(1, max_files)
+        self._lock = threading.Lock()
+
+    def _path(self, profile_id: str) -> Path:
+        return self.directory / f"{profile_id}.collapsed"
+
+    def save(self, profile: RequestProfile):
+        """Write a profile (one "stack count" line per distinct stack) and prune old files"""
+        lines = [f"{stack} {count}" for stack, count in sorted(profile.stacks.items())]
+        with self._lock:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self._path(profile.id).write_text("\n".join(lines) + "\n")
+            # Endpoint and sample count live in a one-line sidecar; the collapsed format has no comments
+            (self.directory / f"{profile.id}.meta").write_text(
+                f"{profile.endpoint}\t{sum(profile.stacks.values())}\n"
+            )
+            for path in sorted(self.directory.glob("*.collapsed"))[:-self.max_files]:
+                path.unlink(missing_ok=True)
+                path.with_suffix(".meta").unlink(missing_ok=True)
+
+    def list(self) -> List[Dict[str, object]]:
+        """Saved profiles, newest first"""
+        profiles = []
+        for path in sorted(self.directory.glob("*.collapsed"), reverse=True):
+            endpoint, samples = "", 0
+            meta = path.with_suffix(".meta")
+            if meta.exists():
+                endpoint, _, count = meta.read_text().strip().partition("\t")
+                samples = int(count or 0)
+            profiles.append({
+                "id": path.stem,
+                "endpoint": endpoint,
+                "samples": samples,
+                "bytes": path.stat().st_size,
+            })
+        return profiles
+
+    def read(self, profile_id: str) -> Optional[str]:
+        # Ids are generated by RequestProfile; anything else (e.g. "../") is rejected
+        if not profile_id.replace("-", "").isalnum():
+            return None
+        path = self._path(profile_id)
+        return path.read_text() if path.exists() else None
+
+
+_store_instance: Optional[ProfileStore] = None
+
+
+def get_profile_store() -> ProfileStore:
+    """Get or create the singleton ProfileStore instance"""
+    global _store_instance
+    if _store_instance is None:
+        _store_instance = ProfileStore()
+    return _store_instance
+
+
+def profiling_enabled() -> bool:
+    return bool(PROFILING_ADMIN_TOKEN)
+
+
+def is_admin(token: Optional[str]) -> bool:
+    """Constant-time check of an X-Admin-Token value"""
+    return profiling_enabled() and token is not None and hmac.compare_digest(
+        token.encode("utf-8"), PROFILING_ADMIN_TOKEN.encode("utf-8")
+    )
+
+
+class ProfilingMiddleware:
+    """
+    Profiles a request when it carries `X-Profile: 1` (or `?profile=1`) and a valid `X-Admin-Token`
+
+    The profile is process-wide: it samples every thread of this worker for
+    the duration of the request. The event loop and to_thread pool are
+    shared by all requests, so concurrent requests appear in it as well.
+
+    One request is profiled at a time; a second profiled request while one
+    is running is served normally with `X-Profile-Skipped: busy`. The profile
+    id is returned in `X-Profile-Id` and the file is saved once the response
+    has been sent.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._busy = threading.Lock()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not profiling_enabled():
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        requested = headers.get(PROFILE_HEADER) == "1" or \
+            QueryParams(scope.get("query_string", b"")).get("profile") == "1"
+        if not requested:
+            await self.app(scope, receive, send)
+            return
+
+        if not is_admin(headers.get(TOKEN_HEADER)):
+            await JSONResponse({"detail": "Profiling requires a valid X-Admin-Token"}, status_code=403)(
+                scope, receive, send
+            )
+            return
+
+        if not self._busy.acquire(blocking=False):
+            await self.app(scope, receive, self._with_header(send, b"x-profile-skipped", b"busy"))
+            return
+
+        profile = RequestProfile(route_path(scope))
+        token = _active.set(profile)
+        profile.start()
+        try:
+            await self.app(scope, receive, self._with_header(send, b"x-profile-id", profile.id.encode()))
+        finally:
+            profile.stop()
+            _active.reset(token)
+            self._busy.release()
+            await asyncio.to_thread(get_profile_store().save, profile)
+            print(f"🔥 Saved profile {profile.id} ({profile.endpoint}, {sum(profile.stacks.values())} samples)")
+
+    @staticmethod
+    def _with_header(send, name: bytes, value: bytes):
+        async def wrapped(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": [*message.get("headers", []), (name, value)]}
+            await send(message)
+        return wrapped
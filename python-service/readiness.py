@@ -0,0 +1,144 @@
+"""
+Startup Warm-up and Readiness
+Loads heavy modules and singletons before the first request and caches the
+capability probes behind /health, so probes cost nothing
+"""
+
+import asyncio
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+from app_config import UIED_EXECUTION_MODE
+from metrics import current_endpoint, stage
+
+SCREENCODER_PATH = Path(__file__).parent / "ScreenCoder"
+
+
+def warmup_image() -> np.ndarray:
+    """Small synthetic screen (a top bar and two buttons) that runs the whole UIED pipeline"""
+    image = np.full((200, 120, 3), 255, dtype=np.uint8)
+    image[0:24, :] = (60, 60, 60)
+    image[70:96, 10:110] = (200, 120, 40)
+    image[120:146, 10:110] = (40, 160, 40)
+    return image
+
+
+def probe_capabilities() -> Dict[str, Any]:
+    """
+    Check which features this process can serve
+
+    Importing uied_detector pulls in OpenCV and UIED (scikit-learn, pandas),
+    so this is slow the first time and should run off the event loop.
+    """
+    from uied_detector import UIED_IMPORTED, UIED_IMPORT_ERROR
+
+    screencoder_available = SCREENCODER_PATH.exists()
+    openai_configured = bool(os.getenv('OPENAI_API_KEY'))
+    return {
+        "uied_available": UIED_IMPORTED,
+        "screencoder_available": screencoder_available,
+        "openai_configured": openai_configured,
+        "layout_generation_available": screencoder_available and openai_configured,
+        "error": UIED_IMPORT_ERROR,
+    }
+
+
+class Readiness:
+    """
+    Warm-up progress and cached capabilities of this process
+
+    The process is live as soon as it serves HTTP; it is ready once warm-up
+    has finished (successfully or not: a failed step is reported, and the
+    features it covers are warmed by the first request instead).
+    """
+
+    def __init__(self):
+        self.state = "cold"  # cold, warming or ready
+        self.capabilities: Optional[Dict[str, Any]] = None
+        self.steps: Dict[str, float] = {}  # Seconds per warm-up step
+        self.errors: Dict[str, str] = {}
+        self.warmup_seconds: Optional[float] = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
+
+    async def get_capabilities(self) -> Dict[str, Any]:
+        """Capability probe results, computed once per process"""
+        if self.capabilities is None:
+            async with self._lock:
+                if self.capabilities is None:
+                    self.capabilities = await asyncio.to_thread(probe_capabilities)
+        return self.capabilities
+
+    async def _step(self, name: str, work):
+        start = time.perf_counter()
+        try:
+            with stage(f"warmup_{name}"):
+                await work()
+        except Exception as e:
+            self.errors[name] = str(e)
+            print(f"⚠️  Warm-up step '{name}' failed: {e}")
+        finally:
+            self.steps[name] = round(time.perf_counter() - start, 3)
+
+    async def _warm_detector(self):
+        """Build the detector and run one tiny detection (allocates OpenCV buffers, fills UIED caches)"""
+        from uied_detector import get_detector
+
+        image = warmup_image()
+        if UIED_EXECUTION_MODE == "process":
+            # One detection per worker, so every worker process is started and warm
+            from uied_pool import get_pool
+            pool = get_pool()
+            await asyncio.gather(*(pool.detect(image, include_labels=False) for _ in range(pool.workers)))
+        else:
+            await asyncio.to_thread(get_detector().detect_image, image, include_labels=False)
+
+    async def _warm_generator(self):
+        """Build the generator (imports the OpenAI SDK and creates its HTTP clients)"""
+        from screencoder_wrapper import get_generator
+        await asyncio.to_thread(get_generator)
+
+    async def warm_up(self):
+        """Probe capabilities and warm every available feature, then mark the process ready"""
+        self.state = "warming"
+        start = time.perf_counter()
+        token = current_endpoint.set("startup")
+        try:
+            await self._step("probe", self.get_capabilities)
+            capabilities = self.capabilities or {}
+            if capabilities.get("uied_available"):
+                await self._step("detector", self._warm_detector)
+            if capabilities.get("layout_generation_available"):
+                await self._step("generator", self._warm_generator)
+        finally:
+            current_endpoint.reset(token)
+            self.warmup_seconds = round(time.perf_counter() - start, 3)
+            self.state = "ready"
+        print(f"✅ Warm-up finished in {self.warmup_seconds:.2f}s ({self.steps})")
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "state": self.state,
+            "warmupSeconds": self.warmup_seconds,
+            "steps": self.steps,
+            "errors": self.errors,
+        }
+
+
+_readiness_instance: Optional[Readiness] = None
+
+
+def get_readiness() -> Readiness:
+    """Get or create the singleton Readiness instance"""
+    global _readiness_instance
+    if _readiness_instance is None:
+        _readiness_instance = Readiness()
+    return _readiness_instance
@@ -6,13 +6,20 @@ Properly integrates ScreenCoder's block parsing + HTML generation approach
 import os
 import sys
 import json
-import tempfile
-import re
+import asyncio
 from pathlib import Path
-from typing import Dict, Any, Optional, List, Tuple
-import requests
-from PIL import Image
-import cv2
+from typing import Dict, Any, Optional, List, Tuple, AsyncIterator
+
+from app_config import LAYOUT_BLOCK_CONCURRENCY, LAYOUT_BLOCK_TIMEOUT, LAYOUT_MAX_BLOCK_CALLS
+from llm_cache import get_llm_cache
+from llm_scheduler import estimate_tokens, get_llm_scheduler
+from image_fetcher import get_fetcher
+from image_encoding import EncodedImage, encode_bytes_for_vision, rescale_bboxes
+from image_context import ImageContext
+from bbox_stream import BBoxStreamParser, parse_bbox_text
+from block_grouping import BlockRegion, group_blocks
+from metrics import stage
+import box_ops
 
 # Add ScreenCoder to path
 SCREENCODER_PATH = Path(__file__).parent / "ScreenCoder"
@@ -20,6 +27,54 @@ if SCREENCODER_PATH.exists() and str(SCREENCODER_PATH) not in sys.path:
     sys.path.insert(0, str(SCREENCODER_PATH))
 
 
+# Component-level detection prompt shared by block parsing and fast detection
+COMPONENT_DETECTION_PROMPT = """You are a UI component analyzer. Analyze this screenshot and identify ALL interactive components and UI elements with TIGHT, PRECISE bounding boxes.
+
+For EACH component you identify, provide:
+1. A specific, descriptive label (e.g., "Sign In button", "Email input", "Logo", "Search icon")
+2. Its TIGHT bounding box coordinates in the format: <bbox>x1 y1 x2 y2</bbox>
+
+Coordinates are in pixels. Image dimensions: {width}x{height} pixels.
+
+Component types to identify:
+- Buttons (with their text/label)
+- Input fields (email, password, search, etc.)
+- Icons and images (logo, profile, menu, etc.)
+- Cards and containers (with descriptive names)
+- Links and navigation items
+- Text headings and labels
+- Tabs and toggles
+
+CRITICAL Rules for ACCURATE bounding boxes:
+- x1,y1 = top-left corner, x2,y2 = bottom-right corner
+- Draw TIGHT boxes - include ONLY the visible element, NO extra padding
+- For buttons: box should cover ONLY the button area (background + text)
+- For inputs: box should cover ONLY the input field border
+- For icons: box should cover ONLY the icon, not surrounding space
+- For text: box should cover ONLY the text itself, not white space
+- Measure pixel positions carefully - accuracy is critical
+- Be SPECIFIC with labels - include text content when visible
+
+Example format (tight boxes):
+Logo image <bbox>20 20 140 75</bbox>
+Search input field <bbox>200 30 490 68</bbox>
+"Sign In" button <bbox>522 32 618 68</bbox>
+Profile icon <bbox>642 32 688 78</bbox>
+
+Now analyze this UI and provide TIGHT, ACCURATE bounding boxes for all components:"""
+
+# ScreenCoder's HTML generation prompt (English version)
+BLOCK_HTML_PROMPT = """This is a screenshot of a {block_name} container.
+Please fill in complete HTML and Tailwind CSS code to accurately reproduce this container.
+Ensure all elements' positions, layout, text, and colors match the original screenshot.
+
+<div>
+your code here
+</div>
+
+Only return the code within the <div> and </div> tags."""
+
+
 class ScreenCoderGenerator:
     """
     Wrapper for ScreenCoder's layout generation
@@ -36,116 +91,216 @@ class ScreenCoderGenerator:
         if not self.openai_api_key:
             raise RuntimeError("OPENAI_API_KEY required for layout generation")
         
-        # Import ScreenCoder encode_image utility
-        try:
-            from utils import encode_image
-            self.encode_image = encode_image
-            print("✅ ScreenCoder utilities imported")
-        except ImportError as e:
-            raise RuntimeError(f"Failed to import ScreenCoder utilities: {e}")
-        
-        # Create GPT client wrapper (simplified version of ScreenCoder's GPT class)
-        from openai import OpenAI
-        self.gpt_client = OpenAI(api_key=self.openai_api_key)
+        # Create GPT client wrapper (simplified version of ScreenCoder's GPT class);
+        # retries are left to the LLM scheduler, which backs off across all calls
+        from openai import OpenAI, AsyncOpenAI
+        self.gpt_client = OpenAI(api_key=self.openai_api_key, max_retries=0)
+        self.async_gpt_client = AsyncOpenAI(api_key=self.openai_api_key, max_retries=0)
         self.gpt_model = "gpt-4o"
         self.fast_model = "gpt-4o-mini"  # For fast component detection
+        
+        # Deterministic generation params (also part of the response cache key)
+        self.vision_params = {"max_tokens": 4096, "temperature": 0, "seed": 42}
+        self.fast_params = {"max_tokens": 2000, "temperature": 0}
     
-    def _call_gpt_vision(self, base64_image: str, prompt: str) -> str:
-        """Call GPT-4 Vision API (ScreenCoder-compatible wrapper)"""
-        content = {
+    def _vision_message(self, image: EncodedImage, prompt: str) -> Dict[str, Any]:
+        """Build a single user message with prompt + image"""
+        return {
             "role": "user",
             "content": [
                 {"type": "text", "text": prompt},
-                {
-                    "type": "image_url",
-                    "image_url": {
-                        "url": f"data:image/png;base64,{base64_image}",
-                    },
-                },
+                {"type": "image_url", "image_url": image.image_url()},
             ],
         }
+    
+    def _chat(
+        self,
+        model: str,
+        messages: List[Dict[str, Any]],
+        params: Dict[str, Any],
+        priority: str,
+        tokens: int
+    ):
+        """Blocking chat completion through the LLM scheduler (from worker threads)"""
+        def request():
+            with stage("llm"):
+                return self.gpt_client.chat.completions.create(model=model, messages=messages, **params)
+        
+        return get_llm_scheduler().call_sync(request, priority, model, tokens)
+    
+    async def _chat_async(
+        self,
+        model: str,
+        messages: List[Dict[str, Any]],
+        params: Dict[str, Any],
+        priority: str,
+        tokens: int
+    ):
+        """Chat completion through the LLM scheduler; queueing is not part of the llm stage"""
+        async def request():
+            with stage("llm"):
+                return await self.async_gpt_client.chat.completions.create(model=model, messages=messages, **params)
+        
+        return await get_llm_scheduler().call(request, priority, model, tokens)
+    
+    def _llm_cache_lookup(
+        self,
+        use_cache: bool,
+        model: str,
+        prompt: str,
+        image: EncodedImage,
+        params: Dict[str, Any]
+    ) -> Tuple[Optional[str], Optional[str]]:
+        """
+        Look up a cached model response
+        
+        Returns (cache_key, cached_response). The key is None when the cache
+        is disabled; with use_cache=False the lookup is skipped but the key is
+        still returned so the fresh response replaces the stored one.
+        """
+        cache = get_llm_cache()
+        if cache is None:
+            return None, None
+        
+        key = cache.make_key(model, prompt, image.base64, {**params, "detail": image.detail})
+        if not use_cache:
+            return key, None
+        
+        cached = cache.get(key)
+        if cached is not None:
+            print(f"💾 LLM cache hit ({model})")
+        return key, cached
+    
+    def _llm_cache_store(self, key: Optional[str], model: str, response: Optional[str]):
+        """Persist a model response under a key from _llm_cache_lookup"""
+        if key is not None and response:
+            get_llm_cache().put(key, model, response)
+    
+    def _call_gpt_vision(self, image: EncodedImage, prompt: str, use_cache: bool = True) -> str:
+        """Call GPT-4 Vision API (ScreenCoder-compatible wrapper)"""
+        key, cached = self._llm_cache_lookup(
+            use_cache, self.gpt_model, prompt, image, self.vision_params
+        )
+        if cached is not None:
+            return cached
+        
+        response = self._chat(
+            self.gpt_model,
+            [self._vision_message(image, prompt)],
+            self.vision_params,
+            "bulk",
+            estimate_tokens(prompt, self.vision_params["max_tokens"], image.vision_tokens())
+        )
         
-        response = self.gpt_client.chat.completions.create(
-            model=self.gpt_model,
-            messages=[content],
-            max_tokens=4096,
-            temperature=0,
-            seed=42,
+        content = response.choices[0].message.content
+        self._llm_cache_store(key, self.gpt_model, content)
+        return content
+    
+    async def _call_gpt_vision_async(self, image: EncodedImage, prompt: str, use_cache: bool = True) -> str:
+        """Call GPT-4 Vision API without blocking the event loop"""
+        key, cached = await asyncio.to_thread(
+            self._llm_cache_lookup,
+            use_cache, self.gpt_model, prompt, image, self.vision_params
+        )
+        if cached is not None:
+            return cached
+        
+        response = await self._chat_async(
+            self.gpt_model,
+            [self._vision_message(image, prompt)],
+            self.vision_params,
+            "bulk",
+            estimate_tokens(prompt, self.vision_params["max_tokens"], image.vision_tokens())
         )
         
-        return response.choices[0].message.content
+        content = response.choices[0].message.content
+        await asyncio.to_thread(self._llm_cache_store, key, self.gpt_model, content)
+        return content
     
-    def _download_image(self, image_url: str, save_path: Path) -> Path:
-        """Download image from URL"""
-        response = requests.get(image_url, stream=True, timeout=30)
-        response.raise_for_status()
+    async def _stream_gpt_vision(
+        self,
+        model: str,
+        image: EncodedImage,
+        prompt: str,
+        params: Dict[str, Any],
+        priority: str,
+        use_cache: bool = True
+    ) -> AsyncIterator[str]:
+        """
+        Yield response text as the model generates it (stream=True)
         
-        with open(save_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                f.write(chunk)
+        A cached response is replayed as a single chunk; a fresh one is
+        cached once the stream completes. The scheduler slot is held until
+        the stream ends.
+        """
+        key, cached = await asyncio.to_thread(
+            self._llm_cache_lookup, use_cache, model, prompt, image, params
+        )
+        if cached is not None:
+            yield cached
+            return
+        
+        def request():
+            return self.async_gpt_client.chat.completions.create(
+                model=model,
+                messages=[self._vision_message(image, prompt)],
+                stream=True,
+                **params
+            )
         
-        return save_path
+        tokens = estimate_tokens(prompt, params["max_tokens"], image.vision_tokens())
+        parts = []
+        async with get_llm_scheduler().stream(request, priority, model, tokens) as stream:
+            # Covers the whole generation (first token to last), like a non-streamed call
+            with stage("llm"):
+                try:
+                    async for chunk in stream:
+                        if not chunk.choices:
+                            continue
+                        delta = chunk.choices[0].delta.content
+                        if delta:
+                            parts.append(delta)
+                            yield delta
+                finally:
+                    # Stop generation if the consumer goes away mid-stream
+                    await stream.response.aclose()
+        
+        await asyncio.to_thread(self._llm_cache_store, key, model, "".join(parts))
+    
+    def _download_image(self, image_url: str) -> bytes:
+        """Download image from URL into memory (shared pooled fetcher)"""
+        return get_fetcher().fetch_sync(image_url)
     
-    def _parse_blocks(self, image_path: str) -> Dict[str, Tuple[int, int, int, int]]:
+    async def _download_image_async(self, image_url: str) -> bytes:
+        """Download image from URL into memory without blocking the event loop"""
+        return await get_fetcher().fetch(image_url)
+    
+    def _parse_blocks(self, context: ImageContext, use_cache: bool = True) -> Dict[str, Tuple[int, int, int, int]]:
         """
         Step 1: Block Parsing
         Use GPT-4 Vision to identify major layout blocks
         """
         print("🔍 Step 1: Parsing layout blocks...")
         
-        # Read image dimensions
-        image = cv2.imread(image_path)
-        if image is None:
-            raise ValueError(f"Failed to load image: {image_path}")
-        h, w = image.shape[:2]
-        
-        # Encode image
-        base64_image = self.encode_image(image_path)
+        # Encode at the size the model actually uses
+        with stage("encode"):
+            encoded = context.encode("detection")
         
-        # Component-level detection prompt (precise bounding boxes)
-        prompt = f"""You are a UI component analyzer. Analyze this screenshot and identify ALL interactive components and UI elements with TIGHT, PRECISE bounding boxes.
-
-For EACH component you identify, provide:
-1. A specific, descriptive label (e.g., "Sign In button", "Email input", "Logo", "Search icon")
-2. Its TIGHT bounding box coordinates in the format: <bbox>x1 y1 x2 y2</bbox>
-
-Coordinates are in pixels. Image dimensions: {w}x{h} pixels.
-
-Component types to identify:
-- Buttons (with their text/label)
-- Input fields (email, password, search, etc.)
-- Icons and images (logo, profile, menu, etc.)
-- Cards and containers (with descriptive names)
-- Links and navigation items
-- Text headings and labels
-- Tabs and toggles
-
-CRITICAL Rules for ACCURATE bounding boxes:
-- x1,y1 = top-left corner, x2,y2 = bottom-right corner
-- Draw TIGHT boxes - include ONLY the visible element, NO extra padding
-- For buttons: box should cover ONLY the button area (background + text)
-- For inputs: box should cover ONLY the input field border
-- For icons: box should cover ONLY the icon, not surrounding space
-- For text: box should cover ONLY the text itself, not white space
-- Measure pixel positions carefully - accuracy is critical
-- Be SPECIFIC with labels - include text content when visible
-
-Example format (tight boxes):
-Logo image <bbox>20 20 140 75</bbox>
-Search input field <bbox>200 30 490 68</bbox>
-"Sign In" button <bbox>522 32 618 68</bbox>
-Profile icon <bbox>642 32 688 78</bbox>
-
-Now analyze this UI and provide TIGHT, ACCURATE bounding boxes for all components:"""
+        # Component-level detection prompt (precise bounding boxes, in sent pixels)
+        prompt = COMPONENT_DETECTION_PROMPT.format(width=encoded.width, height=encoded.height)
         
         # Call GPT-4 Vision
-        response = self._call_gpt_vision(base64_image, prompt)
+        response = self._call_gpt_vision(encoded, prompt, use_cache=use_cache)
         
         # Debug: Print GPT response
         print(f"🤖 GPT Block Parsing Response:\n{response[:500]}")
         
-        # Parse bounding boxes from response
-        bboxes = self._parse_bbox_response(response, w, h)
+        # Parse bounding boxes and map them back to original pixels
+        with stage("parse"):
+            bboxes = rescale_bboxes(
+                self._parse_bbox_response(response, encoded.width, encoded.height),
+                encoded
+            )
         
         print(f"✅ Parsed {len(bboxes)} layout blocks: {list(bboxes.keys())}")
         return bboxes
@@ -158,76 +313,17 @@ Now analyze this UI and provide TIGHT, ACCURATE bounding boxes for all component
     ) -> Dict[str, Tuple[int, int, int, int]]:
         """Parse GPT's bbox response into coordinates"""
         bboxes = {}
-        
-        # Find all <bbox>x1 y1 x2 y2</bbox> patterns
-        pattern = r'<bbox>([\d\s]+)</bbox>'
-        matches = re.findall(pattern, response)
-        
-        # Also extract component names
-        lines = response.strip().split('\n')
-        component_idx = 0
-        
-        for i, line in enumerate(lines):
-            line_original = line.strip()
-            line_lower = line_original.lower()
-            
-            if not line_lower or '<bbox>' not in line_lower:
-                continue
-            
-            # Extract the label (text before <bbox>)
-            bbox_start_idx = line_lower.find('<bbox>')
-            label = line_lower[:bbox_start_idx].strip()
-            
-            # If label is just a dash/bullet (GPT used numbered list format),
-            # look at the previous non-empty line for the actual label
-            if label in ['-', '•', '*', '']:
-                # Look back for the component name
-                for j in range(i - 1, max(-1, i - 3), -1):  # Check up to 2 lines back
-                    prev_line = lines[j].strip()
-                    if prev_line:
-                        # Remove numbering, asterisks, and markdown formatting
-                        clean_label = re.sub(r'^\d+\.\s*', '', prev_line)  # Remove "1. "
-                        clean_label = re.sub(r'^\*+\s*', '', clean_label)  # Remove "** "
-                        clean_label = re.sub(r'\*+$', '', clean_label)  # Remove trailing "**"
-                        clean_label = clean_label.strip('*').strip()
-                        if clean_label:
-                            label = clean_label
-                            break
-            
-            # Skip if still no valid label
-            if not label or label in ['-', '•', '*']:
-                continue
-            
-            # Extract bbox coordinates
-            try:
-                start_idx = line_lower.find('<bbox>') + 6
-                end_idx = line_lower.find('</bbox>')
-                coords_str = line_lower[start_idx:end_idx].strip()
-                
-                coords = list(map(int, coords_str.split()))
-                if len(coords) == 4:
-                    x_min, y_min, x_max, y_max = coords
-                    
-                    # Clamp to image bounds
-                    x_min = max(0, min(x_min, width))
-                    y_min = max(0, min(y_min, height))
-                    x_max = max(0, min(x_max, width))
-                    y_max = max(0, min(y_max, height))
-                    
-                    if x_max > x_min and y_max > y_min:
-                        bboxes[label] = (x_min, y_min, x_max, y_max)
-                        print(f"  - {label}: ({x_min}, {y_min}, {x_max}, {y_max})")
-            except (ValueError, IndexError) as e:
-                print(f"⚠️  Could not parse line '{line_original}': {e}")
-                continue
-        
+        for label, bbox in parse_bbox_text(response, width, height):
+            bboxes[label] = bbox
+            print(f"  - {label}: {bbox}")
         return bboxes
     
     def _generate_block_html(
         self,
-        image_path: str,
+        context: ImageContext,
         block_name: str,
-        bbox: Tuple[int, int, int, int]
+        bbox: Tuple[int, int, int, int],
+        use_cache: bool = True
     ) -> str:
         """
         Step 2: HTML Generation
@@ -235,41 +331,39 @@ Now analyze this UI and provide TIGHT, ACCURATE bounding boxes for all component
         """
         print(f"🎨 Generating HTML for {block_name}...")
         
-        # Crop block from image
-        img = Image.open(image_path)
-        cropped = img.crop(bbox)
-        
-        # Save cropped block temporarily
-        temp_block_path = f"/tmp/block_{block_name.replace(' ', '_')}.png"
-        cropped.save(temp_block_path)
-        
-        # Encode cropped image
-        base64_image = self.encode_image(temp_block_path)
-        
-        # ScreenCoder's HTML generation prompt (English version)
-        prompt = f"""This is a screenshot of a {block_name} container.
-Please fill in complete HTML and Tailwind CSS code to accurately reproduce this container.
-Ensure all elements' positions, layout, text, and colors match the original screenshot.
-
-<div>
-your code here
-</div>
-
-Only return the code within the <div> and </div> tags."""
+        with stage("encode"):
+            encoded = context.encode_crop(bbox, "block")
         
         # Call GPT-4 Vision
-        response = self._call_gpt_vision(base64_image, prompt)
+        response = self._call_gpt_vision(
+            encoded,
+            BLOCK_HTML_PROMPT.format(block_name=block_name),
+            use_cache=use_cache
+        )
         
         # Extract HTML from response
-        html = self._extract_html_from_response(response)
+        return self._extract_html_from_response(response)
+    
+    async def _generate_block_html_async(
+        self,
+        context: ImageContext,
+        block_name: str,
+        bbox: Tuple[int, int, int, int],
+        use_cache: bool = True
+    ) -> str:
+        """Step 2 (async): Generate HTML/CSS for a specific block"""
+        print(f"🎨 Generating HTML for {block_name}...")
         
-        # Clean up temp file
-        try:
-            os.remove(temp_block_path)
-        except:
-            pass
+        with stage("encode"):
+            encoded = await asyncio.to_thread(context.encode_crop, bbox, "block")
         
-        return html
+        response = await self._call_gpt_vision_async(
+            encoded,
+            BLOCK_HTML_PROMPT.format(block_name=block_name),
+            use_cache=use_cache
+        )
+        
+        return self._extract_html_from_response(response)
     
     def _extract_html_from_response(self, response: str) -> str:
         """Extract HTML code from GPT response"""
@@ -289,7 +383,9 @@ Only return the code within the <div> and </div> tags."""
     def generate_layout(
         self,
         image_url: str,
-        include_full_page: bool = True
+        include_full_page: bool = True,
+        max_block_calls: int = LAYOUT_MAX_BLOCK_CALLS,
+        use_cache: bool = True
     ) -> Dict[str, Any]:
         """
         Generate complete HTML layout using ScreenCoder's approach
@@ -297,51 +393,262 @@ Only return the code within the <div> and </div> tags."""
         Args:
             image_url: URL of the screenshot
             include_full_page: Whether to include full HTML page wrapper
+            max_block_calls: Most HTML generation calls (layout regions) for the screenshot
+            use_cache: Whether cached model responses may be reused
+            
+        Returns:
+            dict with html, blocks, metadata
+        """
+        # Download and decode once; blocks are cropped from this context
+        image_bytes = self._download_image(image_url)
+        with stage("decode"):
+            context = ImageContext(image_bytes)
+        
+        # Step 1: Parse layout blocks
+        with stage("block_parsing"):
+            bboxes = self._parse_blocks(context, use_cache=use_cache)
+        
+        if not bboxes:
+            raise RuntimeError("Failed to parse any layout blocks")
+        
+        regions = self._group_blocks(bboxes, context, max_block_calls)
+        
+        # Step 2: Generate HTML for each region
+        block_html = {}
+        for region in regions:
+            try:
+                with stage("block_html"):
+                    html = self._generate_block_html(context, region.description, region.bbox, use_cache=use_cache)
+                block_html[region.name] = html
+            except Exception as e:
+                print(f"Warning: Failed to generate HTML for {region.name}: {e}")
+                block_html[region.name] = self._failed_block_html(region.name)
+        
+        # Step 3: Combine blocks into full HTML
+        return self._layout_result(block_html, regions, bboxes, context.width, context.height)
+    
+    async def generate_layout_async(
+        self,
+        image_url: str,
+        include_full_page: bool = True,
+        concurrency: int = LAYOUT_BLOCK_CONCURRENCY,
+        block_timeout: float = LAYOUT_BLOCK_TIMEOUT,
+        max_block_calls: int = LAYOUT_MAX_BLOCK_CALLS,
+        use_cache: bool = True
+    ) -> Dict[str, Any]:
+        """
+        Generate complete HTML layout, running the per-block GPT calls concurrently
+        
+        Wall-clock time is close to the slowest block instead of the sum of
+        all blocks. Blocks that fail or exceed block_timeout get a placeholder.
+        
+        Args:
+            image_url: URL of the screenshot
+            include_full_page: Whether to include full HTML page wrapper
+            concurrency: Maximum number of block generations in flight
+            block_timeout: Seconds allowed per block before it is abandoned
+            max_block_calls: Most HTML generation calls (layout regions) for the screenshot
+            use_cache: Whether cached model responses may be reused
             
         Returns:
             dict with html, blocks, metadata
         """
-        with tempfile.TemporaryDirectory() as temp_dir:
-            temp_path = Path(temp_dir)
+        image_bytes = await self._download_image_async(image_url)
+        
+        # Decode once; every block is a view into this context
+        with stage("decode"):
+            context = await asyncio.to_thread(ImageContext, image_bytes)
+        
+        # Step 1: Parse layout blocks
+        with stage("block_parsing"):
+            bboxes = await asyncio.to_thread(self._parse_blocks, context, use_cache)
+        
+        if not bboxes:
+            raise RuntimeError("Failed to parse any layout blocks")
+        
+        regions = self._group_blocks(bboxes, context, max_block_calls)
+        
+        # Step 2: Generate HTML for all regions concurrently
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+        
+        print(f"⚡ Generating {len(regions)} blocks (concurrency={concurrency})...")
+        results = await asyncio.gather(*(
+            self._generate_block_bounded(context, semaphore, region.description, region.bbox, block_timeout, use_cache)
+            for region in regions
+        ))
+        
+        # gather preserves order, so blocks keep their reading order
+        block_html = {region.name: html for region, html in zip(regions, results)}
+        
+        # Step 3: Combine blocks into full HTML
+        return self._layout_result(block_html, regions, bboxes, context.width, context.height)
+    
+    def _group_blocks(
+        self,
+        bboxes: Dict[str, Tuple[int, int, int, int]],
+        context: ImageContext,
+        max_block_calls: int
+    ) -> List[BlockRegion]:
+        """Group parsed components into layout regions (one HTML call each)"""
+        with stage("block_grouping"):
+            regions = group_blocks(bboxes, context.width, context.height, max_block_calls)
+        print(f"🧩 Grouped {len(bboxes)} components into {len(regions)} blocks: {[r.name for r in regions]}")
+        return regions
+    
+    async def _generate_block_bounded(
+        self,
+        context: ImageContext,
+        semaphore: asyncio.Semaphore,
+        block_name: str,
+        bbox: Tuple[int, int, int, int],
+        block_timeout: float,
+        use_cache: bool
+    ) -> str:
+        """Generate one block under the request's semaphore; never raises (placeholder on failure)"""
+        async with semaphore:
+            try:
+                with stage("block_html"):
+                    return await asyncio.wait_for(
+                        self._generate_block_html_async(
+                            context, block_name, bbox, use_cache=use_cache
+                        ),
+                        timeout=block_timeout
+                    )
+            except asyncio.TimeoutError:
+                print(f"Warning: HTML generation for {block_name} timed out after {block_timeout}s")
+            except Exception as e:
+                print(f"Warning: Failed to generate HTML for {block_name}: {e}")
+            return self._failed_block_html(block_name)
+    
+    async def generate_layout_stream(
+        self,
+        image_url: str,
+        concurrency: int = LAYOUT_BLOCK_CONCURRENCY,
+        block_timeout: float = LAYOUT_BLOCK_TIMEOUT,
+        max_block_calls: int = LAYOUT_MAX_BLOCK_CALLS,
+        use_cache: bool = True
+    ) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Streaming variant of generate_layout_async
+        
+        Block parsing runs with stream=True and each component is announced
+        as soon as its <bbox> line arrives. Grouping needs the whole parse,
+        so the blocks (regions) and their HTML generation follow it.
+        
+        Yields (event, data) pairs:
+            start      {imageWidth, imageHeight}
+            component  {name, bbox}          - a component was parsed
+            block      {name, bbox, members} - a layout region to generate
+            html       {name, html}          - a block's HTML is ready
+            done       {html, blocks, bboxes, regions, components, metadata} - same as generate_layout_async
+        """
+        image_bytes = await self._download_image_async(image_url)
+        with stage("decode"):
+            context = await asyncio.to_thread(ImageContext, image_bytes)
+        with stage("encode"):
+            encoded = await asyncio.to_thread(context.encode, "detection")
+        prompt = COMPONENT_DETECTION_PROMPT.format(width=encoded.width, height=encoded.height)
+        
+        yield "start", {"imageWidth": context.width, "imageHeight": context.height}
+        
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+        queue: asyncio.Queue = asyncio.Queue()
+        bboxes: Dict[str, Tuple[int, int, int, int]] = {}
+        regions: List[BlockRegion] = []
+        block_html: Dict[str, str] = {}
+        tasks: List[asyncio.Task] = []
+        
+        def on_component(label: str, bbox: Tuple[int, int, int, int]):
+            x1, y1, x2, y2 = encoded.to_original(bbox)
+            if label in bboxes or x2 <= x1 or y2 <= y1:
+                return
+            bboxes[label] = (x1, y1, x2, y2)
+            queue.put_nowait(("component", {"name": label, "bbox": [x1, y1, x2, y2]}))
+        
+        def on_region(region: BlockRegion):
+            queue.put_nowait(("block", region.to_dict()))
             
-            # Download image
-            input_path = temp_path / "screenshot.png"
-            self._download_image(image_url, input_path)
+            task = asyncio.create_task(self._generate_block_bounded(
+                context, semaphore, region.description, region.bbox, block_timeout, use_cache
+            ))
             
-            # Get image dimensions
-            img = Image.open(input_path)
-            width, height = img.size
+            def on_html(done: asyncio.Task, name: str = region.name):
+                if not done.cancelled():
+                    queue.put_nowait(("html", {"name": name, "html": done.result()}))
             
-            # Step 1: Parse layout blocks
-            bboxes = self._parse_blocks(str(input_path))
+            task.add_done_callback(on_html)
+            tasks.append(task)
+        
+        async def parse():
+            parser = BBoxStreamParser(encoded.width, encoded.height)
+            with stage("block_parsing"):
+                async for chunk in self._stream_gpt_vision(
+                    self.gpt_model, encoded, prompt, self.vision_params, "bulk", use_cache
+                ):
+                    for label, bbox in parser.feed(chunk):
+                        on_component(label, bbox)
+                for label, bbox in parser.close():
+                    on_component(label, bbox)
+            
+            regions.extend(self._group_blocks(bboxes, context, max_block_calls))
+            for region in regions:
+                on_region(region)
+        
+        parse_task = asyncio.create_task(parse())
+        parse_task.add_done_callback(lambda t: queue.put_nowait(("parsed", None)))
+        
+        try:
+            parsed = False
+            while not parsed or len(block_html) < len(tasks):
+                event, data = await queue.get()
+                if event == "parsed":
+                    parsed = True
+                    parse_task.result()  # Re-raise parse/model errors
+                    continue
+                if event == "html":
+                    block_html[data["name"]] = data["html"]
+                yield event, data
             
             if not bboxes:
                 raise RuntimeError("Failed to parse any layout blocks")
             
-            # Step 2: Generate HTML for each block
-            block_html = {}
-            for block_name, bbox in bboxes.items():
-                try:
-                    html = self._generate_block_html(str(input_path), block_name, bbox)
-                    block_html[block_name] = html
-                except Exception as e:
-                    print(f"Warning: Failed to generate HTML for {block_name}: {e}")
-                    block_html[block_name] = f"<div><!-- {block_name}: generation failed --></div>"
-            
-            # Step 3: Combine blocks into full HTML
+            ordered_html = {region.name: block_html[region.name] for region in regions}
+            yield "done", self._layout_result(ordered_html, regions, bboxes, context.width, context.height)
+        finally:
+            parse_task.cancel()
+            for task in tasks:
+                task.cancel()
+    
+    def _failed_block_html(self, block_name: str) -> str:
+        """Placeholder HTML for a block whose generation failed"""
+        return f"<div><!-- {block_name}: generation failed --></div>"
+    
+    def _layout_result(
+        self,
+        block_html: Dict[str, str],
+        regions: List[BlockRegion],
+        components: Dict[str, Tuple[int, int, int, int]],
+        width: int,
+        height: int
+    ) -> Dict[str, Any]:
+        """Combine blocks into the full page and build the API response"""
+        with stage("assemble"):
             full_html = self._combine_blocks(block_html, width, height)
-            
-            return {
-                "html": full_html,
-                "blocks": block_html,
-                "bboxes": {name: list(bbox) for name, bbox in bboxes.items()},
-                "metadata": {
-                    "imageWidth": width,
-                    "imageHeight": height,
-                    "method": "ScreenCoder",
-                    "blocks_detected": list(bboxes.keys())
-                }
+        
+        return {
+            "html": full_html,
+            "blocks": block_html,
+            "bboxes": {region.name: list(region.bbox) for region in regions},
+            "regions": {region.name: region.members for region in regions},
+            "components": {name: list(bbox) for name, bbox in components.items()},
+            "metadata": {
+                "imageWidth": width,
+                "imageHeight": height,
+                "method": "ScreenCoder",
+                "blocks_detected": [region.name for region in regions],
+                "components_parsed": len(components)
             }
+        }
     
     def _combine_blocks(
         self,
@@ -396,12 +703,19 @@ Only return the code within the <div> and </div> tags."""
         </aside>
 """
         
-        # Add main content if present
-        if 'main content' in block_html:
+        # Main content, then every other block (grouped sections) in reading order
+        main_blocks = [
+            block_html[name] for name in block_html
+            if name not in ('header', 'navigation', 'sidebar')
+        ]
+        if main_blocks:
+            sections = "\n".join(f"""
+            <section class="w-full">
+                {block}
+            </section>""" for block in main_blocks)
             html += f"""
         <!-- Main Content -->
-        <main class="flex-1">
-            {block_html['main content']}
+        <main class="flex-1">{sections}
         </main>
 """
         
@@ -414,7 +728,8 @@ Only return the code within the <div> and </div> tags."""
     
     def detect_components_fast(
         self,
-        image_url: str
+        image_url: str,
+        use_cache: bool = True
     ) -> Dict[str, Any]:
         """
         Fast component detection optimized for hotspots
@@ -425,112 +740,188 @@ Only return the code within the <div> and </div> tags."""
         
         Args:
             image_url: URL of the screenshot
+            use_cache: Whether a cached model response may be reused
             
         Returns:
             dict with elements, bboxes, metadata
         """
-        with tempfile.TemporaryDirectory() as temp_dir:
-            temp_path = Path(temp_dir)
-            
-            # Download image
-            input_path = temp_path / "screenshot.png"
-            self._download_image(image_url, input_path)
-            
-            # Get image dimensions
-            img = Image.open(input_path)
-            width, height = img.size
-            
-            # Encode image
-            base64_image = self.encode_image(str(input_path))
-            
-            # Single GPT call with GPT-4o-mini
-            prompt = f"""You are a UI component analyzer. Analyze this screenshot and identify ALL interactive components and UI elements with TIGHT, PRECISE bounding boxes.
-
-For EACH component you identify, provide:
-1. A specific, descriptive label (e.g., "Sign In button", "Email input", "Logo", "Search icon")
-2. Its TIGHT bounding box coordinates in the format: <bbox>x1 y1 x2 y2</bbox>
-
-Coordinates are in pixels. Image dimensions: {width}x{height} pixels.
-
-Component types to identify:
-- Buttons (with their text/label)
-- Input fields (email, password, search, etc.)
-- Icons and images (logo, profile, menu, etc.)
-- Cards and containers (with descriptive names)
-- Links and navigation items
-- Text headings and labels
-- Tabs and toggles
-
-CRITICAL Rules for ACCURATE bounding boxes:
-- x1,y1 = top-left corner, x2,y2 = bottom-right corner
-- Draw TIGHT boxes - include ONLY the visible element, NO extra padding
-- For buttons: box should cover ONLY the button area (background + text)
-- For inputs: box should cover ONLY the input field border
-- For icons: box should cover ONLY the icon, not surrounding space
-- For text: box should cover ONLY the text itself, not white space
-- Measure pixel positions carefully - accuracy is critical
-- Be SPECIFIC with labels - include text content when visible
-
-Example format (tight boxes):
-Logo image <bbox>20 20 140 75</bbox>
-Search input field <bbox>200 30 490 68</bbox>
-"Sign In" button <bbox>522 32 618 68</bbox>
-Profile icon <bbox>642 32 688 78</bbox>
-
-Now analyze this UI and provide TIGHT, ACCURATE bounding boxes for all components:"""
-            
+        # Download and encode in memory at the size the model actually uses
+        image_bytes = self._download_image(image_url)
+        with stage("encode"):
+            encoded = encode_bytes_for_vision(image_bytes, "detection")
+        
+        # Single GPT call with GPT-4o-mini
+        prompt = COMPONENT_DETECTION_PROMPT.format(width=encoded.width, height=encoded.height)
+        
+        key, gpt_response = self._llm_cache_lookup(
+            use_cache, self.fast_model, prompt, encoded, self.fast_params
+        )
+        if gpt_response is None:
             # Call GPT-4o-mini (fast and cheap!)
             print(f"🚀 Calling GPT-4o-mini for fast detection...")
-            response = self.gpt_client.chat.completions.create(
-                model=self.fast_model,
-                messages=[
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "text",
-                                "text": prompt
-                            },
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:image/png;base64,{base64_image}"
-                                }
-                            }
-                        ]
-                    }
-                ],
-                max_tokens=2000,
-                temperature=0
+            response = self._chat(
+                self.fast_model,
+                self._fast_detection_messages(prompt, encoded),
+                self.fast_params,
+                "interactive",
+                estimate_tokens(prompt, self.fast_params["max_tokens"], encoded.vision_tokens())
             )
             
             gpt_response = response.choices[0].message.content
+            self._llm_cache_store(key, self.fast_model, gpt_response)
+        
+        return self._build_fast_result(gpt_response, encoded)
+    
+    async def detect_components_fast_async(
+        self,
+        image_url: str,
+        use_cache: bool = True,
+        image_bytes: Optional[bytes] = None
+    ) -> Dict[str, Any]:
+        """
+        Non-blocking variant of detect_components_fast
+        
+        Fetches the image with the shared async fetcher and calls GPT-4o-mini through the
+        AsyncOpenAI client, so the event loop stays free while waiting
+        on the network. The image never touches the disk.
+        
+        Args:
+            image_url: URL of the screenshot
+            use_cache: Whether a cached model response may be reused
+            image_bytes: Already downloaded image (skips the fetch)
+            
+        Returns:
+            dict with elements, bboxes, metadata
+        """
+        if image_bytes is None:
+            image_bytes = await self._download_image_async(image_url)
+        
+        # Resize/re-encode off the event loop
+        with stage("encode"):
+            encoded = await asyncio.to_thread(encode_bytes_for_vision, image_bytes, "detection")
+        prompt = COMPONENT_DETECTION_PROMPT.format(width=encoded.width, height=encoded.height)
+        
+        key, gpt_response = await asyncio.to_thread(
+            self._llm_cache_lookup,
+            use_cache, self.fast_model, prompt, encoded, self.fast_params
+        )
+        if gpt_response is None:
+            print(f"🚀 Calling GPT-4o-mini for fast detection (async)...")
+            response = await self._chat_async(
+                self.fast_model,
+                self._fast_detection_messages(prompt, encoded),
+                self.fast_params,
+                "interactive",
+                estimate_tokens(prompt, self.fast_params["max_tokens"], encoded.vision_tokens())
+            )
+            
+            gpt_response = response.choices[0].message.content
+            await asyncio.to_thread(self._llm_cache_store, key, self.fast_model, gpt_response)
+        
+        return self._build_fast_result(gpt_response, encoded)
+    
+    async def detect_components_stream(
+        self,
+        image_url: str,
+        use_cache: bool = True
+    ) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Streaming variant of detect_components_fast_async
+        
+        GPT-4o-mini is called with stream=True and every <bbox> line is
+        parsed the moment it arrives, so the first component reaches the
+        client at roughly the model's first-token latency.
+        
+        Yields (event, data) pairs:
+            start    {imageWidth, imageHeight, model, payload}
+            element  {label, x, y, width, height, bbox} - percentages + original pixels
+            done     {elements, bboxes, metadata} - same as detect_components_fast_async
+        """
+        image_bytes = await self._download_image_async(image_url)
+        with stage("encode"):
+            encoded = await asyncio.to_thread(encode_bytes_for_vision, image_bytes, "detection")
+        prompt = COMPONENT_DETECTION_PROMPT.format(width=encoded.width, height=encoded.height)
+        width, height = encoded.original_width, encoded.original_height
+        
+        yield "start", {
+            "imageWidth": width,
+            "imageHeight": height,
+            "model": self.fast_model,
+            "payload": encoded.describe()
+        }
+        
+        parser = BBoxStreamParser(encoded.width, encoded.height)
+        suppressor = box_ops.StreamingSuppressor(width, height)
+        
+        def to_elements(found):
+            for label, bbox in found:
+                bbox = encoded.to_original(bbox)
+                if not suppressor.accept(bbox):
+                    continue
+                x, y, w, h = box_ops.to_percent(box_ops.to_array([bbox]), width, height, decimals=4)[0].tolist()
+                yield {"label": label, "x": x, "y": y, "width": w, "height": h, "bbox": list(bbox)}
+        
+        parts = []
+        async for chunk in self._stream_gpt_vision(
+            self.fast_model, encoded, prompt, self.fast_params, "interactive", use_cache
+        ):
+            parts.append(chunk)
+            for element in to_elements(parser.feed(chunk)):
+                yield "element", element
+        for element in to_elements(parser.close()):
+            yield "element", element
+        
+        # Final, fully post-processed result
+        yield "done", self._build_fast_result("".join(parts), encoded)
+    
+    def _fast_detection_messages(self, prompt: str, image: EncodedImage) -> List[Dict[str, Any]]:
+        """Build the chat messages for the fast component detection call"""
+        return [
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": prompt
+                    },
+                    {
+                        "type": "image_url",
+                        "image_url": image.image_url()
+                    }
+                ]
+            }
+        ]
+    
+    def _build_fast_result(
+        self,
+        gpt_response: str,
+        encoded: EncodedImage
+    ) -> Dict[str, Any]:
+        """Parse the fast detection response into elements (percentages of the original image)"""
+        with stage("parse"):
             print(f"🤖 GPT-4o-mini Response:")
             print(gpt_response[:500] + "..." if len(gpt_response) > 500 else gpt_response)
             
-            # Parse bounding boxes
-            bboxes = self._parse_bbox_response(gpt_response, width, height)
+            # Parse bounding boxes (sent pixels) and map them back to original pixels
+            width, height = encoded.original_width, encoded.original_height
+            bboxes = rescale_bboxes(
+                self._parse_bbox_response(gpt_response, encoded.width, encoded.height),
+                encoded
+            )
+            
+            # Drop overlapping/duplicate boxes, then convert to percentages
+            labels = list(bboxes)
+            kept, boxes = box_ops.postprocess(box_ops.to_array(bboxes.values()), width, height)
+            bboxes = {labels[i]: tuple(int(v) for v in box) for i, box in zip(kept, boxes)}
             
             print(f"✅ Detected {len(bboxes)} components (fast mode)")
             
             # Convert to elements format
-            elements = []
-            for idx, (label, bbox) in enumerate(bboxes.items()):
-                x1, y1, x2, y2 = bbox
-                
-                # Convert to percentages
-                x_pct = (x1 / width) * 100
-                y_pct = (y1 / height) * 100
-                width_pct = ((x2 - x1) / width) * 100
-                height_pct = ((y2 - y1) / height) * 100
-                
-                elements.append({
-                    "label": label,
-                    "x": x_pct,
-                    "y": y_pct,
-                    "width": width_pct,
-                    "height": height_pct
-                })
+            percents = box_ops.to_percent(boxes, width, height, decimals=4).tolist()
+            elements = [
+                {"label": label, "x": x, "y": y, "width": w, "height": h}
+                for label, (x, y, w, h) in zip(bboxes, percents)
+            ]
             
             return {
                 "elements": elements,
@@ -540,7 +931,8 @@ Now analyze this UI and provide TIGHT, ACCURATE bounding boxes for all component
                     "imageHeight": height,
                     "method": "ScreenCoder-Fast (GPT-4o-mini)",
                     "components_detected": len(bboxes),
-                    "model": self.fast_model
+                    "model": self.fast_model,
+                    "payload": encoded.describe()
                 }
             }
 
@@ -566,6 +958,14 @@ class ScreenCoderWrapper:
         """Fast component detection"""
         return self.generator.detect_components_fast(image_url)
     
+    async def detect_components_fast_async(self, image_url: str) -> Dict[str, Any]:
+        """Fast component detection (non-blocking)"""
+        return await self.generator.detect_components_fast_async(image_url)
+    
     def generate_layout(self, image_url: str, include_full_page: bool = True) -> Dict[str, Any]:
         """Full layout generation (slower)"""
         return self.generator.generate_layout(image_url, include_full_page)
+    
+    async def generate_layout_async(self, image_url: str, include_full_page: bool = True) -> Dict[str, Any]:
+        """Full layout generation with concurrent block generation"""
+        return await self.generator.generate_layout_async(image_url, include_full_page)
@@ -0,0 +1,85 @@
+"""
+Single-flight Request Coalescing
+Concurrent calls with the same key share one in-flight computation
+"""
+
+import asyncio
+import json
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from metrics import SINGLEFLIGHT_CALLS
+
+T = TypeVar("T")
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def normalize_url(url: str) -> str:
+    """
+    Canonical form of an image URL for coalescing
+
+    Scheme and host are lowercased, default ports and fragments dropped and
+    query parameters sorted, so trivially different spellings of the same
+    URL share a key. Path and query values are kept as-is (they are case
+    sensitive on most storage backends).
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if parts.port is not None and parts.port != DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parts.port}"
+    if parts.username or parts.password:
+        host = f"{parts.username or ''}:{parts.password or ''}@{host}"
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((scheme, host, parts.path or "/", query, ""))
+
+
+def flight_key(*parts: Any) -> str:
+    """Key for an operation and its options (JSON-serializable parts)"""
+    return json.dumps(parts, sort_keys=True, default=str)
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls by key
+
+    The first caller (leader) starts the computation as its own task;
+    callers arriving while it runs (followers) await the same task and get
+    the same result or exception. Nothing is remembered once it finishes;
+    caching is left to the caches. A caller that goes away does not cancel
+    the computation others are waiting for.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._flights: Dict[str, asyncio.Task] = {}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        task = self._flights.get(key)
+        if task is None:
+            SINGLEFLIGHT_CALLS.labels(self.name, "leader").inc()
+            task = asyncio.ensure_future(fn())
+            self._flights[key] = task
+            task.add_done_callback(lambda done: self._finished(key, done))
+        else:
+            SINGLEFLIGHT_CALLS.labels(self.name, "follower").inc()
+        return await asyncio.shield(task)
+
+    def _finished(self, key: str, task: asyncio.Task):
+        if self._flights.get(key) is task:
+            del self._flights[key]
+        # Mark the exception retrieved in case every caller was cancelled
+        if not task.cancelled():
+            task.exception()
+
+
+_flights: Dict[str, SingleFlight] = {}
+
+
+def get_flight(name: str) -> SingleFlight:
+    """Get or create the SingleFlight group for one kind of operation"""
+    flight: Optional[SingleFlight] = _flights.get(name)
+    if flight is None:
+        flight = _flights[name] = SingleFlight(name)
+    return flight
@@ -0,0 +1,120 @@
+"""
+Spatial Index
+Uniform-grid index over element boxes for fast rectangle and point lookups
+"""
+
+import math
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+Box = Tuple[float, float, float, float]
+
+
+class GridIndex:
+    """
+    Buckets boxes into fixed-size grid cells
+
+    A box is registered in every cell it touches, so a query only looks at
+    the boxes sharing a cell with it instead of scanning all of them.
+    Screens are a few thousand pixels across and elements are fairly
+    uniform in size, which makes a flat grid a good fit (no tree rebalancing).
+    """
+
+    def __init__(self, width: int, height: int, cell_size: Optional[float] = None):
+        self.width = width
+        self.height = height
+        # ~32 cells along the long side by default
+        self.cell_size = float(cell_size or max(16.0, max(width, height) / 32))
+        self.boxes: Dict[int, Box] = {}
+        self._cells: Dict[Tuple[int, int], List[int]] = defaultdict(list)
+
+    @classmethod
+    def build(
+        cls,
+        boxes: Iterable[Sequence[float]],
+        width: int,
+        height: int,
+        cell_size: Optional[float] = None
+    ) -> "GridIndex":
+        """Index boxes under their position in the iterable (0, 1, 2, ...)"""
+        index = cls(width, height, cell_size)
+        for item_id, box in enumerate(boxes):
+            index.insert(item_id, box)
+        return index
+
+    def __len__(self) -> int:
+        return len(self.boxes)
+
+    def _cell_range(self, box: Box) -> Tuple[range, range]:
+        # Clamped to the grid, so a huge query box can't sweep millions of empty cells;
+        # boxes poking past the edge live in the border cells
+        x1, x2 = (_clamp(v, self.width) for v in (box[0], box[2]))
+        y1, y2 = (_clamp(v, self.height) for v in (box[1], box[3]))
+        size = self.cell_size
+        return (
+            range(int(math.floor(x1 / size)), int(math.floor(x2 / size)) + 1),
+            range(int(math.floor(y1 / size)), int(math.floor(y2 / size)) + 1),
+        )
+
+    def insert(self, item_id: int, box: Sequence[float]):
+        box = tuple(float(v) for v in box)
+        self.boxes[item_id] = box
+        columns, rows = self._cell_range(box)
+        for column in columns:
+            for row in rows:
+                self._cells[(column, row)].append(item_id)
+
+    def candidates(self, box: Sequence[float]) -> Set[int]:
+        """Ids of boxes sharing at least one grid cell with box (superset of overlaps)"""
+        found: Set[int] = set()
+        columns, rows = self._cell_range(tuple(box))
+        for column in columns:
+            for row in rows:
+                found.update(self._cells.get((column, row), ()))
+        return found
+
+    def query_rect(self, box: Sequence[float]) -> List[int]:
+        """Ids of boxes intersecting box, sorted"""
+        x1, y1, x2, y2 = box
+        return sorted(
+            item_id for item_id in self.candidates(box)
+            if _intersects(self.boxes[item_id], (x1, y1, x2, y2))
+        )
+
+    def query_point(self, x: float, y: float) -> List[int]:
+        """Ids of boxes containing (x, y), smallest first (innermost element first)"""
+        column = int(math.floor(_clamp(x, self.width) / self.cell_size))
+        row = int(math.floor(_clamp(y, self.height) / self.cell_size))
+        hits = [
+            item_id for item_id in self._cells.get((column, row), ())
+            if _contains(self.boxes[item_id], x, y)
+        ]
+        return sorted(hits, key=lambda item_id: (area(self.boxes[item_id]), item_id))
+
+
+def area(box: Box) -> float:
+    return max(0.0, box[2] - box[0]) * max(0.0, box[3] - box[1])
+
+
+def iou(a: Box, b: Box) -> float:
+    ix = max(0.0, min(a[2], b[2]) - max(a[0], b[0]))
+    iy = max(0.0, min(a[3], b[3]) - max(a[1], b[1]))
+    inter = ix * iy
+    union = area(a) + area(b) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def center(box: Box) -> Tuple[float, float]:
+    return (box[0] + box[2]) / 2, (box[1] + box[3]) / 2
+
+
+def _clamp(value: float, upper: float) -> float:
+    return min(max(value, 0.0), float(upper))
+
+
+def _intersects(a: Box, b: Box) -> bool:
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+
+def _contains(box: Box, x: float, y: float) -> bool:
+    return box[0] <= x <= box[2] and box[1] <= y <= box[3]
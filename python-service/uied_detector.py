@@ -1,18 +1,30 @@
 import os
 import sys
+import shutil
+import tempfile
 from pathlib import Path
-import requests
+from typing import List, Optional, Tuple
 from PIL import Image
 from io import BytesIO
 import numpy as np
 import cv2
 import json
 
+from app_config import UIED_IN_MEMORY, CV_THREADS
+from image_fetcher import get_fetcher
+from metrics import stage
+import box_ops
+
+# Keep OpenCV from starting a thread per core in every server worker and pool process
+if CV_THREADS > 0:
+    cv2.setNumThreads(CV_THREADS)
+
 # Add UIED directory to Python path
 UIED_PATH = Path(__file__).parent / "UIED"
 if UIED_PATH.exists() and str(UIED_PATH) not in sys.path:
     sys.path.insert(0, str(UIED_PATH))
 
+UIED_IMPORT_ERROR: Optional[str] = None
 try:
     import detect_compo.ip_region_proposal as ip
     import detect_merge.merge as merge
@@ -21,6 +33,7 @@ try:
 except ImportError as e:
     print(f"Warning: UIED modules could not be imported. Error: {e}")
     UIED_IMPORTED = False
+    UIED_IMPORT_ERROR = str(e)
 
 
 class UIEDDetector:
@@ -49,19 +62,72 @@ class UIEDDetector:
             'merge-line-to-paragraph': False,
             'remove-bar': True
         }
+        # In-memory mode skips UIED's file round-trips entirely
+        self.in_memory = UIED_IN_MEMORY
         self.output_root = Path('/tmp/uied_output')
         self.output_root.mkdir(parents=True, exist_ok=True)
         self._initialized = True
         print("✅ UIEDDetector initialized")
 
-    def _download_image(self, image_url: str, save_path: Path) -> Path:
-        """Download image from URL and save to disk"""
-        response = requests.get(image_url, stream=True, timeout=30)
-        response.raise_for_status()
-        with open(save_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                f.write(chunk)
-        return save_path
+    def download_image(self, image_url: str) -> bytes:
+        """Download image from URL into memory (shared pooled fetcher)"""
+        return get_fetcher().fetch_sync(image_url)
+
+    def decode_image(self, data: bytes) -> np.ndarray:
+        """Decode image bytes into a BGR array (the only decode per request)"""
+        org_img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if org_img is None:
+            raise ValueError("Could not decode image data")
+        return org_img
+
+    def decode_image_scaled(
+        self,
+        data: bytes,
+        working_height: Optional[int]
+    ) -> Tuple[np.ndarray, Tuple[int, int]]:
+        """
+        Decode image bytes downsampled to (at most) working_height
+        
+        JPEGs are reduced during decode (libjpeg's DCT scaling via
+        IMREAD_REDUCED_COLOR_2/4/8) so the full-resolution bitmap is never
+        materialized; other formats are decoded and then resized.
+        
+        Returns:
+            (image array, (original width, original height))
+        """
+        header = Image.open(BytesIO(data))
+        original_size = header.size
+        original_height = original_size[1]
+        
+        if not working_height or working_height >= original_height:
+            return self.decode_image(data), original_size
+        
+        flags = cv2.IMREAD_COLOR
+        if header.format == 'JPEG':
+            for factor, reduced_flag in ((8, cv2.IMREAD_REDUCED_COLOR_8),
+                                         (4, cv2.IMREAD_REDUCED_COLOR_4),
+                                         (2, cv2.IMREAD_REDUCED_COLOR_2)):
+                if original_height / factor >= working_height:
+                    flags = reduced_flag
+                    break
+        
+        img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), flags)
+        if img is None:
+            raise ValueError("Could not decode image data")
+        
+        height, width = img.shape[:2]
+        if height > working_height:
+            target_width = max(1, round(width * working_height / height))
+            img = cv2.resize(img, (target_width, working_height), interpolation=cv2.INTER_AREA)
+        
+        return img, original_size
+
+    def load_image(self, image_url: str) -> np.ndarray:
+        """Download an image and decode it into a BGR array"""
+        print(f"📥 Downloading image from {image_url}")
+        data = self.download_image(image_url)
+        with stage("decode"):
+            return self.decode_image(data)
 
     def _map_element_type(self, uied_class: str, text_content: str) -> str:
         """Map UIED class to our element types"""
@@ -111,135 +177,231 @@ class UIEDDetector:
         if not UIED_IMPORTED:
             raise RuntimeError("UIED is not available.")
 
-        # Create temporary directory for this detection
-        temp_dir = self.output_root / f"temp_{os.getpid()}"
-        temp_dir.mkdir(parents=True, exist_ok=True)
+        return self.detect_image(self.load_image(image_url), include_labels=include_labels)
+
+    def detect_bytes(self, data: bytes, include_labels: bool = True) -> dict:
+        """Detect UI elements from raw (encoded) image bytes"""
+        with stage("decode"):
+            org_img = self.decode_image(data)
+        return self.detect_image(org_img, include_labels=include_labels)
+
+    def detect_image(
+        self,
+        org_img: np.ndarray,
+        include_labels: bool = True,
+        original_size: Optional[Tuple[int, int]] = None
+    ) -> dict:
+        """
+        Detect UI elements from an already decoded BGR image
         
-        try:
-            # Download image with proper extension
-            image_name = Path(image_url).name.split('?')[0] or 'screenshot'
-            # Ensure proper extension for PaddleOCR
-            if not any(image_name.lower().endswith(ext) for ext in ['.jpg', '.jpeg', '.png', '.bmp']):
-                image_name = f"{image_name}.png"
-            input_path = temp_dir / image_name
+        Args:
+            org_img: Image array (height x width x 3, BGR)
+            include_labels: Whether to run OCR for text labels
+            original_size: (width, height) of the source image when org_img
+                is a downsampled copy; boxes are mapped back to this space
             
-            print(f"📥 Downloading image from {image_url}")
-            self._download_image(image_url, input_path)
+        Returns:
+            dict with keys: elements, geometry, imageWidth, imageHeight.
+            geometry holds every post-processed box, including the untyped
+            ones without text that elements leaves out (/detect/fused has
+            GPT label those).
+        """
+        if not UIED_IMPORTED:
+            raise RuntimeError("UIED is not available.")
 
-            # Load image and get dimensions
-            org_img = cv2.imread(str(input_path))
-            if org_img is None:
-                raise ValueError(f"Could not load image from {input_path}")
-            
+        # OCR disabled - PaddleOCR removed for performance
+        # Use GPT-4 Vision in /generate-layout for text recognition
+        if include_labels:
+            print("ℹ️  OCR disabled (use /generate-layout for text recognition)")
+
+        compos = self.detect_compos(org_img, original_size)
+        if original_size is not None:
+            width, height = original_size
+        else:
             height, width = org_img.shape[:2]
-            print(f"📐 Image dimensions: {width}x{height}")
+
+        with stage("postprocess"):
+            elements = self._build_elements(compos, width, height)
+            geometry = self._build_elements(compos, width, height, keep_untyped=True)
+        print(f"✅ Detected {len(elements)} UI elements")
+        
+        return {
+            "elements": elements,
+            "geometry": geometry,
+            "imageWidth": width,
+            "imageHeight": height
+        }
+
+    def detect_compos(
+        self,
+        org_img: np.ndarray,
+        original_size: Optional[Tuple[int, int]] = None
+    ) -> List[dict]:
+        """
+        Run UIED component detection and return raw compos in original pixels
+        
+        Args:
+            org_img: Image array (height x width x 3, BGR), possibly downsampled
+            original_size: (width, height) of the source image when org_img
+                is a downsampled copy
             
-            # OCR disabled - PaddleOCR removed for performance
-            # Use GPT-4 Vision in /generate-layout for text recognition
-            ocr_result_path = None
-            if include_labels:
-                print("ℹ️  OCR disabled (use /generate-layout for text recognition)")
-
-            # Run component detection
-            print("🔍 Running component detection...")
-            # Create IP output directory
-            ip_dir = temp_dir / "ip"
-            ip_dir.mkdir(parents=True, exist_ok=True)
+        Returns:
+            list of compo dicts (column_min, row_min, column_max, row_max, width, height, class)
+        """
+        work_height, work_width = org_img.shape[:2]
+        width, height = original_size or (work_width, work_height)
+        scale_x = width / work_width
+        scale_y = height / work_height
+        print(f"📐 Image dimensions: {width}x{height} (working {work_width}x{work_height})")
+        
+        # Pixel-area thresholds shrink with the working resolution
+        params = self.key_params
+        if scale_x != 1 or scale_y != 1:
+            params = dict(params)
+            params['min-ele-area'] = max(1, int(round(params['min-ele-area'] / (scale_x * scale_y))))
+
+        # Run component detection
+        print("🔍 Running component detection...")
+        with stage("compo_detection"):
+            if self.in_memory:
+                compos = self._detect_compos_in_memory(org_img, params)
+            else:
+                compos = self._detect_compos_on_disk(org_img, params)
+        print(f"✅ Component detection completed: {len(compos)} components")
+
+        if scale_x != 1 or scale_y != 1:
+            compos = self._rescale_compos(compos, scale_x, scale_y)
+        return compos
+
+    def _detect_compos_in_memory(self, org_img: np.ndarray, params: dict) -> List[dict]:
+        """
+        Run the steps of ip.compo_detection directly on an array
+        
+        Same pipeline as UIED's compo_detection (without resizing, drawing
+        or saving), returning the compos in the layout of its JSON output.
+        """
+        min_area = int(params['min-ele-area'])
+
+        grey = cv2.cvtColor(org_img, cv2.COLOR_BGR2GRAY)
+        binary = ip.pre.binarization(org_img, grad_min=int(params['min-grad']))
+
+        ip.det.rm_line(binary, show=False)
+        uicompos = ip.det.component_detection(binary, min_obj_area=min_area)
+
+        uicompos = ip.det.compo_filter(uicompos, min_area=min_area, img_shape=binary.shape)
+        uicompos = ip.det.merge_intersected_compos(uicompos)
+        ip.det.compo_block_recognition(binary, uicompos)
+        if params['merge-contained-ele']:
+            uicompos = ip.det.rm_contained_compos_not_in_block(uicompos)
+        ip.Compo.compos_update(uicompos, org_img.shape)
+        ip.Compo.compos_containment(uicompos)
+
+        uicompos += ip.nesting_inspection(org_img, grey, uicompos, ffl_block=params['ffl-block'])
+        ip.Compo.compos_update(uicompos, org_img.shape)
+
+        compos = []
+        for compo in uicompos:
+            column_min, row_min, column_max, row_max = compo.put_bbox()
+            compos.append({
+                'id': compo.id,
+                'class': compo.category,
+                'column_min': column_min,
+                'row_min': row_min,
+                'column_max': column_max,
+                'row_max': row_max,
+                'width': compo.width,
+                'height': compo.height
+            })
+        return compos
+
+    def _detect_compos_on_disk(self, org_img: np.ndarray, params: dict) -> List[dict]:
+        """Run UIED's file-based compo_detection in a per-request scratch directory"""
+        scratch_dir = Path(tempfile.mkdtemp(prefix="detect_", dir=self.output_root))
+        
+        try:
+            # UIED reads its input from disk
+            input_path = scratch_dir / "screenshot.png"
+            cv2.imwrite(str(input_path), org_img)
+
+            (scratch_dir / "ip").mkdir(parents=True, exist_ok=True)
             ip.compo_detection(
                 str(input_path),
-                str(temp_dir),
-                self.key_params,
+                str(scratch_dir),
+                params,
                 classifier=None,
                 resize_by_height=None,
                 show=False
             )
-            compo_result_path = ip_dir / f"{input_path.stem}.json"
-            print(f"✅ Component detection completed: {compo_result_path}")
+            compo_result_path = scratch_dir / "ip" / f"{input_path.stem}.json"
 
-            # Merge components and OCR results (or use components only if no OCR)
-            merge_dir = temp_dir / "merge"
-            merge_dir.mkdir(parents=True, exist_ok=True)
-            
-            if ocr_result_path and ocr_result_path.exists():
-                print("🔗 Merging components with OCR results...")
-                merge.merge(
-                    str(input_path),
-                    str(compo_result_path),
-                    str(ocr_result_path),
-                    str(merge_dir),
-                    is_remove_bar=self.key_params['remove-bar'],
-                    is_paragraph=self.key_params['merge-line-to-paragraph'],
-                    show=False
-                )
-                merged_json_path = merge_dir / f"{input_path.stem}.json"
-                print(f"✅ Merge completed: {merged_json_path}")
-            else:
-                print("ℹ️  No OCR results, using component detection only...")
-                # Copy component results to merge directory
-                import shutil
-                merged_json_path = merge_dir / f"{input_path.stem}.json"
-                shutil.copy(str(compo_result_path), str(merged_json_path))
-                print(f"✅ Using components only: {merged_json_path}")
-
-            # Load and process the merged JSON
-            with open(merged_json_path, 'r') as f:
-                merged_data = json.load(f)
-
-            elements = []
-            for idx, compo in enumerate(merged_data.get('compos', [])):
-                # Get bounding box in pixels
-                x = compo.get('column_min', 0)
-                y = compo.get('row_min', 0)
-                w = compo.get('width', 0)
-                h = compo.get('height', 0)
-                
-                # Skip invalid bounding boxes
-                if w <= 0 or h <= 0:
-                    continue
-                
-                # Convert pixel coordinates to percentages
-                x_percent = (x / width) * 100
-                y_percent = (y / height) * 100
-                width_percent = (w / width) * 100
-                height_percent = (h / height) * 100
-
-                # Determine element type and label
-                uied_class = compo.get('class', 'other')
-                text_content = compo.get('text_content', '')
-                element_type = self._map_element_type(uied_class, text_content)
-                
-                # Skip non-interactive text elements
-                if element_type == 'other' and not text_content:
-                    continue
-
-                elements.append({
-                    'type': element_type,
-                    'label': text_content,
-                    'description': f"Detected {element_type}",
-                    'boundingBox': {
-                        'x': round(x_percent, 2),
-                        'y': round(y_percent, 2),
-                        'width': round(width_percent, 2),
-                        'height': round(height_percent, 2)
-                    },
-                    'confidence': 1.0,  # UIED doesn't provide per-element confidence
-                    'is_ai_generated': True,
-                    'order_index': idx
-                })
-            
-            print(f"✅ Detected {len(elements)} UI elements")
-            
-            return {
-                "elements": elements,
-                "imageWidth": width,
-                "imageHeight": height
-            }
+            with open(compo_result_path, 'r') as f:
+                return json.load(f).get('compos', [])
             
         finally:
             # Clean up temporary files
-            import shutil
-            if temp_dir.exists():
-                shutil.rmtree(temp_dir, ignore_errors=True)
+            shutil.rmtree(scratch_dir, ignore_errors=True)
+
+    def _rescale_compos(self, compos: List[dict], scale_x: float, scale_y: float) -> List[dict]:
+        """Map compo pixel boxes from the working resolution back to the original image"""
+        rescaled = []
+        for compo in compos:
+            compo = dict(compo)
+            column_min = int(round(compo.get('column_min', 0) * scale_x))
+            row_min = int(round(compo.get('row_min', 0) * scale_y))
+            column_max = int(round(compo.get('column_max', 0) * scale_x))
+            row_max = int(round(compo.get('row_max', 0) * scale_y))
+            compo.update({
+                'column_min': column_min,
+                'row_min': row_min,
+                'column_max': column_max,
+                'row_max': row_max,
+                'width': int(round(compo.get('width', 0) * scale_x)),
+                'height': int(round(compo.get('height', 0) * scale_y))
+            })
+            rescaled.append(compo)
+        return rescaled
+
+    def _build_elements(
+        self,
+        compos: List[dict],
+        width: int,
+        height: int,
+        keep_untyped: bool = False
+    ) -> List[dict]:
+        """Convert UIED compos (pixels) into API elements (percentages)"""
+        # Determine element types; skip non-interactive text elements
+        candidates = []
+        for idx, compo in enumerate(compos):
+            text_content = compo.get('text_content', '')
+            element_type = self._map_element_type(compo.get('class', 'other'), text_content)
+            if element_type == 'other' and not text_content and not keep_untyped:
+                continue
+            candidates.append((idx, element_type, text_content))
+
+        if not candidates:
+            return []
+
+        # Drop invalid/redundant boxes and convert to percentages in one pass
+        boxes = box_ops.compos_to_array([compos[idx] for idx, _, _ in candidates])
+        valid = np.flatnonzero(
+            (boxes[:, 2] - boxes[:, 0] > 0) & (boxes[:, 3] - boxes[:, 1] > 0)
+        )
+        kept, boxes = box_ops.postprocess(boxes[valid], width, height)
+        percents = box_ops.to_percent(boxes, width, height).tolist()
+
+        elements = []
+        for candidate, (x, y, w, h) in zip(valid[kept], percents):
+            idx, element_type, text_content = candidates[candidate]
+            elements.append({
+                'type': element_type,
+                'label': text_content,
+                'description': f"Detected {element_type}",
+                'boundingBox': {'x': x, 'y': y, 'width': w, 'height': h},
+                'confidence': 1.0,  # UIED doesn't provide per-element confidence
+                'is_ai_generated': True,
+                'order_index': idx
+            })
+        return elements
 
 
 # Singleton instance getter
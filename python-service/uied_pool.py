@@ -0,0 +1,298 @@
+"""
+UIED Process Pool
+Runs CPU-bound UIED detection in worker processes so the API event loop stays responsive
+"""
+
+import asyncio
+import gc
+import itertools
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from multiprocessing import shared_memory
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from app_config import UIED_POOL_WORKERS, UIED_POOL_MAX_TASKS, UIED_POOL_START_METHOD, UIED_TASK_TIMEOUT
+from metrics import collect_stages, record_stages
+from profiling import SamplingProfiler, active_profile
+
+
+# How often a waiting detection checks on the worker running it
+WATCH_INTERVAL = 0.5
+
+# A worker that exits right after its last task (recycling) may still have its
+# result in flight; only a task unresolved this long after its worker is gone failed
+DEAD_WORKER_GRACE = 2.0
+
+# Set in each worker: where it announces the tasks it starts
+_started_queue = None
+
+
+def _init_worker(started_queue):
+    """Build the detector singleton once per worker process"""
+    global _started_queue
+    _started_queue = started_queue
+
+    # Signals sent to the whole process group (Ctrl-C, `timeout`) must not kill
+    # workers mid-task; the parent stops them in order through shutdown()
+    os.setpgid(0, 0)
+
+    from uied_detector import get_detector
+    get_detector()
+
+
+def _close_shared(shm: shared_memory.SharedMemory):
+    """Close a shared memory handle, collecting stray array views first"""
+    try:
+        shm.close()
+    except BufferError:
+        gc.collect()
+        shm.close()
+
+
+def _detect_shared(
+    task_id: int,
+    shm_name: str,
+    shape: Tuple[int, ...],
+    dtype: str,
+    include_labels: bool,
+    original_size: Optional[Tuple[int, int]] = None,
+    profile_interval: Optional[float] = None
+) -> Tuple[dict, Dict[str, float], Optional[Dict[str, int]]]:
+    """
+    Worker entry point: run detection on an image living in shared memory
+
+    Returns the result with the worker's stage timings, which the parent
+    process records (metrics observed in a worker would never be scraped),
+    and, when profile_interval is set, the stacks sampled while detecting.
+    The parent is told which process picked the task up before it starts.
+    """
+    from uied_detector import get_detector
+
+    _started_queue.put((task_id, os.getpid()))
+
+    profiler = None
+    if profile_interval:
+        profiler = SamplingProfiler(profile_interval, thread_ids={threading.get_ident()})
+        profiler.start()
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        image = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+        with collect_stages() as timings:
+            result = get_detector().detect_image(
+                image,
+                include_labels=include_labels,
+                original_size=original_size
+            )
+        del image
+        stacks = dict(profiler.stop()) if profiler is not None else None
+        return result, timings, stacks
+    finally:
+        if profiler is not None:
+            profiler.stop()
+        _close_shared(shm)
+
+
+class UIEDProcessPool:
+    """
+    Managed process pool for UIEDDetector
+
+    - Configurable worker count
+    - Workers are recycled after max_tasks_per_child detections
+    - Each worker announces the task it starts, so a detection whose worker
+      dies (OOM kill, segfault in OpenCV) fails instead of hanging, and one
+      running longer than task_timeout (time spent queued does not count)
+      has its worker killed. The pool replaces that worker; detections on
+      other workers carry on.
+    - Image arrays are handed to workers through shared memory (no pickling)
+    """
+
+    def __init__(
+        self,
+        workers: int = UIED_POOL_WORKERS,
+        max_tasks_per_child: int = UIED_POOL_MAX_TASKS,
+        start_method: str = UIED_POOL_START_METHOD,
+        task_timeout: float = UIED_TASK_TIMEOUT
+    ):
+        self.workers = max(1, workers)
+        self.max_tasks_per_child = max_tasks_per_child if max_tasks_per_child > 0 else None
+        self.start_method = start_method
+        self.task_timeout = task_timeout if task_timeout > 0 else None
+        self._pool = None
+        self._started_queue = None
+        self._task_ids = itertools.count()
+        self._started: Dict[int, Tuple[int, float]] = {}  # task id -> (worker pid, start time)
+        self._pending = set()  # Ids of detections not yet finished
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+
+    def _ensure_pool(self):
+        """Start the worker processes on first use"""
+        with self._lock:
+            if self._pool is None:
+                context = multiprocessing.get_context(self.start_method)
+                self._started_queue = context.SimpleQueue()
+                self._pool = context.Pool(
+                    processes=self.workers,
+                    initializer=_init_worker,
+                    initargs=(self._started_queue,),
+                    maxtasksperchild=self.max_tasks_per_child
+                )
+                threading.Thread(
+                    target=self._read_started, args=(self._started_queue,),
+                    name="uied-pool-started", daemon=True
+                ).start()
+                print(f"✅ UIED process pool started ({self.workers} workers, "
+                      f"recycle after {self.max_tasks_per_child} tasks)")
+            return self._pool
+
+    def _read_started(self, started_queue):
+        """Record when and where each task starts, as workers announce them"""
+        while True:
+            message = started_queue.get()
+            if message is None:
+                return
+            task_id, pid = message
+            with self._lock:
+                if task_id in self._pending:
+                    self._started[task_id] = (pid, time.monotonic())
+
+    def _task_done(self, task_id: int):
+        with self._lock:
+            self._started.pop(task_id, None)
+            self._pending.discard(task_id)
+            self._idle.notify_all()
+
+    async def _watch(self, task_id: int, future: asyncio.Future):
+        """Wait for a task, failing it if its worker dies or it runs past task_timeout"""
+        gone_since = None
+        while True:
+            done, _ = await asyncio.wait({future}, timeout=WATCH_INTERVAL)
+            if done:
+                return future.result()
+            started = self._started.get(task_id)
+            if started is None:
+                continue  # Still queued
+            pid, since = started
+            now = time.monotonic()
+            if not _process_alive(pid):
+                gone_since = gone_since or now
+                if now - gone_since >= DEAD_WORKER_GRACE:
+                    raise RuntimeError(f"UIED worker process {pid} died during detection")
+            elif self.task_timeout is not None and now - since > self.task_timeout:
+                # Only this task's worker is stopped; the pool starts a replacement
+                _kill(pid)
+                raise RuntimeError(f"UIED detection did not finish within {self.task_timeout}s")
+
+    async def detect(
+        self,
+        image: np.ndarray,
+        include_labels: bool = True,
+        original_size: Optional[Tuple[int, int]] = None
+    ) -> dict:
+        """
+        Run UIEDDetector.detect_image on a worker process
+
+        Args:
+            image: Decoded BGR image array
+            include_labels: Whether to run OCR for text labels
+            original_size: (width, height) to map boxes back to when image is downsampled
+
+        Returns:
+            dict with keys: elements, imageWidth, imageHeight
+        """
+        pool = self._ensure_pool()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        task_id = next(self._task_ids)
+
+        def _resolve(value):
+            if not future.done():
+                future.set_result(value)
+
+        def _reject(error):
+            if not future.done():
+                future.set_exception(error)
+
+        # A profiled request also samples the worker it lands on
+        profile = active_profile()
+        profile_interval = profile.interval if profile is not None else None
+
+        image = np.ascontiguousarray(image)
+        shm = shared_memory.SharedMemory(create=True, size=max(1, image.nbytes))
+        with self._lock:
+            self._pending.add(task_id)
+        try:
+            shared = np.ndarray(image.shape, dtype=image.dtype, buffer=shm.buf)
+            shared[...] = image
+            del shared
+
+            pool.apply_async(
+                _detect_shared,
+                (task_id, shm.name, image.shape, image.dtype.str, include_labels, original_size, profile_interval),
+                callback=lambda value: loop.call_soon_threadsafe(_resolve, value),
+                error_callback=lambda error: loop.call_soon_threadsafe(_reject, error)
+            )
+            result, timings, stacks = await self._watch(task_id, future)
+            record_stages(timings)
+            if stacks:
+                profile.add_stacks(stacks, "uied-worker")
+            return result
+        finally:
+            self._task_done(task_id)
+            _close_shared(shm)
+            shm.unlink()
+
+    def shutdown(self):
+        """Stop accepting work and wait for in-flight detections to finish"""
+        with self._lock:
+            pool, self._pool = self._pool, None
+            if pool is None:
+                return
+            pool.close()
+            # Pool.join() would wait forever for a task whose worker was killed,
+            # so wait on our own count of detections and then stop the workers
+            self._idle.wait_for(lambda: not self._pending)
+        pool.terminate()
+        pool.join()
+        self._started_queue.put(None)
+        print("🛑 UIED process pool stopped")
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _kill(pid: int):
+    try:
+        os.kill(pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+_pool_instance: Optional[UIEDProcessPool] = None
+
+
+def get_pool() -> UIEDProcessPool:
+    """Get or create the singleton UIEDProcessPool instance"""
+    global _pool_instance
+    if _pool_instance is None:
+        _pool_instance = UIEDProcessPool()
+    return _pool_instance
+
+
+def shutdown_pool():
+    """Shut down the singleton pool if it was started"""
+    if _pool_instance is not None:
+        _pool_instance.shutdown()